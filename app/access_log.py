@@ -0,0 +1,203 @@
+"""Модуль структурированного журнала запросов.
+
+Запись журнала собирается в ASGI-middleware как словарь и через ``QueueHandler``
+передаётся в фоновый поток, который форматирует её в JSON и пишет в поток вывода,
+поэтому event loop не занимается ни форматированием, ни вводом-выводом.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ACCESS_LOG_SAMPLE_RATE: float = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1.0"))
+ACCESS_LOG_SLOW_MS: float = float(os.getenv("ACCESS_LOG_SLOW_MS", "500"))
+ACCESS_LOG_QUEUE_SIZE: int = int(os.getenv("ACCESS_LOG_QUEUE_SIZE", "10000"))
+
+access_logger: logging.Logger = logging.getLogger("app.access")
+access_logger.setLevel(logging.INFO)
+access_logger.propagate = False
+
+db_time: ContextVar[Optional[list]] = ContextVar("db_time", default=None)
+
+
+class _NonFormattingQueueHandler(QueueHandler):
+    """QueueHandler, который не форматирует запись в вызывающем потоке."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Возвращает запись без изменений: форматирование выполняет поток-слушатель.
+
+        :param record: Запись журнала.
+        :return: Та же запись.
+        """
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Кладёт запись в очередь, отбрасывая её при переполнении вместо блокировки event loop.
+
+        :param record: Запись журнала.
+        """
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись журнала запросов в одну строку JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Преобразует запись в строку JSON.
+
+        :param record: Запись журнала, в ``msg`` которой лежит словарь полей.
+        :return: Строка JSON.
+        """
+        payload: Dict[str, Any] = {"time": record.created, "level": record.levelname}
+        if isinstance(record.msg, dict):
+            payload.update(record.msg)
+        else:
+            payload["message"] = record.getMessage()
+        return json.dumps(payload, ensure_ascii=False)
+
+
+_log_queue: queue.Queue = queue.Queue(ACCESS_LOG_QUEUE_SIZE)
+_stream_handler: logging.Handler = logging.StreamHandler(sys.stdout)
+_stream_handler.setFormatter(JsonFormatter())
+_listener: QueueListener = QueueListener(_log_queue, _stream_handler, respect_handler_level=True)
+access_logger.addHandler(_NonFormattingQueueHandler(_log_queue))
+
+
+def start_access_log() -> None:
+    """Запускает фоновый поток, который пишет журнал запросов."""
+    if _listener._thread is None:
+        _listener.start()
+
+
+def stop_access_log() -> None:
+    """Дописывает накопленные записи и останавливает фоновый поток."""
+    if _listener._thread is not None:
+        _listener.stop()
+
+
+def track_db_time(sync_engine: Engine) -> None:
+    """
+    Подписывается на события движка, чтобы суммировать время SQL-запросов текущего HTTP-запроса.
+
+    :param sync_engine: Синхронный движок SQLAlchemy (``AsyncEngine.sync_engine``).
+    """
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def add_query_time(conn) -> None:
+        started: float = conn.info["query_start"].pop()
+        accumulator: Optional[list] = db_time.get()
+        if accumulator is not None:
+            accumulator[0] += time.perf_counter() - started
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        add_query_time(conn)
+
+    # Для запроса, завершившегося ошибкой, after_cursor_execute не вызывается.
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            add_query_time(conn)
+
+
+class AccessLogMiddleware:
+    """
+    ASGI-middleware структурированного журнала запросов.
+
+    Пишет метод, шаблон маршрута, статус, длительность и время в базе данных.
+    Успешные запросы пишутся с вероятностью ``sample_rate``, ошибки (статус >= 400)
+    и медленные запросы (дольше ``slow_ms``) пишутся всегда.
+
+    :param app: Оборачиваемое ASGI-приложение.
+    :param sample_rate: Доля успешных запросов, попадающих в журнал.
+    :param slow_ms: Порог медленного запроса в миллисекундах.
+    """
+
+    def __init__(self, app, sample_rate: float = ACCESS_LOG_SAMPLE_RATE, slow_ms: float = ACCESS_LOG_SLOW_MS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self._route_paths: Dict[Any, str] = {}
+
+    async def __call__(self, scope, receive, send) -> None:
+        """
+        Обрабатывает ASGI-вызов и пишет запись о запросе.
+
+        :param scope: ASGI scope.
+        :param receive: ASGI receive.
+        :param send: ASGI send.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started: float = time.perf_counter()
+        status_code: int = 500
+        accumulator: list = [0.0]
+        token = db_time.set(accumulator)
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            db_time.reset(token)
+            duration_ms: float = (time.perf_counter() - started) * 1000
+            always_logged: bool = status_code >= 400 or duration_ms >= self.slow_ms
+            if always_logged or random.random() < self.sample_rate:  # noqa: S311 выборка, не криптография
+                access_logger.info({
+                    "method": scope["method"],
+                    "route": self._route_path(scope),
+                    "status": status_code,
+                    "duration_ms": round(duration_ms, 3),
+                    "db_ms": round(accumulator[0] * 1000, 3),
+                })
+
+    def _route_path(self, scope) -> str:
+        """
+        Возвращает шаблон маршрута (``/api/tweets/{tweet_id}``) вместо конкретного пути.
+
+        :param scope: ASGI scope после обработки запроса роутером.
+        :return: Шаблон маршрута или путь запроса, если маршрут не найден.
+        """
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return scope["path"]
+
+        route_path: Optional[str] = self._route_paths.get(endpoint)
+        if route_path is None:
+            route_path = next(
+                (
+                    route.path for route in scope["app"].routes
+                    if getattr(route, "endpoint", None) is endpoint or getattr(route, "app", None) is endpoint
+                ),
+                None,
+            )
+            if route_path is None:
+                return scope["path"]
+            self._route_paths[endpoint] = route_path
+        return route_path
@@ -0,0 +1,356 @@
+"""Модуль массовой загрузки и выгрузки данных через Postgres COPY.
+
+Таблицы ``users``, ``medias``, ``tweets``, ``followers``, ``likes``, ``notifications`` и ``notification_actors``
+выгружаются в файлы ``<таблица>.csv`` или ``<таблица>.ndjson`` и загружаются из них потоково,
+без ORM: CSV передаётся командой ``COPY`` как есть, строки NDJSON читаются пачками и отправляются
+через ``copy_records_to_table``. Память не зависит от объёма данных.
+
+При загрузке индексы таблиц (кроме индексов первичных ключей и ограничений) удаляются
+и строятся заново после ``COPY``, а последовательности (``tweet_id_seq`` и другие)
+сдвигаются за максимальный загруженный id. Вся загрузка выполняется в одной транзакции.
+
+Служебные таблицы не переносятся: журнал изменений ``tweet_changes`` и его граница
+``tweet_changes_horizon`` (клиенты после загрузки синхронизируются заново), очередь ``jobs``,
+ключи идемпотентности ``idempotency_keys`` и незавершённые загрузки ``media_uploads``.
+``--truncate`` очищает только набор таблиц, замкнутый по внешним ключам: таблицы, ссылающиеся
+на очищаемые, должны входить в ``--tables``.
+
+Запуск:
+``python -m app.bulk export <каталог> [--format csv|ndjson] [--tables users,tweets]``,
+``python -m app.bulk import <каталог> [--format csv|ndjson] [--tables ...] [--truncate]``.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import asyncpg
+from sqlalchemy import DateTime
+from sqlalchemy import Sequence as SequenceDefault
+from sqlalchemy import Table
+
+from app import models  # noqa: F401 регистрирует таблицы в metadata
+from app.database import metadata
+from app.invalidation import asyncpg_dsn
+
+# Порядок важен: таблица загружается после таблиц, на которые ссылаются её внешние ключи.
+BULK_TABLES: Tuple[str, ...] = (
+    "users", "medias", "tweets", "followers", "likes", "notifications", "notification_actors",
+)
+BULK_FORMATS: Tuple[str, ...] = ("csv", "ndjson")
+BULK_BATCH_SIZE: int = int(os.getenv("BULK_BATCH_SIZE", "10000"))
+BULK_MAINTENANCE_WORK_MEM: str = os.getenv("BULK_MAINTENANCE_WORK_MEM", "256MB")
+
+# Индексы таблицы, кроме тех, что обслуживают ограничения (первичный ключ и т.п.).
+DEFERRABLE_INDEXES_QUERY: str = (
+    "SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x "
+    "JOIN pg_class i ON i.oid = x.indexrelid "
+    "JOIN pg_class t ON t.oid = x.indrelid "
+    "JOIN pg_namespace n ON n.oid = t.relnamespace "
+    "WHERE n.nspname = current_schema() AND t.relname = $1 "
+    "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)"
+)
+TIMESTAMP_FRACTION_RE: re.Pattern = re.compile(r"\.(\d{1,6})")
+
+
+def referencing_tables(table_names: Sequence[str]) -> List[str]:
+    """
+    Возвращает таблицы вне ``table_names``, которые ссылаются на них внешними ключами, в том числе через другие таблицы.
+
+    ``metadata.sorted_tables`` упорядочены по зависимостям, поэтому хватает одного прохода.
+
+    :param table_names: Имена таблиц.
+    :return: Имена ссылающихся таблиц.
+    """
+    closure: set = set(table_names)
+    for table in metadata.sorted_tables:
+        if any(foreign_key.column.table.name in closure for foreign_key in table.foreign_keys):
+            closure.add(table.name)
+    return [table.name for table in metadata.sorted_tables if table.name in closure.difference(table_names)]
+
+
+def bulk_file(directory: str, table_name: str, file_format: str) -> str:
+    """
+    Возвращает путь к файлу таблицы.
+
+    :param directory: Каталог выгрузки.
+    :param table_name: Имя таблицы.
+    :param file_format: Формат: ``csv`` или ``ndjson``.
+    :return: Путь к файлу.
+    """
+    return os.path.join(directory, f"{table_name}.{file_format}")
+
+
+def copied_rows(status: str) -> int:
+    """
+    Извлекает количество строк из статуса команды ``COPY``.
+
+    :param status: Статус вида ``COPY 42``.
+    :return: Количество строк.
+    """
+    return int(status.split()[-1])
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """
+    Разбирает время в формате ``row_to_json`` (дробная часть секунд может быть короче 6 цифр).
+
+    :param value: Время в ISO 8601.
+    :return: Время или None.
+    """
+    if value is None:
+        return None
+    return datetime.fromisoformat(TIMESTAMP_FRACTION_RE.sub(lambda match: "." + match.group(1).ljust(6, "0"), value))
+
+
+def column_converters(table: Table) -> List[Callable[[Any], Any]]:
+    """
+    Возвращает функции преобразования значений JSON в типы колонок для двоичного ``COPY``.
+
+    :param table: Таблица.
+    :return: Функции в порядке колонок таблицы.
+    """
+    return [
+        parse_timestamp if isinstance(column.type, DateTime) else (lambda value: value)
+        for column in table.columns
+    ]
+
+
+async def export_table(connection: asyncpg.Connection, table: Table, path: str, file_format: str) -> int:
+    """
+    Выгружает таблицу в файл.
+
+    :param connection: Соединение asyncpg.
+    :param table: Таблица.
+    :param path: Путь к файлу.
+    :param file_format: Формат: ``csv`` или ``ndjson``.
+    :return: Количество выгруженных строк.
+    """
+    columns: List[str] = [column.name for column in table.columns]
+
+    if file_format == "csv":
+        # COPY таблицы не работает с секционированными таблицами, COPY запроса - работает.
+        status: str = await connection.copy_from_query(
+            f"SELECT {', '.join(columns)} FROM {table.name}", output=path, format="csv", header=True,
+        )
+    else:
+        # JSON не содержит управляющих символов (row_to_json их экранирует), поэтому CSV
+        # с разделителем и кавычкой \x01/\x02 отдаёт документы без кавычек и экранирования.
+        status = await connection.copy_from_query(
+            f"SELECT row_to_json(row)::text FROM (SELECT {', '.join(columns)} FROM {table.name}) row",
+            output=path,
+            format="csv",
+            delimiter="\x02",
+            quote="\x01",
+        )
+
+    return copied_rows(status)
+
+
+async def ndjson_records(path: str, table: Table, batch_size: int) -> AsyncIterator[Tuple[Any, ...]]:
+    """
+    Читает строки NDJSON пачками в отдельном потоке и отдаёт записи для ``copy_records_to_table``.
+
+    :param path: Путь к файлу.
+    :param table: Таблица.
+    :param batch_size: Сколько строк читать за раз.
+    :return: Асинхронный итератор записей в порядке колонок таблицы.
+    """
+    columns: List[str] = [column.name for column in table.columns]
+    converters: List[Callable[[Any], Any]] = column_converters(table)
+
+    with open(path, encoding="utf-8") as file:
+        while True:
+            lines: List[str] = await asyncio.to_thread(list, itertools.islice(file, batch_size))
+            if not lines:
+                return
+            for line in lines:
+                if line.strip():
+                    document: Dict[str, Any] = json.loads(line)
+                    yield tuple(convert(document.get(name)) for name, convert in zip(columns, converters))
+
+
+async def import_table(
+    connection: asyncpg.Connection,
+    table: Table,
+    path: str,
+    file_format: str,
+    batch_size: int = BULK_BATCH_SIZE,
+) -> int:
+    """
+    Загружает таблицу из файла.
+
+    :param connection: Соединение asyncpg.
+    :param table: Таблица.
+    :param path: Путь к файлу.
+    :param file_format: Формат: ``csv`` или ``ndjson``.
+    :param batch_size: Сколько строк NDJSON читать за раз.
+    :return: Количество загруженных строк.
+    """
+    columns: List[str] = [column.name for column in table.columns]
+
+    if file_format == "csv":
+        status: str = await connection.copy_to_table(
+            table.name, source=path, columns=columns, format="csv", header=True,
+        )
+    else:
+        status = await connection.copy_records_to_table(
+            table.name, records=ndjson_records(path, table, batch_size), columns=columns,
+        )
+
+    return copied_rows(status)
+
+
+async def drop_indexes(connection: asyncpg.Connection, table_name: str) -> List[str]:
+    """
+    Удаляет индексы таблицы, не обслуживающие ограничения.
+
+    :param connection: Соединение asyncpg.
+    :param table_name: Имя таблицы.
+    :return: Команды ``CREATE INDEX`` для восстановления удалённых индексов.
+    """
+    definitions: List[str] = []
+
+    for index_name, definition in await connection.fetch(DEFERRABLE_INDEXES_QUERY, table_name):
+        await connection.execute(f'DROP INDEX "{index_name}"')
+        # Индекс секционированной таблицы описан как ON ONLY: такой индекс не строится на секциях.
+        definitions.append(definition.replace(" ON ONLY ", " ON ", 1))
+
+    return definitions
+
+
+async def reset_sequences(connection: asyncpg.Connection, table: Table) -> None:
+    """
+    Сдвигает последовательности таблицы за максимальный id, чтобы новые строки не конфликтовали с загруженными.
+
+    :param connection: Соединение asyncpg.
+    :param table: Таблица.
+    """
+    for column in table.columns:
+        if isinstance(column.default, SequenceDefault):
+            await connection.execute(
+                f"SELECT setval('{column.default.name}', "
+                f"COALESCE((SELECT max({column.name}) FROM {table.name}), 0) + 1, false)",
+            )
+
+
+async def export_tables(
+    directory: str,
+    file_format: str = "csv",
+    table_names: Sequence[str] = BULK_TABLES,
+    dsn: Optional[str] = None,
+) -> Dict[str, int]:
+    """
+    Выгружает таблицы в каталог из одного согласованного снимка базы данных.
+
+    :param directory: Каталог выгрузки.
+    :param file_format: Формат: ``csv`` или ``ndjson``.
+    :param table_names: Имена таблиц.
+    :param dsn: Строка подключения asyncpg (по умолчанию - из DATABASE_URL).
+    :return: Словарь имя таблицы -> количество выгруженных строк.
+    """
+    os.makedirs(directory, exist_ok=True)
+    connection: asyncpg.Connection = await asyncpg.connect(dsn or asyncpg_dsn())
+    exported: Dict[str, int] = {}
+
+    try:
+        async with connection.transaction(isolation="repeatable_read", readonly=True):
+            for table_name in table_names:
+                table: Table = metadata.tables[table_name]
+                exported[table_name] = await export_table(
+                    connection, table, bulk_file(directory, table_name, file_format), file_format,
+                )
+    finally:
+        await connection.close()
+
+    return exported
+
+
+async def import_tables(
+    directory: str,
+    file_format: str = "csv",
+    table_names: Sequence[str] = BULK_TABLES,
+    truncate: bool = False,
+    dsn: Optional[str] = None,
+    batch_size: int = BULK_BATCH_SIZE,
+) -> Dict[str, int]:
+    """
+    Загружает таблицы из каталога в одной транзакции с отложенным построением индексов.
+
+    :param directory: Каталог выгрузки.
+    :param file_format: Формат: ``csv`` или ``ndjson``.
+    :param table_names: Имена таблиц.
+    :param truncate: Очистить таблицы перед загрузкой.
+    :param dsn: Строка подключения asyncpg (по умолчанию - из DATABASE_URL).
+    :param batch_size: Сколько строк NDJSON читать за раз.
+    :return: Словарь имя таблицы -> количество загруженных строк.
+    :raises ValueError: Если с ``truncate`` не указаны таблицы, ссылающиеся на очищаемые.
+    """
+    missing: List[str] = referencing_tables(table_names) if truncate else []
+    if missing:
+        raise ValueError(f"--truncate also requires the referencing tables: {', '.join(missing)}")
+
+    tables: List[Table] = [metadata.tables[name] for name in BULK_TABLES if name in table_names]
+    connection: asyncpg.Connection = await asyncpg.connect(dsn or asyncpg_dsn())
+    imported: Dict[str, int] = {}
+
+    try:
+        async with connection.transaction():
+            await connection.execute(f"SET LOCAL maintenance_work_mem = '{BULK_MAINTENANCE_WORK_MEM}'")
+            if truncate:
+                await connection.execute(f"TRUNCATE {', '.join(table.name for table in tables)}")
+
+            index_definitions: List[str] = []
+            for table in tables:
+                index_definitions.extend(await drop_indexes(connection, table.name))
+
+            for table in tables:
+                imported[table.name] = await import_table(
+                    connection, table, bulk_file(directory, table.name, file_format), file_format, batch_size,
+                )
+
+            for definition in index_definitions:
+                await connection.execute(definition)
+            for table in tables:
+                await reset_sequences(connection, table)
+                await connection.execute(f"ANALYZE {table.name}")
+    finally:
+        await connection.close()
+
+    return imported
+
+
+def main() -> None:
+    """Точка входа командной строки."""
+    parser = argparse.ArgumentParser(description="Массовая загрузка и выгрузка таблиц через COPY.")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("directory")
+    parser.add_argument("--format", choices=BULK_FORMATS, default="csv")
+    parser.add_argument("--tables", default=",".join(BULK_TABLES))
+    parser.add_argument("--truncate", action="store_true", help="очистить таблицы перед загрузкой")
+    args = parser.parse_args()
+
+    table_names: List[str] = [name.strip() for name in args.tables.split(",") if name.strip()]
+    unknown: List[str] = [name for name in table_names if name not in BULK_TABLES]
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(unknown)}")
+    missing: List[str] = referencing_tables(table_names) if args.command == "import" and args.truncate else []
+    if missing:
+        parser.error(f"--truncate also requires the referencing tables: {', '.join(missing)}")
+
+    if args.command == "export":
+        counts: Dict[str, int] = asyncio.run(export_tables(args.directory, args.format, table_names))
+    else:
+        counts = asyncio.run(import_tables(args.directory, args.format, table_names, truncate=args.truncate))
+
+    for table_name, rows in counts.items():
+        print(f"{table_name}: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
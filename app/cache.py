@@ -0,0 +1,114 @@
+"""Модуль кэшей в памяти процесса.
+
+Кэши включаются переменной окружения ``CACHE_ENABLED``. Когда воркеров несколько,
+устаревшие записи удаляются по сообщениям шины инвалидации (``app.invalidation``);
+пока шина не подключена к базе данных, кэши не отдают и не запоминают значения.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "false").lower() == "true"
+CACHE_TTL_SECONDS: float = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+_MISSING: object = object()
+
+
+class LocalCache:
+    """
+    LRU-кэш с ограниченным временем жизни записей.
+
+    :param name: Имя кэша, по которому к нему адресуются сообщения инвалидации.
+    :param max_entries: Максимальное количество записей.
+    :param ttl: Время жизни записи в секундах.
+    """
+
+    def __init__(self, name: str, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled: bool = CACHE_ENABLED
+        self.active: bool = False
+        self.generation: int = 0
+        self._entries: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Возвращает значение из кэша.
+
+        :param key: Ключ.
+        :param default: Значение, если ключа нет или запись устарела.
+        :return: Значение из кэша или ``default``.
+        """
+        if not (self.enabled and self.active):
+            return default
+
+        entry: Optional[Tuple[float, Any]] = self._entries.get(key)
+        if entry is None:
+            return default
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return default
+
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """
+        Запоминает значение.
+
+        Если передано поколение, прочитанное до загрузки значения из базы данных,
+        а с тех пор была инвалидация, значение могло устареть и не запоминается.
+
+        :param key: Ключ.
+        :param value: Значение.
+        :param generation: Поколение кэша на момент начала загрузки значения.
+        """
+        if not (self.enabled and self.active):
+            return
+        if generation is not None and generation != self.generation:
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[Hashable]) -> None:
+        """
+        Удаляет записи.
+
+        :param keys: Ключи удаляемых записей.
+        """
+        self.generation += 1
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Удаляет все записи."""
+        self.generation += 1
+        self._entries.clear()
+
+
+auth_cache: LocalCache = LocalCache("auth", ttl=60)
+profile_cache: LocalCache = LocalCache("profile")
+media_cache: LocalCache = LocalCache("media")
+
+caches: Dict[str, LocalCache] = {cache.name: cache for cache in (auth_cache, profile_cache, media_cache)}
+
+
+def set_caches_active(active: bool) -> None:
+    """
+    Включает или приостанавливает все кэши, очищая их.
+
+    Шина инвалидации приостанавливает кэши, пока не подключена, и очищает их после
+    переподключения, потому что сообщения за время разрыва могли потеряться.
+
+    :param active: True - кэши работают, False - приостановлены.
+    """
+    for cache in caches.values():
+        cache.clear()
+        cache.active = active
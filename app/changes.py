@@ -0,0 +1,244 @@
+"""Модуль журнала изменений твитов для синхронизации ленты.
+
+Создание и удаление твита, изменение его лайков и подписки пользователя пишутся в
+таблицу ``tweet_changes`` в транзакции самого изменения вместе с идентификатором
+транзакции ``txid``. Клиент хранит водяной знак - ``xmin`` снимка базы данных при
+прошлой синхронизации: все транзакции с меньшим txid к тому моменту завершились,
+поэтому записи, зафиксированные позже, всегда имеют txid не меньше знака и не теряются,
+даже если транзакции фиксируются не в порядке своих id. Записи на границе знака могут
+прийти повторно; изменения описывают состояние, поэтому повтор безопасен.
+
+Чтение - диапазонный запрос по индексу ``(user_id, txid)`` для каждого автора, на которого
+подписан пользователь: стоимость опроса зависит от числа подписок и изменений, а не от
+размера журнала или ленты.
+
+Записи старше ``CHANGES_RETENTION_SECONDS`` удаляются пачками (``run_periodically``), а граница
+удалённого сохраняется в ``tweet_changes_horizon``: клиент с водяным знаком меньше границы
+получает ``reset``.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi.logger import logger
+from sqlalchemy import delete, func, select, true, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from app import utils
+from app.database import async_session
+from app.metrics import metrics
+from app.models import Follower, Tweet, TweetChange, TweetChangesHorizon
+
+# Больше изменений клиенту проще загрузить ленту заново.
+CHANGES_MAX_ROWS: int = int(os.getenv("CHANGES_MAX_ROWS", "1000"))
+CHANGES_RETENTION_SECONDS: float = float(os.getenv("CHANGES_RETENTION_SECONDS", str(7 * 24 * 60 * 60)))
+CHANGES_PURGE_INTERVAL_SECONDS: float = float(os.getenv("CHANGES_PURGE_INTERVAL_SECONDS", str(60 * 60)))
+CHANGES_PURGE_BATCH_SIZE: int = int(os.getenv("CHANGES_PURGE_BATCH_SIZE", "1000"))
+CHANGES_PURGE_BATCH_PAUSE: float = float(os.getenv("CHANGES_PURGE_BATCH_PAUSE", "0.1"))
+
+
+async def record_change(session: AsyncSession, user_id: int, kind: str, tweet_id: Optional[int] = None) -> None:
+    """
+    Добавляет запись в журнал изменений в транзакции сессии.
+
+    :param session: Сессия с открытой транзакцией.
+    :param user_id: Автор твита, а для ``feed`` - пользователь, чья лента изменилась целиком.
+    :param kind: Вид изменения: ``created``, ``deleted``, ``likes`` или ``feed``.
+    :param tweet_id: Идентификатор твита.
+    """
+    session.add(TweetChange(user_id=user_id, kind=kind, tweet_id=tweet_id))
+    await session.flush()
+
+
+def watermark_query() -> Select:
+    """
+    Запрос водяного знака и границы журнала.
+
+    Водяной знак - txid самой старой транзакции, незавершённой на момент снимка. Граница -
+    txid, ниже которого записи журнала удалены (0, если ничего не удалялось).
+
+    :return: Запрос SQLAlchemy.
+    """
+    return select(
+        func.txid_snapshot_xmin(func.txid_current_snapshot()),
+        func.coalesce(select(func.max(TweetChangesHorizon.txid)).scalar_subquery(), 0),
+    )
+
+
+def changes_query(user_id: int, since: int, limit: int) -> Select:
+    """
+    Запрос изменений ленты пользователя с водяного знака: твиты авторов, на которых он
+    подписан, и изменения его подписок.
+
+    Изменения каждого автора читаются отдельным диапазоном индекса ``(user_id, txid)``
+    (LATERAL по подпискам), не больше ``limit`` на автора: если у одного автора их больше,
+    больше и общий результат, и клиент всё равно получит ``reset``.
+
+    :param user_id: ID пользователя.
+    :param since: Водяной знак прошлой синхронизации.
+    :param limit: Максимальное количество записей.
+    :return: Запрос SQLAlchemy.
+    """
+    author_changes = (
+        select(TweetChange.id, TweetChange.kind, TweetChange.tweet_id).
+        where(TweetChange.user_id == Follower.followed_id, TweetChange.txid >= since, TweetChange.kind != "feed").
+        order_by(TweetChange.txid).
+        limit(limit).
+        lateral("author_changes")
+    )
+    feed_changes = union_all(
+        select(author_changes).
+        select_from(Follower).
+        join(author_changes, true()).
+        where(Follower.follower_id == user_id),
+        select(TweetChange.id, TweetChange.kind, TweetChange.tweet_id).
+        where(TweetChange.user_id == user_id, TweetChange.txid >= since, TweetChange.kind == "feed").
+        limit(1),
+    ).subquery("feed_changes")
+    return (
+        select(feed_changes.c.kind, feed_changes.c.tweet_id).
+        order_by(feed_changes.c.id).
+        limit(limit)
+    )
+
+
+async def purge_changes(
+    retention_seconds: float = CHANGES_RETENTION_SECONDS,
+    batch_size: int = CHANGES_PURGE_BATCH_SIZE,
+    pause: float = CHANGES_PURGE_BATCH_PAUSE,
+) -> int:
+    """
+    Удаляет записи журнала изменений старше срока хранения.
+
+    Граница - txid первой записи, добавленной позже срока хранения (или водяной знак, если
+    таких нет). Она сохраняется до удаления, поэтому клиент, которому нужны удаляемые записи,
+    получает ``reset``, а не пропускает изменения. Записи удаляются пачками в порядке id.
+
+    :param retention_seconds: Сколько секунд хранятся записи.
+    :param batch_size: Сколько записей удалять одной транзакцией.
+    :param pause: Пауза между пачками в секундах.
+    :return: Сколько записей удалено.
+    """
+    cutoff: datetime = datetime.now(timezone.utc) - timedelta(seconds=retention_seconds)
+    started: float = time.monotonic()
+
+    async with async_session() as session:
+        async with session.begin():
+            horizon: int = await session.scalar(select(func.coalesce(
+                select(TweetChange.txid).
+                where(TweetChange.created_at >= cutoff).
+                order_by(TweetChange.id).
+                limit(1).
+                scalar_subquery(),
+                func.txid_snapshot_xmin(func.txid_current_snapshot()),
+            )))
+            await session.execute(insert(TweetChangesHorizon).values(txid=horizon).on_conflict_do_nothing())
+            await session.execute(delete(TweetChangesHorizon).where(TweetChangesHorizon.txid < horizon))
+
+    deleted: int = 0
+    while True:
+        async with async_session() as session:
+            async with session.begin():
+                batch_ids = (
+                    select(TweetChange.id).
+                    where(TweetChange.txid < horizon).
+                    order_by(TweetChange.id).
+                    limit(batch_size).
+                    scalar_subquery()
+                )
+                result = await session.execute(
+                    delete(TweetChange).where(TweetChange.id.in_(batch_ids)).execution_options(
+                        synchronize_session=False,
+                    ),
+                )
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            break
+        await asyncio.sleep(pause)
+
+    metrics.inc("changes.purged", deleted)
+    logger.info("Purged %d feed changes below txid %d in %.1f s", deleted, horizon, time.monotonic() - started)
+    return deleted
+
+
+async def run_periodically(interval: float = CHANGES_PURGE_INTERVAL_SECONDS) -> None:
+    """
+    Удаляет старые записи журнала каждые ``interval`` секунд. Ошибки пишутся в лог и не останавливают цикл.
+
+    :param interval: Интервал между проходами в секундах.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await purge_changes()
+        except Exception:
+            logger.exception("Feed changes purge failed")
+
+
+async def get_changes(session: AsyncSession, user_id: int, since: Optional[int]) -> Dict[str, Any]:
+    """
+    Собирает изменения ленты пользователя с водяного знака.
+
+    Без водяного знака, со знаком ниже границы журнала, при изменении подписок или слишком
+    большом числе изменений возвращается ``reset``: клиенту нужно загрузить ленту заново и продолжить
+    с нового знака.
+
+    :param session: Сессия с открытой транзакцией.
+    :param user_id: ID пользователя.
+    :param since: Водяной знак прошлой синхронизации или None.
+    :return: Данные для ``TweetChangesOut``.
+    """
+    # Знак берётся до чтения изменений: всё, что зафиксируется позже, попадёт в следующий опрос.
+    watermark, horizon = (await session.execute(watermark_query())).one()
+    response: Dict[str, Any] = {
+        "result": True, "watermark": watermark, "reset": False, "created": [], "deleted": [], "likes": [],
+    }
+    # Ниже границы записи журнала удалены: по ним нельзя восстановить изменения.
+    if since is None or since < horizon:
+        response["reset"] = True
+        return response
+
+    rows = (await session.execute(changes_query(user_id, since, CHANGES_MAX_ROWS + 1))).all()
+    if len(rows) > CHANGES_MAX_ROWS or any(kind == "feed" for kind, _ in rows):
+        response["reset"] = True
+        return response
+
+    created: Dict[int, None] = {}
+    liked: Dict[int, None] = {}
+    deleted: Dict[int, None] = {}
+    for kind, tweet_id in rows:
+        if kind == "created":
+            created[tweet_id] = None
+        elif kind == "likes":
+            liked[tweet_id] = None
+        else:
+            deleted[tweet_id] = None
+    liked = {tweet_id: None for tweet_id in liked if tweet_id not in created and tweet_id not in deleted}
+
+    tweets: List[Tweet] = []
+    created_ids: List[int] = [tweet_id for tweet_id in created if tweet_id not in deleted]
+    if created_ids:
+        tweets = (await session.execute(utils.tweets_query(created_ids))).scalars().all()
+
+    summaries = await utils.get_like_summaries(session, created_ids + list(liked), user_id)
+    media_dict = await utils.get_media_names(
+        session,
+        (media_id for tweet in tweets for media_id in tweet.tweet_media_ids or ()),
+    )
+
+    response["created"] = await utils.tweet_response(media_dict=media_dict, tweets=tweets, like_summaries=summaries)
+    response["deleted"] = list(deleted)
+    response["likes"] = [
+        {
+            "id": tweet_id,
+            "like_count": summaries.get(tweet_id, utils.EMPTY_LIKE_SUMMARY)["like_count"],
+            "liked_by_me": summaries.get(tweet_id, utils.EMPTY_LIKE_SUMMARY)["liked_by_me"],
+        }
+        for tweet_id in liked
+    ]
+    return response
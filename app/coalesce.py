@@ -0,0 +1,79 @@
+"""Модуль объединения одинаковых параллельных запросов на чтение (single-flight).
+
+Пока вычисление для ключа не завершилось, все запросы с тем же ключом ждут его
+результат вместо того, чтобы повторять те же запросы к базе данных.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from app.metrics import metrics
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Объединяет параллельные вызовы с одинаковым ключом в одно вычисление.
+
+    Ключ - кортеж, первый элемент которого (имя маршрута) используется в именах метрик
+    ``singleflight.<маршрут>.executed`` и ``singleflight.<маршрут>.coalesced``.
+
+    Отмена одного из ожидающих не отменяет общее вычисление; вычисление отменяется,
+    только когда его перестали ждать все.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Tuple[asyncio.Future, list]] = {}
+
+    async def do(self, key: Tuple[Hashable, ...], func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Возвращает результат ``func()``, разделяя его со всеми параллельными вызовами с тем же ключом.
+
+        :param key: Ключ вызова, например ``("profile", user_id)``.
+        :param func: Функция без аргументов, возвращающая корутину вычисления.
+        :return: Результат вычисления.
+        :raises Exception: Исключение вычисления пробрасывается всем ожидающим.
+        """
+        call = self._calls.get(key)
+
+        if call is None:
+            task: asyncio.Future = asyncio.ensure_future(func())
+            call = (task, [0])
+            self._calls[key] = call
+            task.add_done_callback(lambda done, call_key=key, done_call=call: self._forget(call_key, done_call))
+            metrics.inc(f"singleflight.{key[0]}.executed")
+        else:
+            metrics.inc(f"singleflight.{key[0]}.coalesced")
+
+        task, waiters = call
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if waiters[0] == 1 and not task.done():
+                # Ключ убирается сразу: до обратного вызова _forget новый вызов с тем же ключом
+                # присоединился бы к уже отменённому вычислению и получил бы чужой CancelledError.
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                task.cancel()
+                metrics.inc(f"singleflight.{key[0]}.cancelled")
+            raise
+        finally:
+            waiters[0] -= 1
+
+    def _forget(self, key: Hashable, call: Tuple[asyncio.Future, Any]) -> None:
+        """
+        Убирает завершённое вычисление, чтобы следующий вызов выполнился заново.
+
+        :param key: Ключ вызова.
+        :param call: Завершённое вычисление.
+        """
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        task: asyncio.Future = call[0]
+        if not task.cancelled():
+            task.exception()
+
+
+read_flight: SingleFlight = SingleFlight()
@@ -0,0 +1,258 @@
+"""Модуль сжатия ответов API.
+
+ASGI-middleware сжимает ответы ``/api`` алгоритмом brotli (если установлен пакет
+``brotli`` и его принимает клиент) или gzip. Маленькие тела и уже сжатые данные
+(картинки, архивы) отдаются как есть, а уровень сжатия выбирается по размеру тела:
+чем больше ответ, тем дешевле уровень, чтобы сжатие не съедало выигрыш во времени
+передачи. Степень сжатия и процессорное время пишутся в метрики.
+"""
+
+import os
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.metrics import metrics
+from app.static_files import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli необязателен, остаётся только gzip
+    brotli = None
+
+COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Тела больше этого размера сжимаются в пуле потоков, чтобы не блокировать event loop.
+COMPRESSION_THREAD_SIZE: int = 256 * 1024
+# (наибольший размер тела, {кодировка: уровень}); потоковые ответы сжимаются уровнями последней строки.
+COMPRESSION_LEVELS: Tuple[Tuple[float, Dict[str, int]], ...] = (
+    (64 * 1024, {"br": 6, "gzip": 6}),
+    (1024 * 1024, {"br": 4, "gzip": 4}),
+    (float("inf"), {"br": 1, "gzip": 1}),
+)
+INCOMPRESSIBLE_TYPES: Tuple[str, ...] = (
+    "image/",
+    "video/",
+    "audio/",
+    "application/zip",
+    "application/gzip",
+    "application/octet-stream",
+)
+
+
+def compression_level(encoding: str, size: Optional[int]) -> int:
+    """
+    Выбирает уровень сжатия по размеру тела.
+
+    :param encoding: Кодировка (``br`` или ``gzip``).
+    :param size: Размер тела или None для потокового ответа.
+    :return: Уровень сжатия.
+    """
+    for max_size, levels in COMPRESSION_LEVELS:
+        if size is not None and size <= max_size:
+            return levels[encoding]
+    return COMPRESSION_LEVELS[-1][1][encoding]
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Выбирает кодировку ответа по заголовку ``Accept-Encoding``.
+
+    :param accept_encoding: Значение заголовка.
+    :return: ``br``, ``gzip`` или None, если клиент не принимает ни одну из них.
+    """
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class Encoder:
+    """
+    Потоковый компрессор с учётом процессорного времени.
+
+    :param encoding: Кодировка (``br`` или ``gzip``).
+    :param level: Уровень сжатия.
+    """
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.bytes_in: int = 0
+        self.bytes_out: int = 0
+        self.cpu_seconds: float = 0.0
+
+    def compress(self, data: bytes, finish: bool = False) -> bytes:
+        """
+        Сжимает очередную часть тела и сбрасывает буфер компрессора, чтобы клиент получил её сразу.
+
+        :param data: Часть тела.
+        :param finish: Последняя ли это часть.
+        :return: Сжатые данные.
+        """
+        started: float = time.thread_time()
+        if self.encoding == "br":
+            output: bytes = self._compressor.process(data)
+            output += self._compressor.finish() if finish else self._compressor.flush()
+        else:
+            output = self._compressor.compress(data)
+            output += self._compressor.flush(zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH)
+        self.cpu_seconds += time.thread_time() - started
+        self.bytes_in += len(data)
+        self.bytes_out += len(output)
+        return output
+
+    def report(self) -> None:
+        """Добавляет итог сжатия ответа в метрики."""
+        prefix: str = f"compression.{self.encoding}"
+        metrics.inc(f"{prefix}.responses")
+        metrics.inc(f"{prefix}.bytes_in", self.bytes_in)
+        metrics.inc(f"{prefix}.bytes_out", self.bytes_out)
+        metrics.inc(f"{prefix}.cpu_ms", self.cpu_seconds * 1000)
+        metrics.set(f"{prefix}.ratio", metrics.get(f"{prefix}.bytes_in") / max(metrics.get(f"{prefix}.bytes_out"), 1))
+
+
+class CompressionMiddleware:
+    """
+    ASGI-middleware сжатия ответов ``/api``.
+
+    :param app: Оборачиваемое ASGI-приложение.
+    :param minimum_size: Тела меньше этого размера не сжимаются.
+    :param enabled: Включено ли сжатие.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, enabled: bool = COMPRESSION_ENABLED):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send) -> None:
+        """
+        Обрабатывает ASGI-вызов, сжимая тело ответа, если это выгодно.
+
+        :param scope: ASGI scope.
+        :param receive: ASGI receive.
+        :param send: ASGI send.
+        """
+        is_api: bool = scope["type"] == "http" and scope["path"].startswith("/api")
+        if not self.enabled or not is_api or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        encoding: Optional[str] = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        await _CompressedResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _CompressedResponder:
+    """
+    Сжатие одного ответа.
+
+    Начало ответа задерживается, пока не станет ясно, нужно ли сжатие: тело целиком
+    (обычный ответ) или первые ``minimum_size`` байт (потоковый ответ).
+    """
+
+    def __init__(self, app, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message: Optional[dict] = None
+        self.buffer: List[bytes] = []
+        self.buffered: int = 0
+        self.encoder: Optional[Encoder] = None
+        self.passthrough: bool = False
+
+    async def __call__(self, scope, receive, send) -> None:
+        """
+        Вызывает приложение, перехватывая отправку ответа.
+
+        :param scope: ASGI scope.
+        :param receive: ASGI receive.
+        :param send: ASGI send.
+        """
+        self.send = send
+        await self.app(scope, receive, self.send_wrapper)
+
+    async def send_wrapper(self, message) -> None:
+        """
+        Перехватывает сообщения ответа.
+
+        :param message: ASGI-сообщение.
+        """
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers: Headers = Headers(raw=message["headers"])
+            content_type: str = headers.get("content-type", "")
+            self.passthrough = any((
+                "content-encoding" in headers,
+                message["status"] in (204, 304),
+                content_type.startswith(INCOMPRESSIBLE_TYPES),
+            ))
+            if self.passthrough:
+                await self.send(message)
+            else:
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body: bytes = message.get("body", b"")
+        more_body: bool = message.get("more_body", False)
+
+        if self.encoder is not None:
+            await self.send_body(self.encoder.compress(body, finish=not more_body), more_body)
+            if not more_body:
+                self.encoder.report()
+            return
+
+        self.buffer.append(body)
+        self.buffered += len(body)
+        if more_body and self.buffered < self.minimum_size:
+            return
+
+        data: bytes = b"".join(self.buffer)
+        self.buffer = []
+        if not more_body and len(data) < self.minimum_size:
+            metrics.inc("compression.skipped")
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": data, "more_body": False})
+            return
+
+        self.encoder = Encoder(self.encoding, compression_level(self.encoding, None if more_body else len(data)))
+        headers: MutableHeaders = MutableHeaders(raw=self.start_message["headers"])
+        headers["content-encoding"] = self.encoding
+        if more_body:
+            del headers["content-length"]
+            compressed: bytes = self.encoder.compress(data)
+        else:
+            if len(data) >= COMPRESSION_THREAD_SIZE:
+                compressed = await anyio.to_thread.run_sync(self.encoder.compress, data, True)
+            else:
+                compressed = self.encoder.compress(data, finish=True)
+            headers["content-length"] = str(len(compressed))
+            self.encoder.report()
+
+        await self.send(self.start_message)
+        await self.send_body(compressed, more_body)
+
+    async def send_body(self, body: bytes, more_body: bool) -> None:
+        """
+        Отправляет часть сжатого тела.
+
+        :param body: Сжатые данные.
+        :param more_body: Будут ли ещё части.
+        """
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
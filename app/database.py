@@ -1,23 +1,51 @@
 """Модуль для работы с базой данных."""
 
+import asyncio
 import os
+import time
+from contextvars import ContextVar
+from typing import Iterable, Optional
 
-from sqlalchemy import MetaData, Table, engine
-from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from fastapi.logger import logger
+from sqlalchemy import MetaData, Table, engine, event, exc, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.sql import Executable
 
 DATABASE_URL: str = os.getenv("DATABASE_URL")
+DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_CONNECT_TIMEOUT: float = float(os.getenv("DB_CONNECT_TIMEOUT", "60"))
+# Число hash-секций таблиц tweets (по user_id) и likes (по tweet_id); 0 - без секционирования.
+DB_HASH_PARTITIONS: int = int(os.getenv("DB_HASH_PARTITIONS", "0"))
 Base: declarative_base = declarative_base()
 
 metadata: MetaData = MetaData()
 
-db_engine: AsyncEngine = create_async_engine(DATABASE_URL)
+db_engine: AsyncEngine = create_async_engine(DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
 async_session: sessionmaker = sessionmaker(
     bind=db_engine,
     class_=AsyncSession,
     expire_on_commit=False,
 )
 
+# Таймаут SQL-запросов текущего HTTP-запроса, задаётся RateLimitMiddleware по классу маршрута.
+statement_timeout_ms: ContextVar[Optional[int]] = ContextVar("statement_timeout_ms", default=None)
+
+
+@event.listens_for(Session, "after_begin")
+def set_statement_timeout(session: Session, transaction, connection: engine.Connection) -> None:
+    """Устанавливает таймаут SQL-запросов на время транзакции сессии.
+
+    :param session: Сессия, начавшая транзакцию.
+    :param transaction: Транзакция сессии.
+    :param connection: Соединение, на котором началась транзакция.
+    """
+    timeout: Optional[int] = statement_timeout_ms.get()
+    if timeout:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
 INITIAL_DATA: dict[str: list[dict[str: str | int]]] = {
     "users": [
         {"name": "user_1", "secret_key": "test"},
@@ -30,9 +58,9 @@ INITIAL_DATA: dict[str: list[dict[str: str | int]]] = {
         {"follower_id": 1, "followed_id": 3},
     ],
     "tweets": [
-        {"tweet_data": "Good day ^_^", "user_id": 1},
-        {"tweet_data": "What's up???", "user_id": 2},
-        {"tweet_data": "The message has been deleted by admin", "user_id": 3},
+        {"tweet_data": "Good day ^_^", "user_id": 1, "conversation_id": 1, "path": [1]},
+        {"tweet_data": "What's up???", "user_id": 2, "conversation_id": 2, "path": [2]},
+        {"tweet_data": "The message has been deleted by admin", "user_id": 3, "conversation_id": 3, "path": [3]},
     ],
     "likes": [
         {"user_id": 2, "tweet_id": 1},
@@ -59,3 +87,97 @@ def initialize_table(target: Table, connection: engine.Connection, **kw):
 
     if table_name in INITIAL_DATA and INITIAL_DATA[table_name]:
         connection.execute(target.insert(), INITIAL_DATA[table_name])
+
+
+async def find_missing_indexes(connection: AsyncConnection) -> list[str]:
+    """Возвращает индексы, объявленные в моделях, но отсутствующие в базе данных.
+
+    Индекс, построение которого через ``CREATE INDEX CONCURRENTLY`` прервалось
+    (``indisvalid = false``), тоже считается отсутствующим.
+
+    :param connection: Соединение с базой данных.
+    :type connection: sqlalchemy.ext.asyncio.AsyncConnection
+
+    :return: Отсортированный список имён недостающих индексов.
+    """
+    expected: set[str] = {
+        index.name
+        for table in metadata.tables.values()
+        for index in table.indexes
+    }
+    valid_indexes = await connection.execute(
+        text(
+            "SELECT c.relname FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = current_schema() AND i.indisvalid",
+        ),
+    )
+    return sorted(expected - set(valid_indexes.scalars().all()))
+
+
+async def wait_for_database(
+    target_engine: AsyncEngine,
+    timeout: float = DB_CONNECT_TIMEOUT,
+    initial_delay: float = 0.25,
+    max_delay: float = 5.0,
+) -> None:
+    """Ждёт готовности базы данных, повторяя подключение с экспоненциальной задержкой.
+
+    :param target_engine: Движок, через который проверяется подключение.
+    :type target_engine: sqlalchemy.ext.asyncio.AsyncEngine
+
+    :param timeout: Сколько секунд в сумме ждать базу данных.
+    :param initial_delay: Задержка перед второй попыткой в секундах.
+    :param max_delay: Максимальная задержка между попытками в секундах.
+
+    :raises OSError, sqlalchemy.exc.DBAPIError: Если база данных не ответила за ``timeout`` секунд.
+    """
+    deadline: float = time.monotonic() + timeout
+    delay: float = initial_delay
+    attempt: int = 1
+
+    while True:
+        try:
+            async with target_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            return
+        except (OSError, exc.DBAPIError) as error:
+            remaining: float = deadline - time.monotonic()
+            if remaining <= 0:
+                raise
+            logger.warning("Database is not ready (attempt %d): %s", attempt, error)
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+            attempt += 1
+
+
+async def warm_up_pool(statements: Iterable[Executable], size: int = DB_POOL_SIZE) -> None:
+    """Открывает ``size`` соединений пула и выполняет на каждом горячие запросы.
+
+    SQLAlchemy кэширует скомпилированный SQL, а asyncpg - подготовленные выражения
+    на каждом соединении, поэтому первые запросы после старта не платят за подключение,
+    компиляцию и PREPARE.
+
+    :param statements: Запросы, которые нужно прогреть.
+    :param size: Количество соединений, которые нужно открыть заранее.
+    """
+    if size <= 0:
+        return
+
+    statements = list(statements)
+
+    async def warm_connection(conn: AsyncConnection) -> None:
+        # Через сессию, как в маршрутах, чтобы ключи кэша компиляции совпали.
+        async with AsyncSession(bind=conn) as session:
+            for statement in statements:
+                await session.execute(statement)
+
+    connections: list[AsyncConnection] = [db_engine.connect() for _ in range(size)]
+    # Первое подключение пула инициализирует диалект под блокировкой, параллельно его открывать нельзя.
+    await connections[0].start()
+    await asyncio.gather(*(conn.start() for conn in connections[1:]))
+    try:
+        await asyncio.gather(*(warm_connection(conn) for conn in connections))
+    finally:
+        await asyncio.gather(*(conn.close() for conn in connections))
@@ -1,25 +1,53 @@
 """Модуль для основных настроек приложения."""
 
-from fastapi import FastAPI, Request, Response
+import asyncio
+import os
+from contextlib import suppress
+
+from fastapi import FastAPI, Request
 from fastapi.logger import logger
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from fastapi.staticfiles import StaticFiles
 from sqlalchemy import event
-
-from app.database import async_session, db_engine, initialize_table, metadata
+from sqlalchemy.exc import DBAPIError
+
+from app import changes, utils
+from app.access_log import AccessLogMiddleware, start_access_log, stop_access_log, track_db_time
+from app.cache import CACHE_ENABLED
+from app.compression import CompressionMiddleware
+from app.database import (
+    DB_POOL_SIZE,
+    async_session,
+    db_engine,
+    find_missing_indexes,
+    initialize_table,
+    metadata,
+    wait_for_database,
+    warm_up_pool,
+)
+from app.invalidation import InvalidationBus, asyncpg_dsn
+from app.jobs import JOBS_WORKER_ENABLED, JobWorker
+from app.media_gc import MEDIA_GC_INTERVAL_SECONDS, run_periodically
 from app.models import Follower, Like, Tweet, User
+from app.rate_limit import RateLimitMiddleware
 from app.routes import STATIC_PATH, UPLOAD_DIR, router
+from app.static_files import PrecompressedStaticFiles
 from app.utils import CustomException
 
+APP_ENV: str = os.getenv("APP_ENV", "development")
+# В production схемой владеют миграции: без DDL и тестовых данных, зато с прогревом пула.
+FAST_START: bool = APP_ENV == "production"
+DB_POOL_WARM_SIZE: int = int(os.getenv("DB_POOL_WARM_SIZE", str(DB_POOL_SIZE)))
+
 set_models: set = {User, Follower, Tweet, Like}
 
-for i_model in set_models:
-    event.listen(i_model.__table__, "after_create", initialize_table)
+if not FAST_START:
+    for i_model in set_models:
+        event.listen(i_model.__table__, "after_create", initialize_table)
 
 app: FastAPI = FastAPI(title="A tweeter clone")
 app.config = {"UPLOAD_FOLDER": UPLOAD_DIR}
-app.mount("/static", StaticFiles(directory=STATIC_PATH), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory=STATIC_PATH), name="static")
 
 app.include_router(router)
 
@@ -31,15 +59,21 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "OPTIONS", "DELETE", "PATCH", "PUT"],
+    allow_methods=["GET", "HEAD", "POST", "OPTIONS", "DELETE", "PATCH", "PUT"],
     allow_headers=[
         "Access-Control-Allow-Headers",
         "Access-Control-Allow-Origin",
         "Authorization",
         "Content-Type",
         "Set-Cookie",
+        "Upload-Offset",
     ],
+    expose_headers=["Location", "Upload-Offset", "Upload-Length"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(AccessLogMiddleware)
+track_db_time(db_engine.sync_engine)
 
 
 @app.on_event("startup")
@@ -47,13 +81,56 @@ async def startup() -> None:
     """
     Handle the startup event of the application.
 
-    Connects to the database and creates all tables if they do not exist.
+    Waits for the database, creates all tables if they do not exist and warns
+    about indexes that the migrations (``alembic upgrade head``) have not built yet.
+
+    In the fast-start mode (``APP_ENV=production``) DDL and seed data are skipped;
+    instead the pool connections are opened and the hot queries are compiled and
+    prepared before the worker starts accepting requests.
+
+    Also schedules the periodic orphaned media collector and, when enabled, starts the
+    cache invalidation listener (``CACHE_ENABLED=true``) and the in-process background
+    job worker (``JOBS_WORKER_ENABLED=true``).
 
     :return: None
     """
+    start_access_log()
     logger.info("Connecting to the database")
+    await wait_for_database(db_engine)
+
     async with db_engine.begin() as conn:
-        await conn.run_sync(metadata.create_all)
+        if not FAST_START:
+            await conn.run_sync(metadata.create_all)
+        missing_indexes: list[str] = await find_missing_indexes(conn)
+
+    if missing_indexes:
+        logger.warning(
+            "Database schema is missing indexes: %s. Run `alembic upgrade head`.",
+            ", ".join(missing_indexes),
+        )
+
+    if FAST_START:
+        logger.info("Warming up %d database connections", DB_POOL_WARM_SIZE)
+        await warm_up_pool(utils.hot_queries(), size=DB_POOL_WARM_SIZE)
+
+    media_gc_task = getattr(app.state, "media_gc_task", None)
+    if MEDIA_GC_INTERVAL_SECONDS > 0 and (media_gc_task is None or media_gc_task.done()):
+        app.state.media_gc_task = asyncio.create_task(run_periodically(MEDIA_GC_INTERVAL_SECONDS))
+
+    changes_purge_task = getattr(app.state, "changes_purge_task", None)
+    if changes.CHANGES_PURGE_INTERVAL_SECONDS > 0 and (changes_purge_task is None or changes_purge_task.done()):
+        app.state.changes_purge_task = asyncio.create_task(
+            changes.run_periodically(changes.CHANGES_PURGE_INTERVAL_SECONDS),
+        )
+
+    invalidation_task = getattr(app.state, "invalidation_task", None)
+    if CACHE_ENABLED and (invalidation_task is None or invalidation_task.done()):
+        app.state.invalidation_bus = InvalidationBus(asyncpg_dsn())
+        app.state.invalidation_task = asyncio.create_task(app.state.invalidation_bus.run())
+
+    jobs_task = getattr(app.state, "jobs_task", None)
+    if JOBS_WORKER_ENABLED and (jobs_task is None or jobs_task.done()):
+        app.state.jobs_task = asyncio.create_task(JobWorker().run())
 
 
 @app.on_event("shutdown")
@@ -62,29 +139,22 @@ async def shutdown_db_client() -> None:
 
     Handle the shutdown event of the application.
 
-    Disconnects from the database and disposes of the database engine.
+    Stops the background tasks, disconnects from the database and disposes of the database engine.
 
     :return: None
     """
+    for task_name in ("media_gc_task", "changes_purge_task", "invalidation_task", "jobs_task"):
+        task = getattr(app.state, task_name, None)
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
     logger.info("Disconnecting from the database")
     async with async_session() as session:
         await session.close()
         await db_engine.dispose()
-
-
-@app.middleware("http")
-async def log_requests(request: Request, call_next) -> Response:
-    """
-    Middleware function to log incoming requests and outgoing responses.
-
-    :param request: The incoming request object.
-    :param call_next: The function to call to continue the request handling.
-    :return: The response object.
-    """
-    logger.info(f"Request received: {request.method} {request.url}")
-    response = await call_next(request)
-    logger.info(f"Response sent: {response.status_code}")
-    return response
+    stop_access_log()
 
 
 @app.exception_handler(CustomException)
@@ -100,3 +170,24 @@ async def custom_exception_handler(request: Request, exc: CustomException) -> JS
         status_code=exc.status_code,
         content={"error_type": "CustomException", "error_message": exc.detail},
     )
+
+
+@app.exception_handler(DBAPIError)
+async def statement_timeout_handler(request: Request, exc: DBAPIError) -> JSONResponse:
+    """
+    Exception handler for SQL statements cancelled by the per-route statement timeout.
+
+    Other database errors are re-raised unchanged.
+
+    :param request: The request object.
+    :param exc: The database error that was raised.
+    :return: JSONResponse with status 503 and a Retry-After header.
+    """
+    if getattr(exc.orig, "sqlstate", None) != "57014":
+        raise exc
+
+    return JSONResponse(
+        status_code=503,
+        content={"error_type": "CustomException", "error_message": "Database statement timeout"},
+        headers={"Retry-After": "1"},
+    )
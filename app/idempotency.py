@@ -0,0 +1,450 @@
+"""Модуль ключей идемпотентности для запросов, создающих данные.
+
+Клиент передаёт заголовок ``Idempotency-Key``; первый успешный ответ сохраняется и
+отдаётся повторно на запросы с тем же ключом (с заголовком ``Idempotent-Replayed``).
+Параллельный дубликат ждёт выполняющийся запрос, а не выполняет его второй раз:
+в том же процессе - через asyncio.Event, в других процессах - опрашивая хранилище.
+Ошибка выполнения освобождает ключ, и повтор выполнится заново. Обработчик получает сессию
+с открытой транзакцией, и хранилище в базе данных сохраняет ответ в той же транзакции, что и
+созданные данные: после сбоя между фиксацией и ответом клиенту повтор получит сохранённый
+ответ, а не создаст данные второй раз.
+
+Ключ действует ``IDEMPOTENCY_TTL_SECONDS``. Хранилище - таблица ``idempotency_keys``
+(общая для всех процессов приложения) или ограниченный словарь в памяти процесса
+(``IDEMPOTENCY_BACKEND=memory``).
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_session
+from app.metrics import metrics
+from app.models import IdempotencyKey
+from app.utils import CustomException
+
+IDEMPOTENCY_BACKEND: str = os.getenv("IDEMPOTENCY_BACKEND", "database")
+IDEMPOTENCY_TTL_SECONDS: float = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# Сколько дубликат ждёт выполняющийся запрос, прежде чем получить 409.
+IDEMPOTENCY_WAIT_SECONDS: float = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# Запрос, выполняющийся дольше, считается брошенным упавшим процессом, и ключ можно занять.
+IDEMPOTENCY_LOCK_SECONDS: float = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+IDEMPOTENCY_POLL_INTERVAL: float = 0.05
+IDEMPOTENCY_MAX_ENTRIES: int = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+# Как часто (раз в сколько занятых ключей) удалять истёкшие ключи из таблицы.
+IDEMPOTENCY_PURGE_EVERY: int = 100
+MAX_KEY_LENGTH: int = 255
+
+# (пользователь, маршрут, ключ)
+Key = Tuple[int, str, str]
+
+
+class StoredResponse(NamedTuple):
+    """
+    Сохранённый ответ.
+
+    :param status_code: Код ответа.
+    :param body: Тело ответа.
+    """
+
+    status_code: int
+    body: Any
+
+
+def fingerprint(*parts: bytes) -> str:
+    """
+    Возвращает хэш тела запроса.
+
+    :param parts: Части тела запроса.
+    :return: SHA-256 в шестнадцатеричном виде.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+class IdempotencyStore(ABC):
+    """
+    Хранилище ключей идемпотентности.
+
+    :param ttl: Сколько секунд действует ключ.
+    :param wait_timeout: Сколько секунд дубликат ждёт выполняющийся запрос.
+    :param lock_timeout: Через сколько секунд выполняющийся запрос считается брошенным.
+    :param poll_interval: Как часто проверять хранилище, ожидая запрос другого процесса.
+    """
+
+    def __init__(
+        self,
+        ttl: float = IDEMPOTENCY_TTL_SECONDS,
+        wait_timeout: float = IDEMPOTENCY_WAIT_SECONDS,
+        lock_timeout: float = IDEMPOTENCY_LOCK_SECONDS,
+        poll_interval: float = IDEMPOTENCY_POLL_INTERVAL,
+    ):
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._in_flight: Dict[Key, asyncio.Event] = {}
+
+    @abstractmethod
+    async def claim(self, key: Key, request_fingerprint: str) -> Tuple[bool, Optional[str], Optional[StoredResponse]]:
+        """
+        Занимает ключ, если он свободен (нет, истёк или брошен).
+
+        :param key: Ключ.
+        :param request_fingerprint: Хэш тела запроса.
+        :return: (занят ли ключ этим вызовом, хэш запроса владельца ключа, сохранённый ответ или None).
+        """
+
+    @abstractmethod
+    async def store(self, key: Key, response: StoredResponse) -> None:
+        """
+        Сохраняет ответ занятого ключа.
+
+        :param key: Ключ.
+        :param response: Ответ.
+        """
+
+    @abstractmethod
+    async def delete(self, key: Key) -> None:
+        """
+        Удаляет ключ.
+
+        :param key: Ключ.
+        """
+
+    async def store_in_transaction(self, session: AsyncSession, key: Key, response: StoredResponse) -> bool:
+        """
+        Сохраняет ответ в транзакции обработчика запроса, если хранилище это умеет.
+
+        :param session: Сессия обработчика с открытой транзакцией.
+        :param key: Ключ.
+        :param response: Ответ.
+        :return: True, если ответ сохранён; иначе его сохранит ``finish`` после фиксации.
+        """
+        return False
+
+    async def begin(self, key: Key, request_fingerprint: str) -> Optional[StoredResponse]:
+        """
+        Занимает ключ или возвращает сохранённый ответ, дождавшись выполняющегося запроса.
+
+        :param key: Ключ.
+        :param request_fingerprint: Хэш тела запроса.
+        :return: Сохранённый ответ или None, если ключ занят этим вызовом и запрос нужно выполнить.
+        :raises CustomException: Если ключ использован с другим телом запроса (422)
+            или запрос с этим ключом не завершился за время ожидания (409).
+        """
+        deadline: float = time.monotonic() + self.wait_timeout
+
+        while True:
+            claimed, owner_fingerprint, response = await self.claim(key, request_fingerprint)
+            if claimed:
+                self._in_flight[key] = asyncio.Event()
+                metrics.inc("idempotency.executed")
+                return None
+            if owner_fingerprint is not None and owner_fingerprint != request_fingerprint:
+                raise CustomException(status_code=422, detail="Idempotency-Key was used with a different request")
+            if response is not None:
+                metrics.inc("idempotency.replayed")
+                return response
+
+            remaining: float = deadline - time.monotonic()
+            if remaining <= 0:
+                metrics.inc("idempotency.conflicts")
+                raise CustomException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+
+            event: Optional[asyncio.Event] = self._in_flight.get(key)
+            try:
+                if event is not None:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                elif owner_fingerprint is not None:
+                    await asyncio.sleep(min(self.poll_interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    async def finish(self, key: Key, response: StoredResponse, stored: bool = False) -> None:
+        """
+        Сохраняет ответ и будит ожидающие дубликаты.
+
+        :param key: Ключ.
+        :param response: Ответ.
+        :param stored: Ответ уже сохранён в транзакции обработчика.
+        """
+        try:
+            if not stored:
+                await self.store(key, response)
+        finally:
+            self._wake(key)
+
+    async def release(self, key: Key) -> None:
+        """
+        Освобождает ключ после ошибки, чтобы повтор выполнился заново.
+
+        :param key: Ключ.
+        """
+        try:
+            await self.delete(key)
+        finally:
+            self._wake(key)
+
+    def _wake(self, key: Key) -> None:
+        """
+        Будит дубликаты, ждущие ключ в этом процессе.
+
+        :param key: Ключ.
+        """
+        event: Optional[asyncio.Event] = self._in_flight.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """
+    Хранилище в памяти процесса: не больше ``max_entries`` ключей, старые вытесняются первыми.
+
+    :param max_entries: Максимальное количество ключей.
+    """
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_MAX_ENTRIES, **kwargs):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        # ключ -> (хэш запроса, ответ или None, время истечения, время занятия)
+        self._entries: OrderedDict = OrderedDict()
+
+    async def claim(self, key: Key, request_fingerprint: str) -> Tuple[bool, Optional[str], Optional[StoredResponse]]:
+        """
+        Занимает ключ, если он свободен (нет, истёк или брошен).
+
+        :param key: Ключ.
+        :param request_fingerprint: Хэш тела запроса.
+        :return: (занят ли ключ этим вызовом, хэш запроса владельца ключа, сохранённый ответ или None).
+        """
+        now: float = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            owner_fingerprint, response, expires_at, locked_at = entry
+            abandoned: bool = response is None and now - locked_at > self.lock_timeout
+            if expires_at > now and not abandoned:
+                return False, owner_fingerprint, response
+
+        self._entries[key] = (request_fingerprint, None, now + self.ttl, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True, request_fingerprint, None
+
+    async def store(self, key: Key, response: StoredResponse) -> None:
+        """
+        Сохраняет ответ занятого ключа.
+
+        :param key: Ключ.
+        :param response: Ответ.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries[key] = (entry[0], response, entry[2], entry[3])
+
+    async def delete(self, key: Key) -> None:
+        """
+        Удаляет ключ.
+
+        :param key: Ключ.
+        """
+        self._entries.pop(key, None)
+
+
+class DatabaseIdempotencyStore(IdempotencyStore):
+    """Хранилище в таблице ``idempotency_keys``, общее для всех процессов приложения."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._claims: int = 0
+
+    @staticmethod
+    def key_filter(key: Key):
+        """
+        Возвращает условие выборки строки ключа.
+
+        :param key: Ключ.
+        :return: Условие SQLAlchemy.
+        """
+        user_id, scope, value = key
+        return and_(IdempotencyKey.user_id == user_id, IdempotencyKey.scope == scope, IdempotencyKey.key == value)
+
+    async def claim(self, key: Key, request_fingerprint: str) -> Tuple[bool, Optional[str], Optional[StoredResponse]]:
+        """
+        Занимает ключ одним ``INSERT ... ON CONFLICT DO UPDATE``: существующая строка
+        перезаписывается, только если ключ истёк или брошен.
+
+        :param key: Ключ.
+        :param request_fingerprint: Хэш тела запроса.
+        :return: (занят ли ключ этим вызовом, хэш запроса владельца ключа, сохранённый ответ или None).
+        """
+        user_id, scope, value = key
+        statement = insert(IdempotencyKey).values(
+            user_id=user_id,
+            scope=scope,
+            key=value,
+            fingerprint=request_fingerprint,
+            locked_at=func.now(),
+            expires_at=func.now() + timedelta(seconds=self.ttl),
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[IdempotencyKey.user_id, IdempotencyKey.scope, IdempotencyKey.key],
+            set_={
+                "fingerprint": statement.excluded.fingerprint,
+                "response_status": None,
+                "response_body": None,
+                "locked_at": statement.excluded.locked_at,
+                "expires_at": statement.excluded.expires_at,
+            },
+            where=or_(
+                IdempotencyKey.expires_at < func.now(),
+                and_(
+                    IdempotencyKey.response_status.is_(None),
+                    IdempotencyKey.locked_at < func.now() - timedelta(seconds=self.lock_timeout),
+                ),
+            ),
+        ).returning(IdempotencyKey.user_id)
+
+        async with async_session() as session:
+            async with session.begin():
+                if (await session.execute(statement)).first() is not None:
+                    await self.purge_expired(session)
+                    return True, request_fingerprint, None
+
+                row = (await session.execute(
+                    select(IdempotencyKey.fingerprint, IdempotencyKey.response_status, IdempotencyKey.response_body).
+                    where(self.key_filter(key)),
+                )).first()
+
+        if row is None:
+            # Владелец освободил ключ между запросами: следующая попытка его займёт.
+            return False, None, None
+        owner_fingerprint, status_code, body = row
+        return False, owner_fingerprint, StoredResponse(status_code, body) if status_code is not None else None
+
+    async def purge_expired(self, session) -> None:
+        """
+        Раз в ``IDEMPOTENCY_PURGE_EVERY`` занятых ключей удаляет истёкшие, чтобы таблица не росла.
+
+        :param session: Сессия с открытой транзакцией.
+        """
+        self._claims += 1
+        if self._claims % IDEMPOTENCY_PURGE_EVERY == 0:
+            await session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < func.now()))
+
+    async def store(self, key: Key, response: StoredResponse) -> None:
+        """
+        Сохраняет ответ занятого ключа.
+
+        :param key: Ключ.
+        :param response: Ответ.
+        """
+        async with async_session() as session:
+            async with session.begin():
+                row = await session.get(IdempotencyKey, key)
+                if row is not None:
+                    row.response_status = response.status_code
+                    row.response_body = response.body
+
+    async def store_in_transaction(self, session: AsyncSession, key: Key, response: StoredResponse) -> bool:
+        """
+        Сохраняет ответ в транзакции обработчика запроса: ответ фиксируется вместе с данными.
+
+        :param session: Сессия обработчика с открытой транзакцией.
+        :param key: Ключ.
+        :param response: Ответ.
+        :return: True.
+        """
+        await session.execute(
+            update(IdempotencyKey).
+            where(self.key_filter(key)).
+            values(response_status=response.status_code, response_body=response.body),
+        )
+        return True
+
+    async def delete(self, key: Key) -> None:
+        """
+        Удаляет ключ.
+
+        :param key: Ключ.
+        """
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(delete(IdempotencyKey).where(self.key_filter(key)))
+
+
+def create_store(backend: str = IDEMPOTENCY_BACKEND) -> IdempotencyStore:
+    """
+    Создаёт хранилище ключей.
+
+    :param backend: ``database`` или ``memory``.
+    :return: Хранилище.
+    """
+    return MemoryIdempotencyStore() if backend == "memory" else DatabaseIdempotencyStore()
+
+
+idempotency_store: IdempotencyStore = create_store()
+
+
+async def idempotent(
+    idempotency_key: Optional[str],
+    user_id: int,
+    scope: str,
+    request_fingerprint: str,
+    status_code: int,
+    handler: Callable[[AsyncSession], Awaitable[Any]],
+    store: Optional[IdempotencyStore] = None,
+) -> Any:
+    """
+    Выполняет обработчик запроса не больше одного раза на ключ идемпотентности.
+
+    :param idempotency_key: Значение заголовка ``Idempotency-Key`` или None.
+    :param user_id: ID пользователя.
+    :param scope: Маршрут, например ``POST /api/tweets``.
+    :param request_fingerprint: Хэш тела запроса.
+    :param status_code: Код успешного ответа маршрута.
+    :param handler: Функция, выполняющая запрос в транзакции переданной ей сессии.
+    :param store: Хранилище (по умолчанию - ``idempotency_store``).
+    :return: Результат обработчика или сохранённый ответ.
+    :raises CustomException: Если ключ слишком длинный (400), использован с другим телом (422)
+        или запрос с этим ключом ещё выполняется (409).
+    """
+    if idempotency_key is None:
+        async with async_session() as session:
+            async with session.begin():
+                return await handler(session)
+    if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+        raise CustomException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+    store = store or idempotency_store
+    key: Key = (user_id, scope, idempotency_key)
+    stored: Optional[StoredResponse] = await store.begin(key, request_fingerprint)
+    if stored is not None:
+        return JSONResponse(stored.body, status_code=stored.status_code, headers={"Idempotent-Replayed": "true"})
+
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                result = await handler(session)
+                response: StoredResponse = StoredResponse(status_code, jsonable_encoder(result))
+                in_transaction: bool = await store.store_in_transaction(session, key, response)
+    except BaseException:
+        await asyncio.shield(store.release(key))
+        raise
+
+    await store.finish(key, response, stored=in_transaction)
+    return result
@@ -0,0 +1,174 @@
+"""Модуль шины инвалидации кэшей между воркерами через Postgres LISTEN/NOTIFY.
+
+Маршруты, изменяющие данные, публикуют сообщение ``pg_notify`` в своей транзакции:
+Postgres доставит его только после фиксации и не доставит при откате. Каждый воркер
+слушает канал на отдельном соединении asyncpg и удаляет записи из своих кэшей.
+Если соединение потеряно, кэши приостанавливаются, а после переподключения
+полностью очищаются, потому что сообщения за время разрыва могли потеряться.
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Hashable, Iterable, Optional
+
+import asyncpg
+from fastapi.logger import logger
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.cache import caches, set_caches_active
+from app.database import DATABASE_URL
+from app.metrics import metrics
+
+INVALIDATION_CHANNEL: str = "cache_invalidation"
+INVALIDATION_HEALTH_INTERVAL: float = float(os.getenv("INVALIDATION_HEALTH_INTERVAL", "5"))
+# NOTIFY принимает не больше 8000 байт, ключи отправляются пачками.
+MAX_KEYS_PER_MESSAGE: int = 200
+# Ошибки, после которых слушатель переподключается. Прерванный по таймауту запрос проверки
+# оставляет соединение asyncpg в незавершённой операции (InternalClientError).
+LISTENER_ERRORS: tuple = (
+    OSError,
+    asyncpg.PostgresError,
+    asyncpg.InterfaceError,
+    asyncpg.InternalClientError,
+    asyncio.TimeoutError,
+)
+
+
+async def publish(session: AsyncSession, cache_name: str, keys: Iterable[Hashable]) -> None:
+    """
+    Публикует инвалидацию ключей кэша в транзакции сессии.
+
+    Сообщение уходит другим воркерам после фиксации транзакции; в текущем воркере
+    записи удаляются сразу после фиксации.
+
+    :param session: Сессия с открытой транзакцией.
+    :param cache_name: Имя кэша.
+    :param keys: Ключи, которые нужно удалить.
+    """
+    if not caches[cache_name].enabled:
+        return
+
+    keys = list(keys)
+    for start in range(0, len(keys), MAX_KEYS_PER_MESSAGE):
+        payload: str = json.dumps([cache_name, keys[start:start + MAX_KEYS_PER_MESSAGE]], separators=(",", ":"))
+        await session.execute(select(func.pg_notify(INVALIDATION_CHANNEL, payload)))
+
+    session.sync_session.info.setdefault("invalidations", []).append((cache_name, keys))
+    metrics.inc("invalidation.published")
+
+
+@event.listens_for(Session, "after_commit")
+def apply_local_invalidations(session: Session) -> None:
+    """
+    Удаляет из кэшей текущего воркера ключи, опубликованные в зафиксированной транзакции.
+
+    :param session: Сессия, зафиксировавшая транзакцию.
+    """
+    for cache_name, keys in session.info.pop("invalidations", ()):
+        caches[cache_name].invalidate(keys)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_local_invalidations(session: Session, previous_transaction) -> None:
+    """
+    Забывает ключи, опубликованные в откаченной транзакции.
+
+    :param session: Сессия, откатившая транзакцию.
+    :param previous_transaction: Откаченная транзакция.
+    """
+    session.info.pop("invalidations", None)
+
+
+def apply_message(payload: str) -> None:
+    """
+    Применяет сообщение инвалидации к кэшам текущего воркера.
+
+    :param payload: Сообщение ``[имя кэша, [ключи]]`` в формате JSON.
+    """
+    try:
+        cache_name, keys = json.loads(payload)
+        cache = caches[cache_name]
+    except (ValueError, KeyError, TypeError):
+        logger.warning("Malformed cache invalidation message: %r", payload)
+        return
+
+    cache.invalidate(keys)
+    metrics.inc("invalidation.received")
+
+
+class InvalidationBus:
+    """
+    Слушатель канала инвалидации на отдельном соединении asyncpg.
+
+    :param dsn: Строка подключения asyncpg.
+    :param health_interval: Как часто проверять соединение, в секундах.
+    """
+
+    def __init__(self, dsn: str, health_interval: float = INVALIDATION_HEALTH_INTERVAL):
+        self.dsn = dsn
+        self.health_interval = health_interval
+        self.connection: Optional[asyncpg.Connection] = None
+        self.connected: asyncio.Event = asyncio.Event()
+        self._lost: asyncio.Event = asyncio.Event()
+
+    async def run(self) -> None:
+        """Подключается, слушает канал и переподключается с экспоненциальной задержкой."""
+        delay: float = 0.5
+
+        while True:
+            try:
+                await self._listen()
+                delay = 0.5
+                await self._watch()
+            except LISTENER_ERRORS as error:
+                logger.warning("Cache invalidation listener disconnected: %s", error)
+            finally:
+                set_caches_active(False)
+                self.connected.clear()
+                await self._close()
+
+            metrics.inc("invalidation.reconnects")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    async def _listen(self) -> None:
+        """Открывает соединение, подписывается на канал и включает кэши."""
+        self._lost.clear()
+        self.connection = await asyncpg.connect(self.dsn)
+        self.connection.add_termination_listener(lambda conn: self._lost.set())
+        await self.connection.add_listener(INVALIDATION_CHANNEL, self._on_notification)
+        # Подписка оформлена до очистки: всё, что изменится дальше, придёт сообщением.
+        set_caches_active(True)
+        self.connected.set()
+
+    async def _watch(self) -> None:
+        """Проверяет соединение, пока оно живо."""
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), timeout=self.health_interval)
+            except asyncio.TimeoutError:
+                await asyncio.wait_for(self.connection.fetchval("SELECT 1"), timeout=self.health_interval)
+            else:
+                raise ConnectionResetError("Listener connection was terminated")
+
+    def _on_notification(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        apply_message(payload)
+
+    async def _close(self) -> None:
+        if self.connection is not None and not self.connection.is_closed():
+            self.connection.terminate()
+        self.connection = None
+
+
+def asyncpg_dsn(database_url: str = DATABASE_URL) -> str:
+    """
+    Преобразует URL SQLAlchemy (``postgresql+asyncpg://``) в строку подключения asyncpg.
+
+    :param database_url: URL базы данных SQLAlchemy.
+    :return: Строка подключения asyncpg.
+    """
+    return make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
@@ -0,0 +1,334 @@
+"""Модуль фоновых задач на основе таблицы ``jobs``.
+
+Задача добавляется функцией ``enqueue`` в транзакции запроса (outbox): если транзакция
+откатится, задачи не будет, а зафиксированная задача не потеряется при падении процесса.
+Воркер ``JobWorker`` забирает задачи запросом ``FOR UPDATE SKIP LOCKED``, поэтому
+несколько воркеров (в процессах приложения или ``python -m app.jobs``) не мешают друг
+другу. Неудачная задача повторяется с экспоненциальной задержкой, пока не исчерпает
+попытки; для каждого типа задач ограничено число одновременно выполняемых задач.
+Задача типа, для которого у воркера нет обработчика, сразу помечается failed: все воркеры
+должны импортировать одни и те же модули с обработчиками (``JOBS_MODULES``).
+
+Обработчик регистрируется декоратором::
+
+    @job_handler("media.resize", concurrency=2)
+    async def resize_media(payload: dict) -> None:
+        ...
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set
+
+from fastapi.logger import logger
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_session
+from app.metrics import metrics
+from app.models import Job
+
+JOBS_WORKER_ENABLED: bool = os.getenv("JOBS_WORKER_ENABLED", "false").lower() == "true"
+JOBS_POLL_INTERVAL: float = float(os.getenv("JOBS_POLL_INTERVAL", "1"))
+JOBS_MAX_ATTEMPTS: int = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+JOBS_BACKOFF_BASE: float = float(os.getenv("JOBS_BACKOFF_BASE", "1"))
+JOBS_BACKOFF_MAX: float = float(os.getenv("JOBS_BACKOFF_MAX", "300"))
+# Модули с обработчиками, которые импортирует отдельный процесс воркера.
+JOBS_MODULES: List[str] = [name for name in os.getenv("JOBS_MODULES", "app.media_gc").split(",") if name]
+# Задача в статусе running дольше этого времени считается брошенной упавшим воркером.
+JOBS_STALE_SECONDS: float = float(os.getenv("JOBS_STALE_SECONDS", "600"))
+
+
+class JobHandler(NamedTuple):
+    """
+    Обработчик типа задач.
+
+    :param func: Асинхронная функция, принимающая параметры задачи.
+    :param concurrency: Сколько задач этого типа выполняется одновременно в одном воркере.
+    :param timeout: Максимальное время выполнения задачи в секундах.
+    """
+
+    func: Callable[[Dict[str, Any]], Awaitable[None]]
+    concurrency: int = 1
+    timeout: float = 60.0
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(job_type: str, concurrency: int = 1, timeout: float = 60.0) -> Callable:
+    """
+    Регистрирует обработчик типа задач.
+
+    :param job_type: Тип задач.
+    :param concurrency: Сколько задач этого типа выполняется одновременно в одном воркере.
+    :param timeout: Максимальное время выполнения задачи в секундах.
+    :return: Декоратор.
+    """
+    def decorator(func: Callable[[Dict[str, Any]], Awaitable[None]]) -> Callable:
+        JOB_HANDLERS[job_type] = JobHandler(func=func, concurrency=concurrency, timeout=timeout)
+        return func
+
+    return decorator
+
+
+async def enqueue(
+    session: AsyncSession,
+    job_type: str,
+    payload: Optional[Dict[str, Any]] = None,
+    delay: float = 0.0,
+    max_attempts: int = JOBS_MAX_ATTEMPTS,
+) -> Job:
+    """
+    Добавляет задачу в транзакции сессии: она станет видна воркерам после фиксации.
+
+    :param session: Сессия с открытой транзакцией.
+    :param job_type: Тип задачи.
+    :param payload: Параметры задачи (должны сериализоваться в JSON).
+    :param delay: Через сколько секунд задачу можно выполнять.
+    :param max_attempts: Максимальное количество попыток.
+    :return: Добавленная задача.
+    """
+    job: Job = Job(type=job_type, payload=payload or {}, max_attempts=max_attempts)
+    if delay:
+        job.run_at = func.now() + timedelta(seconds=delay)
+
+    session.add(job)
+    await session.flush()
+    metrics.inc(f"jobs.{job_type}.enqueued")
+    return job
+
+
+def backoff_delay(attempts: int, base: float = JOBS_BACKOFF_BASE, maximum: float = JOBS_BACKOFF_MAX) -> float:
+    """
+    Задержка перед повтором: экспонента от номера попытки со случайным разбросом.
+
+    :param attempts: Сколько попыток уже сделано.
+    :param base: Задержка после первой попытки в секундах.
+    :param maximum: Максимальная задержка в секундах.
+    :return: Задержка в секундах.
+    """
+    return min(base * 2 ** (attempts - 1), maximum) * random.uniform(0.5, 1.0)  # noqa: S311 не криптография
+
+
+class JobWorker:
+    """
+    Пул asyncio-задач, выполняющий фоновые задачи.
+
+    :param handlers: Обработчики по типам задач (по умолчанию - зарегистрированные ``job_handler``).
+    :param poll_interval: Как часто проверять таблицу, когда задач нет, в секундах.
+    :param backoff_base: Задержка повтора после первой неудачной попытки в секундах.
+    :param stale_seconds: Через сколько секунд задача running считается брошенной.
+    """
+
+    def __init__(
+        self,
+        handlers: Optional[Dict[str, JobHandler]] = None,
+        poll_interval: float = JOBS_POLL_INTERVAL,
+        backoff_base: float = JOBS_BACKOFF_BASE,
+        stale_seconds: float = JOBS_STALE_SECONDS,
+    ):
+        self.handlers = JOB_HANDLERS if handlers is None else handlers
+        self.poll_interval = poll_interval
+        self.backoff_base = backoff_base
+        self.stale_seconds = stale_seconds
+        self.running: Counter = Counter()
+        self._tasks: Set[asyncio.Task] = set()
+        self._wake: asyncio.Event = asyncio.Event()
+
+    async def run(self, until_idle: bool = False) -> None:
+        """
+        Забирает и выполняет задачи.
+
+        :param until_idle: Остановиться, когда доступных задач не останется (для тестов и ``--once``).
+        """
+        next_requeue: float = 0.0
+
+        try:
+            while True:
+                if time.monotonic() >= next_requeue:
+                    await self.requeue_stale()
+                    await self.fail_unhandled()
+                    next_requeue = time.monotonic() + self.stale_seconds / 2
+
+                claimed: int = await self.claim_available()
+                if until_idle and not claimed and not self._tasks:
+                    return
+                if not claimed:
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            await self.stop()
+
+    async def stop(self) -> None:
+        """Отменяет выполняющиеся задачи и возвращает их в очередь."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def requeue_stale(self) -> None:
+        """Возвращает в очередь задачи, брошенные упавшими воркерами."""
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(
+                    update(Job).
+                    where(Job.status == "running", Job.locked_at < func.now() - timedelta(seconds=self.stale_seconds)).
+                    values(status="pending", locked_at=None).
+                    execution_options(synchronize_session=False),
+                )
+
+    async def fail_unhandled(self) -> None:
+        """Помечает failed готовые задачи типов, для которых нет обработчика: иначе их никто не заберёт."""
+        async with async_session() as session:
+            async with session.begin():
+                result = await session.execute(
+                    update(Job).
+                    where(Job.status == "pending", Job.type.notin_(list(self.handlers)), Job.run_at <= func.now()).
+                    values(status="failed", last_error="No handler registered for this job type").
+                    returning(Job.id, Job.type).
+                    execution_options(synchronize_session=False),
+                )
+                unhandled: List[tuple] = result.all()
+
+        for job_id, job_type in unhandled:
+            metrics.inc(f"jobs.{job_type}.failed")
+            logger.error("Job %s (%s) failed: no handler registered for this job type", job_id, job_type)
+
+    async def claim_available(self) -> int:
+        """
+        Забирает задачи всех типов, для которых есть свободные места.
+
+        :return: Сколько задач забрано.
+        """
+        claimed: int = 0
+
+        for job_type, handler in self.handlers.items():
+            free: int = handler.concurrency - self.running[job_type]
+            if free <= 0:
+                continue
+
+            for job in await self.claim(job_type, free):
+                self.running[job_type] += 1
+                metrics.inc(f"jobs.{job_type}.claimed")
+                task: asyncio.Task = asyncio.create_task(self.execute(job, handler))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                claimed += 1
+
+        return claimed
+
+    async def claim(self, job_type: str, limit: int) -> List[Job]:
+        """
+        Забирает до ``limit`` готовых задач типа, пропуская заблокированные другими воркерами.
+
+        :param job_type: Тип задач.
+        :param limit: Максимальное количество задач.
+        :return: Забранные задачи.
+        """
+        ready = (
+            select(Job.id).
+            where(Job.status == "pending", Job.type == job_type, Job.run_at <= func.now()).
+            order_by(Job.run_at).
+            limit(limit).
+            with_for_update(skip_locked=True)
+        )
+        async with async_session() as session:
+            async with session.begin():
+                result = await session.execute(
+                    update(Job).
+                    where(Job.id.in_(ready)).
+                    values(status="running", attempts=Job.attempts + 1, locked_at=func.now()).
+                    returning(Job.id, Job.type, Job.payload, Job.attempts, Job.max_attempts).
+                    execution_options(synchronize_session=False),
+                )
+                return [Job(**row) for row in result.mappings().all()]
+
+    async def execute(self, job: Job, handler: JobHandler) -> None:
+        """
+        Выполняет задачу и записывает результат: удаляет её, планирует повтор или помечает failed.
+
+        :param job: Задача.
+        :param handler: Обработчик.
+        """
+        started: float = time.perf_counter()
+        prefix: str = f"jobs.{job.type}"
+
+        try:
+            await asyncio.wait_for(handler.func(job.payload), timeout=handler.timeout)
+        except asyncio.CancelledError:
+            await asyncio.shield(self.release(job))
+            raise
+        except Exception as error:
+            await self.fail(job, error)
+        else:
+            async with async_session() as session:
+                async with session.begin():
+                    await session.execute(delete(Job).where(Job.id == job.id))
+            metrics.inc(f"{prefix}.succeeded")
+        finally:
+            metrics.inc(f"{prefix}.duration_ms", (time.perf_counter() - started) * 1000)
+            self.running[job.type] -= 1
+            self._wake.set()
+
+    async def fail(self, job: Job, error: Exception) -> None:
+        """
+        Планирует повтор задачи с задержкой или помечает её failed, если попытки исчерпаны.
+
+        :param job: Задача.
+        :param error: Ошибка обработчика.
+        """
+        values: Dict[str, Any] = {"locked_at": None, "last_error": f"{type(error).__name__}: {error}"[:1000]}
+
+        if job.attempts >= job.max_attempts:
+            values["status"] = "failed"
+            metrics.inc(f"jobs.{job.type}.failed")
+            logger.error("Job %s (%s) failed after %d attempts: %s", job.id, job.type, job.attempts, error)
+        else:
+            values["status"] = "pending"
+            values["run_at"] = func.now() + timedelta(seconds=backoff_delay(job.attempts, base=self.backoff_base))
+            metrics.inc(f"jobs.{job.type}.retried")
+
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(update(Job).where(Job.id == job.id).values(**values))
+
+    async def release(self, job: Job) -> None:
+        """
+        Возвращает прерванную задачу в очередь без траты попытки.
+
+        :param job: Задача.
+        """
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(
+                    update(Job).
+                    where(Job.id == job.id).
+                    values(status="pending", locked_at=None, attempts=Job.attempts - 1),
+                )
+
+
+def main() -> None:
+    """Точка входа командной строки: отдельный процесс воркера."""
+    parser = argparse.ArgumentParser(description="Выполняет фоновые задачи из таблицы jobs.")
+    parser.add_argument("--once", action="store_true", help="выполнить доступные задачи и выйти")
+    parser.add_argument("--poll-interval", type=float, default=JOBS_POLL_INTERVAL)
+    args = parser.parse_args()
+
+    for module_name in JOBS_MODULES:
+        importlib.import_module(module_name)
+
+    worker: JobWorker = JobWorker(poll_interval=args.poll_interval)
+    asyncio.run(worker.run(until_idle=args.once))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,516 @@
+"""Модуль сборщика неиспользуемых медиафайлов.
+
+Медиа загружается раньше, чем на него ссылается твит. Медиа удалённого твита удаляет
+фоновая задача ``media.delete``, которую ``delete_tweet`` ставит в той же транзакции.
+Сборщик удаляет строки ``medias``, на которые не ссылается ни один ``Tweet.tweet_media_ids``,
+вместе с их файлами, а также файлы загрузок без строки в ``medias``. Удаляется только то,
+что старше периода ожидания, пачками ограниченного размера с паузами между ними; файлы
+удаляются в отдельном потоке с низким приоритетом ввода-вывода.
+Истёкшие возобновляемые загрузки (``media_uploads``) удаляются вместе с временными файлами.
+
+Запуск из командной строки: ``python -m app.media_gc [--grace-hours N] [--batch-size N] [--dry-run]``.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+
+from fastapi.logger import logger
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import invalidation
+from app.database import async_session, db_engine
+from app.jobs import job_handler
+from app.metrics import metrics
+from app.models import Media, MediaUpload, Tweet
+from app.routes import UPLOAD_DIR
+from app.uploads import MEDIA_UPLOAD_TMP_DIR, MEDIA_UPLOAD_TTL_SECONDS, TEMP_SUFFIX
+
+MEDIA_URL_PREFIX: str = "/static/images/"
+MEDIA_GC_GRACE_SECONDS: float = float(os.getenv("MEDIA_GC_GRACE_SECONDS", str(24 * 60 * 60)))
+MEDIA_GC_INTERVAL_SECONDS: float = float(os.getenv("MEDIA_GC_INTERVAL_SECONDS", str(60 * 60)))
+MEDIA_GC_BATCH_SIZE: int = int(os.getenv("MEDIA_GC_BATCH_SIZE", "500"))
+MEDIA_GC_BATCH_PAUSE: float = float(os.getenv("MEDIA_GC_BATCH_PAUSE", "0.5"))
+# Ключ advisory-блокировки: при нескольких воркерах сборщик работает только в одном.
+MEDIA_GC_LOCK_ID: int = 310_031
+
+T = TypeVar("T")
+
+
+def _lower_io_priority() -> None:
+    """
+    Понижает приоритет текущего потока до nice 19.
+
+    В Linux nice задаётся для каждого потока отдельно, а приоритет ввода-вывода потока без
+    явного ``ionice`` планировщики BFQ/CFQ выводят из nice: nice 19 - низший уровень best-effort.
+    """
+    if sys.platform == "linux":
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+
+
+# Файловые операции сборщика (обход каталогов и удаление) идут в своём потоке с низким приоритетом
+# и в приложении, и в CLI; общий пул asyncio.to_thread (запись загрузок) приоритет не теряет.
+_gc_executor: ThreadPoolExecutor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="media-gc", initializer=_lower_io_priority,
+)
+
+
+async def _in_gc_thread(func: Callable[..., T], *args: Any) -> T:
+    """
+    Выполняет файловую операцию сборщика в потоке с низким приоритетом ввода-вывода.
+
+    :param func: Функция.
+    :param args: Аргументы функции.
+    :return: Результат функции.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_gc_executor, func, *args)
+
+
+class CollectionReport(NamedTuple):
+    """
+    Итог одного прохода сборщика.
+
+    :param media_rows: Сколько строк ``medias`` удалено.
+    :param files: Сколько файлов удалено.
+    :param bytes_reclaimed: Сколько байт освобождено на диске.
+    :param uploads: Сколько истёкших возобновляемых загрузок удалено.
+    """
+
+    media_rows: int = 0
+    files: int = 0
+    bytes_reclaimed: int = 0
+    uploads: int = 0
+
+
+def _is_upload(file_name: str) -> bool:
+    """
+    Проверяет, что файл создан ``upload_media`` или возобновляемой загрузкой (имя - UUID с расширением).
+
+    Остальные файлы каталога (например, ``.gitkeep`` и картинки README) сборщик не трогает.
+
+    :param file_name: Имя файла.
+    :return: True, если файл - загрузка пользователя.
+    """
+    try:
+        uuid.UUID(os.path.splitext(file_name)[0])
+    except ValueError:
+        return False
+    return True
+
+
+def _remove_files(paths: List[str], dry_run: bool) -> CollectionReport:
+    """
+    Удаляет файлы и считает освобождённое место. Выполняется в отдельном потоке.
+
+    :param paths: Пути к файлам.
+    :param dry_run: Только посчитать, ничего не удаляя.
+    :return: Количество удалённых файлов и освобождённых байт.
+    """
+    removed: int = 0
+    reclaimed: int = 0
+
+    for file_path in paths:
+        try:
+            size: int = os.stat(file_path).st_size
+            if not dry_run:
+                os.remove(file_path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        reclaimed += size
+
+    return CollectionReport(files=removed, bytes_reclaimed=reclaimed)
+
+
+async def _delete_unreferenced(session: AsyncSession, media_ids: List[int], dry_run: bool) -> List[Tuple[int, str]]:
+    """
+    Удаляет строки ``medias`` из ``media_ids``, на которые не ссылается ни один твит.
+
+    Строки, заблокированные создаваемым твитом, пропускаются до следующего прохода.
+
+    :param session: Сессия с открытой транзакцией.
+    :param media_ids: ID медиа-кандидатов.
+    :param dry_run: Только найти такие строки, ничего не удаляя.
+    :return: ID и имена файлов удалённых строк.
+    """
+    # Медиа, которые прикрепляет ещё не зафиксированный твит, заблокированы им (FOR KEY SHARE) и пропускаются:
+    # проверка ссылок ниже видит только зафиксированные твиты. Заблокированные здесь строки твит прикрепить
+    # не сможет, пока транзакция сборщика не закончится.
+    locked_ids: List[int] = (await session.execute(
+        select(Media.id).where(Media.id.in_(media_ids)).with_for_update(skip_locked=True),
+    )).scalars().all()
+    orphans = Media.id.in_(locked_ids) & ~exists().where(Tweet.tweet_media_ids.contains(array([Media.id])))
+
+    if dry_run:
+        return (await session.execute(select(Media.id, Media.file_name).where(orphans))).all()
+
+    deleted = (await session.execute(
+        delete(Media).where(orphans).returning(Media.id, Media.file_name).execution_options(
+            synchronize_session=False,
+        ),
+    )).all()
+    await invalidation.publish(session, "media", [media_id for media_id, _ in deleted])
+    return deleted
+
+
+def _media_paths(file_names: List[str], upload_dir: str) -> List[str]:
+    """
+    Возвращает пути к файлам медиа по их ``file_name``.
+
+    :param file_names: Имена файлов в виде ``/static/images/<имя>``.
+    :param upload_dir: Каталог загрузок.
+    :return: Пути к файлам.
+    """
+    return [os.path.join(upload_dir, os.path.basename(file_name)) for file_name in file_names if file_name]
+
+
+@job_handler("media.delete", concurrency=2)
+async def delete_tweet_media(payload: Dict[str, Any]) -> None:
+    """
+    Фоновая задача: удаляет медиа удалённого твита вместе с файлами, если на них не ссылаются другие твиты.
+
+    :param payload: ``{"media_ids": [...]}``.
+    """
+    async with async_session() as session:
+        async with session.begin():
+            deleted: List[Tuple[int, str]] = await _delete_unreferenced(session, payload["media_ids"], dry_run=False)
+
+    removed: CollectionReport = await _in_gc_thread(
+        _remove_files, _media_paths([file_name for _, file_name in deleted], UPLOAD_DIR), False,
+    )
+    metrics.inc("media_gc.media_rows_deleted", len(deleted))
+    metrics.inc("media_gc.files_deleted", removed.files)
+    metrics.inc("media_gc.bytes_reclaimed", removed.bytes_reclaimed)
+
+
+def _stale_upload_batches(upload_dir: str, cutoff: float, batch_size: int) -> Iterator[List[str]]:
+    """
+    Перебирает каталог загрузок и отдаёт имена старых файлов пачками.
+
+    :param upload_dir: Каталог загрузок.
+    :param cutoff: Файлы с mtime раньше этой отметки считаются старыми.
+    :param batch_size: Размер пачки.
+    :return: Итератор пачек имён файлов.
+    """
+    batch: List[str] = []
+
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and _is_upload(entry.name) and entry.stat().st_mtime < cutoff:
+                batch.append(entry.name)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+    if batch:
+        yield batch
+
+
+async def collect_orphan_media_rows(
+    cutoff: datetime,
+    upload_dir: str,
+    batch_size: int,
+    pause: float,
+    dry_run: bool,
+) -> CollectionReport:
+    """
+    Удаляет строки ``medias`` без ссылок из твитов вместе с их файлами.
+
+    :param cutoff: Строки, созданные позже, не трогаются.
+    :param upload_dir: Каталог загрузок.
+    :param batch_size: Сколько строк просматривать за один проход.
+    :param pause: Пауза между пачками в секундах.
+    :param dry_run: Только посчитать, ничего не удаляя.
+    :return: Итог прохода.
+    """
+    report: CollectionReport = CollectionReport()
+    last_id: int = 0
+
+    while True:
+        async with async_session() as session:
+            async with session.begin():
+                candidate_ids: List[int] = (await session.execute(
+                    select(Media.id).
+                    where(Media.id > last_id, Media.created_at < cutoff).
+                    order_by(Media.id).
+                    limit(batch_size),
+                )).scalars().all()
+
+                if not candidate_ids:
+                    return report
+
+                last_id = candidate_ids[-1]
+                deleted: List[Tuple[int, str]] = await _delete_unreferenced(session, candidate_ids, dry_run)
+
+        file_names: List[str] = [file_name for _, file_name in deleted]
+        paths: List[str] = _media_paths(file_names, upload_dir)
+        removed: CollectionReport = await _in_gc_thread(_remove_files, paths, dry_run)
+        report = CollectionReport(
+            media_rows=report.media_rows + len(file_names),
+            files=report.files + removed.files,
+            bytes_reclaimed=report.bytes_reclaimed + removed.bytes_reclaimed,
+        )
+        await asyncio.sleep(pause)
+
+
+async def collect_unregistered_files(
+    cutoff: datetime,
+    upload_dir: str,
+    batch_size: int,
+    pause: float,
+    dry_run: bool,
+) -> CollectionReport:
+    """
+    Удаляет старые файлы загрузок, для которых нет строки в ``medias``.
+
+    :param cutoff: Файлы, изменённые позже, не трогаются.
+    :param upload_dir: Каталог загрузок.
+    :param batch_size: Сколько файлов проверять одним запросом.
+    :param pause: Пауза между пачками в секундах.
+    :param dry_run: Только посчитать, ничего не удаляя.
+    :return: Итог прохода.
+    """
+    report: CollectionReport = CollectionReport()
+    batches: Iterator[List[str]] = _stale_upload_batches(upload_dir, cutoff.timestamp(), batch_size)
+
+    while True:
+        batch: Optional[List[str]] = await _in_gc_thread(next, batches, None)
+        if batch is None:
+            return report
+
+        async with async_session() as session:
+            registered = set((await session.execute(
+                select(Media.file_name).where(Media.file_name.in_([MEDIA_URL_PREFIX + name for name in batch])),
+            )).scalars().all())
+
+        paths: List[str] = [
+            os.path.join(upload_dir, name)
+            for name in batch if MEDIA_URL_PREFIX + name not in registered
+        ]
+        removed: CollectionReport = await _in_gc_thread(_remove_files, paths, dry_run)
+        report = CollectionReport(
+            media_rows=report.media_rows,
+            files=report.files + removed.files,
+            bytes_reclaimed=report.bytes_reclaimed + removed.bytes_reclaimed,
+        )
+        await asyncio.sleep(pause)
+
+
+async def collect_expired_uploads(
+    upload_tmp_dir: str,
+    batch_size: int,
+    pause: float,
+    dry_run: bool,
+) -> CollectionReport:
+    """
+    Удаляет истёкшие возобновляемые загрузки вместе с их временными файлами.
+
+    :param upload_tmp_dir: Каталог временных файлов загрузок.
+    :param batch_size: Сколько загрузок удалять за один проход.
+    :param pause: Пауза между пачками в секундах.
+    :param dry_run: Только посчитать, ничего не удаляя.
+    :return: Итог прохода.
+    """
+    report: CollectionReport = CollectionReport()
+    last_id: str = ""
+
+    while True:
+        async with async_session() as session:
+            async with session.begin():
+                upload_ids: List[str] = (await session.execute(
+                    select(MediaUpload.id).
+                    where(MediaUpload.id > last_id, MediaUpload.expires_at < func.now()).
+                    order_by(MediaUpload.id).
+                    limit(batch_size),
+                )).scalars().all()
+
+                if not upload_ids:
+                    return report
+
+                last_id = upload_ids[-1]
+                if not dry_run:
+                    await session.execute(
+                        delete(MediaUpload).where(MediaUpload.id.in_(upload_ids)).execution_options(
+                            synchronize_session=False,
+                        ),
+                    )
+
+        paths: List[str] = [os.path.join(upload_tmp_dir, upload_id + TEMP_SUFFIX) for upload_id in upload_ids]
+        removed: CollectionReport = await _in_gc_thread(_remove_files, paths, dry_run)
+        report = CollectionReport(
+            media_rows=report.media_rows,
+            files=report.files + removed.files,
+            bytes_reclaimed=report.bytes_reclaimed + removed.bytes_reclaimed,
+            uploads=report.uploads + len(upload_ids),
+        )
+        await asyncio.sleep(pause)
+
+
+async def collect_abandoned_temp_files(
+    cutoff: datetime,
+    upload_tmp_dir: str,
+    batch_size: int,
+    pause: float,
+    dry_run: bool,
+) -> CollectionReport:
+    """
+    Удаляет старые временные файлы, для которых нет строки в ``media_uploads``.
+
+    :param cutoff: Файлы, изменённые позже, не трогаются.
+    :param upload_tmp_dir: Каталог временных файлов загрузок.
+    :param batch_size: Сколько файлов проверять одним запросом.
+    :param pause: Пауза между пачками в секундах.
+    :param dry_run: Только посчитать, ничего не удаляя.
+    :return: Итог прохода.
+    """
+    report: CollectionReport = CollectionReport()
+    if not os.path.isdir(upload_tmp_dir):
+        return report
+
+    batches: Iterator[List[str]] = _stale_upload_batches(upload_tmp_dir, cutoff.timestamp(), batch_size)
+
+    while True:
+        batch: Optional[List[str]] = await _in_gc_thread(next, batches, None)
+        if batch is None:
+            return report
+
+        upload_ids: List[str] = [os.path.splitext(name)[0] for name in batch]
+        async with async_session() as session:
+            active = set((await session.execute(
+                select(MediaUpload.id).where(MediaUpload.id.in_(upload_ids)),
+            )).scalars().all())
+
+        paths: List[str] = [
+            os.path.join(upload_tmp_dir, name)
+            for name, upload_id in zip(batch, upload_ids) if upload_id not in active
+        ]
+        removed: CollectionReport = await _in_gc_thread(_remove_files, paths, dry_run)
+        report = CollectionReport(
+            files=report.files + removed.files,
+            bytes_reclaimed=report.bytes_reclaimed + removed.bytes_reclaimed,
+        )
+        await asyncio.sleep(pause)
+
+
+async def collect_orphan_media(
+    grace_seconds: float = MEDIA_GC_GRACE_SECONDS,
+    upload_dir: str = UPLOAD_DIR,
+    batch_size: int = MEDIA_GC_BATCH_SIZE,
+    pause: float = MEDIA_GC_BATCH_PAUSE,
+    dry_run: bool = False,
+    upload_tmp_dir: str = MEDIA_UPLOAD_TMP_DIR,
+) -> Optional[CollectionReport]:
+    """
+    Выполняет один проход сборщика неиспользуемых медиафайлов.
+
+    :param grace_seconds: Период ожидания: более новые медиа и файлы не трогаются.
+    :param upload_dir: Каталог загрузок.
+    :param batch_size: Размер пачки.
+    :param pause: Пауза между пачками в секундах.
+    :param dry_run: Только посчитать, ничего не удаляя.
+    :param upload_tmp_dir: Каталог временных файлов возобновляемых загрузок.
+    :return: Итог прохода или None, если сборщик уже работает в другом процессе.
+    """
+    cutoff: datetime = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+    # Временный файл живой загрузки обновляется не реже, чем продлевается её срок.
+    temp_cutoff: datetime = datetime.now(timezone.utc) - timedelta(seconds=MEDIA_UPLOAD_TTL_SECONDS)
+    started: float = time.monotonic()
+
+    # Блокировка уровня сессии держится на отдельном соединении вне транзакции,
+    # чтобы проход сборщика не оставлял открытую транзакцию на всё время работы.
+    async with db_engine.connect() as lock_conn:
+        locked: bool = (await lock_conn.execute(select(func.pg_try_advisory_lock(MEDIA_GC_LOCK_ID)))).scalar()
+        await lock_conn.commit()
+        if not locked:
+            return None
+
+        try:
+            rows_report = await collect_orphan_media_rows(cutoff, upload_dir, batch_size, pause, dry_run)
+            files_report = await collect_unregistered_files(cutoff, upload_dir, batch_size, pause, dry_run)
+            uploads_report = await collect_expired_uploads(upload_tmp_dir, batch_size, pause, dry_run)
+            temp_report = await collect_abandoned_temp_files(temp_cutoff, upload_tmp_dir, batch_size, pause, dry_run)
+        finally:
+            await lock_conn.execute(select(func.pg_advisory_unlock(MEDIA_GC_LOCK_ID)))
+            await lock_conn.commit()
+
+    file_reports: List[CollectionReport] = [rows_report, files_report, uploads_report, temp_report]
+    report: CollectionReport = CollectionReport(
+        media_rows=rows_report.media_rows,
+        files=sum(file_report.files for file_report in file_reports),
+        bytes_reclaimed=sum(file_report.bytes_reclaimed for file_report in file_reports),
+        uploads=uploads_report.uploads,
+    )
+
+    if not dry_run:
+        metrics.inc("media_gc.runs")
+        metrics.inc("media_gc.media_rows_deleted", report.media_rows)
+        metrics.inc("media_gc.files_deleted", report.files)
+        metrics.inc("media_gc.bytes_reclaimed", report.bytes_reclaimed)
+        metrics.inc("media_gc.uploads_expired", report.uploads)
+
+    logger.info(
+        "Media GC%s: %d media rows, %d expired uploads, %d files, %d bytes reclaimed in %.1f s",
+        " (dry run)" if dry_run else "",
+        report.media_rows,
+        report.uploads,
+        report.files,
+        report.bytes_reclaimed,
+        time.monotonic() - started,
+    )
+    return report
+
+
+async def run_periodically(interval: float = MEDIA_GC_INTERVAL_SECONDS) -> None:
+    """
+    Запускает сборщик каждые ``interval`` секунд. Ошибки прохода пишутся в лог и не останавливают цикл.
+
+    :param interval: Интервал между проходами в секундах.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await collect_orphan_media()
+        except Exception:
+            logger.exception("Media GC failed")
+
+
+def main() -> None:
+    """Точка входа командной строки."""
+    parser = argparse.ArgumentParser(description="Удаляет медиафайлы, на которые не ссылается ни один твит.")
+    parser.add_argument("--grace-hours", type=float, default=MEDIA_GC_GRACE_SECONDS / 3600)
+    parser.add_argument("--batch-size", type=int, default=MEDIA_GC_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=MEDIA_GC_BATCH_PAUSE)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    # Отдельный процесс сборщика целиком не должен отнимать процессор у приложения;
+    # файловые операции и так идут в потоке с низким приоритетом ввода-вывода.
+    os.nice(19)
+
+    report: Optional[CollectionReport] = asyncio.run(collect_orphan_media(
+        grace_seconds=args.grace_hours * 3600,
+        batch_size=args.batch_size,
+        pause=args.pause,
+        dry_run=args.dry_run,
+    ))
+
+    if report is None:
+        print("Media GC is already running in another process")
+    else:
+        print(
+            f"media rows: {report.media_rows}, expired uploads: {report.uploads}, files: {report.files}, "
+            f"bytes reclaimed: {report.bytes_reclaimed}",
+        )
+
+
+if __name__ == "__main__":
+    main()
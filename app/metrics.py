@@ -0,0 +1,53 @@
+"""Модуль метрик приложения.
+
+Метрики - это счётчики и показатели в памяти процесса, которые отдаются маршрутом ``GET /api/metrics``
+(только с действительным заголовком ``api-key``).
+"""
+
+from collections import defaultdict
+from typing import Dict
+
+
+class MetricsRegistry:
+    """Набор именованных счётчиков."""
+
+    def __init__(self):
+        self._values: Dict[str, float] = defaultdict(float)
+
+    def inc(self, name: str, value: float = 1.0) -> None:
+        """
+        Увеличивает счётчик.
+
+        :param name: Имя счётчика.
+        :param value: На сколько увеличить.
+        """
+        self._values[name] += value
+
+    def set(self, name: str, value: float) -> None:
+        """
+        Устанавливает значение показателя, который не является счётчиком (например, отношения).
+
+        :param name: Имя показателя.
+        :param value: Новое значение.
+        """
+        self._values[name] = value
+
+    def get(self, name: str) -> float:
+        """
+        Возвращает текущее значение счётчика.
+
+        :param name: Имя счётчика.
+        :return: Значение счётчика (0, если он ещё не увеличивался).
+        """
+        return self._values.get(name, 0.0)
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Возвращает копию всех счётчиков.
+
+        :return: Словарь имя счётчика -> значение.
+        """
+        return dict(sorted(self._values.items()))
+
+
+metrics: MetricsRegistry = MetricsRegistry()
@@ -1,16 +1,60 @@
 """Модуль для работы с моделями."""
 
-from typing import Any, Dict
-
-from sqlalchemy import ARRAY, Column, ForeignKey, Integer, MetaData, Sequence, String
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import (
+    BigInteger, Column, DateTime, ForeignKey, Index, Integer, MetaData, Sequence, String, Table, event, func, text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.engine import Connection
 from sqlalchemy.orm import relationship
 
-from app.database import Base, metadata
+from app.database import DB_HASH_PARTITIONS, Base, metadata
 
 MAX_TWEET_LENGTH: int = 280
 MAX_NAME_LENGTH: int = 50
 
 
+def hash_partitioning(key: str) -> Dict[str, Any]:
+    """
+    Возвращает аргументы таблицы, секционированной по hash ключа, если секционирование включено.
+
+    :param key: Колонка ключа секционирования.
+    :return: Аргументы ``__table_args__``.
+    """
+    return {"postgresql_partition_by": f"HASH ({key})"} if DB_HASH_PARTITIONS else {}
+
+
+def tweet_foreign_key(**kwargs: Any) -> Tuple[ForeignKey, ...]:
+    """
+    Возвращает внешний ключ на tweets.id.
+
+    Первичный ключ секционированной таблицы tweets включает user_id, поэтому ссылаться
+    на один id нельзя: при секционировании внешнего ключа нет, а зависимые строки
+    удаляются вместе с твитом в ``delete_tweet``.
+
+    :param kwargs: Аргументы ``ForeignKey``.
+    :return: Внешний ключ или пустой кортеж.
+    """
+    return () if DB_HASH_PARTITIONS else (ForeignKey("tweets.id", **kwargs),)
+
+
+def create_hash_partitions(table: Table, connection: Connection, **kwargs: Any) -> None:
+    """
+    Создаёт секции таблицы ``<таблица>_p<остаток>`` после создания самой таблицы.
+
+    :param table: Секционированная таблица.
+    :param connection: Соединение с базой данных.
+    :param kwargs: Дополнительные аргументы события.
+    """
+    for remainder in range(DB_HASH_PARTITIONS):
+        connection.execute(text(
+            f"CREATE TABLE {table.name}_p{remainder} PARTITION OF {table.name} "
+            f"FOR VALUES WITH (MODULUS {DB_HASH_PARTITIONS}, REMAINDER {remainder})",
+        ))
+
+
 class Like(Base):
     """
     Модель представляющая сущность "Лайк".
@@ -27,9 +71,19 @@ class Like(Base):
 
     id: int = Column(Integer, Sequence("like_id_seq"), primary_key=True, index=True)
     user_id: int = Column(Integer, ForeignKey('users.id'), index=True)
-    tweet_id: int = Column(Integer, ForeignKey('tweets.id'), index=True)
+    # Ключ секционирования входит в первичный ключ секционированной таблицы.
+    tweet_id: int = Column(Integer, *tweet_foreign_key(), primary_key=bool(DB_HASH_PARTITIONS))
     user: relationship = relationship("User", back_populates="likes", lazy="select")
-    tweet: relationship = relationship("Tweet", back_populates="likes", lazy="select")
+    tweet: relationship = relationship(
+        "Tweet", back_populates="likes", lazy="select", primaryjoin="Tweet.id == foreign(Like.tweet_id)",
+    )
+
+    __table_args__: tuple = (
+        Index("ix_likes_tweet_id_id", tweet_id, id),
+        Index("ix_likes_tweet_id_user_id", tweet_id, user_id, unique=True),
+        hash_partitioning("tweet_id"),
+    )
+    __mapper_args__: Dict[str, Any] = {"primary_key": [id]}
 
     def to_json(self) -> Dict[str, Any]:
         """
@@ -48,6 +102,10 @@ class Tweet(Base):
     :param tweet_data: Текст твита.
     :param tweet_media_ids: Идентификаторы медиафайлов в твите.
     :param user_id: Идентификатор пользователя, создавшего твит.
+    :param created_at: Время создания твита.
+    :param conversation_id: Идентификатор корневого твита обсуждения.
+    :param path: Идентификаторы твитов от корня обсуждения до этого твита включительно
+        (материализованный путь: ответы на твит - строки с путём, начинающимся с его пути).
     :param user: Связь с моделью пользователя, создавшего твит.
     :param likes: Связь с моделью лайков, поставленных к твиту.
     """
@@ -58,9 +116,23 @@ class Tweet(Base):
     id: int = Column(Integer, Sequence("tweet_id_seq"), primary_key=True, index=True)
     tweet_data: str = Column(String(MAX_TWEET_LENGTH), nullable=False)
     tweet_media_ids = Column(ARRAY(Integer))
-    user_id: int = Column(Integer, ForeignKey('users.id'), index=True)
+    user_id: int = Column(Integer, ForeignKey('users.id'), primary_key=bool(DB_HASH_PARTITIONS), index=True)
+    created_at: datetime = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    conversation_id: int = Column(Integer)
+    path = Column(ARRAY(Integer))
     user: relationship = relationship("User", back_populates="tweets", lazy="select")
-    likes: relationship = relationship("Like", back_populates="tweet", lazy="joined", cascade="all, delete-orphan")
+    likes: relationship = relationship(
+        "Like", back_populates="tweet", lazy="joined", cascade="all, delete-orphan",
+        primaryjoin="Tweet.id == foreign(Like.tweet_id)",
+    )
+
+    __table_args__: tuple = (
+        Index("ix_tweets_user_id_id_desc", user_id, id.desc()),
+        Index("ix_tweets_tweet_media_ids", tweet_media_ids, postgresql_using="gin"),
+        Index("ix_tweets_conversation_id_path", conversation_id, path),
+        hash_partitioning("user_id"),
+    )
+    __mapper_args__: Dict[str, Any] = {"primary_key": [id]}
 
     def repr(self):
         """
@@ -97,7 +169,7 @@ class User(Base):
 
     id: int = Column(Integer, Sequence("user_id_seq"), primary_key=True, index=True)
     name: str = Column(String(MAX_NAME_LENGTH), nullable=False)
-    secret_key: str = Column(String, nullable=False)
+    secret_key: str = Column(String, nullable=False, index=True)
     tweets: relationship = relationship("Tweet", back_populates="user", lazy="select")
     likes: relationship = relationship("Like", back_populates="user", lazy="select")
     followers: relationship = relationship(
@@ -149,6 +221,10 @@ class Follower(Base):
     follower: relationship = relationship("User", foreign_keys=[follower_id], back_populates="following")
     followed: relationship = relationship("User", foreign_keys=[followed_id], back_populates="followers")
 
+    __table_args__: tuple = (
+        Index("ix_followers_followed_id", followed_id),
+    )
+
 
 class Media(Base):
     """
@@ -156,10 +232,228 @@ class Media(Base):
 
     :param id: Уникальный идентификатор медиа.
     :param file_name: Название файла медиа.
+    :param created_at: Время загрузки медиа.
     """
 
     __tablename__: str = "medias"
     metadata: MetaData = metadata
 
     id: int = Column(Integer, Sequence("media_id_seq"), primary_key=True, index=True)
-    file_name: str = Column(String)
+    file_name: str = Column(String, index=True)
+    created_at: datetime = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class MediaUpload(Base):
+    """
+    Модель представляющая сессию возобновляемой загрузки медиафайла.
+
+    Принятые байты дописываются во временный файл ``<id>.part``, ``upload_offset`` -
+    сколько из них сохранено. Завершённая загрузка становится строкой ``medias``.
+
+    :param id: Идентификатор загрузки (UUID), он же имя итогового файла.
+    :param user_id: Идентификатор пользователя, начавшего загрузку.
+    :param file_name: Исходное имя файла.
+    :param upload_length: Размер файла в байтах.
+    :param upload_offset: Сколько байт уже принято.
+    :param created_at: Время начала загрузки.
+    :param expires_at: Время, после которого брошенная загрузка удаляется; продлевается каждой частью.
+    """
+
+    __tablename__: str = "media_uploads"
+    metadata: MetaData = metadata
+
+    id: str = Column(String(36), primary_key=True)
+    user_id: int = Column(Integer, nullable=False)
+    file_name: str = Column(String(255), nullable=False)
+    upload_length: int = Column(BigInteger, nullable=False)
+    upload_offset: int = Column(BigInteger, nullable=False, server_default="0")
+    created_at: datetime = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    expires_at: datetime = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__: tuple = (
+        Index("ix_media_uploads_expires_at", expires_at),
+    )
+
+
+class Job(Base):
+    """
+    Модель представляющая сущность "Фоновая задача".
+
+    Задача добавляется в транзакции запроса и выполняется воркером ``app.jobs``
+    после фиксации. Выполненные задачи удаляются, исчерпавшие попытки остаются
+    со статусом ``failed``.
+
+    :param id: Уникальный идентификатор задачи.
+    :param type: Тип задачи (имя обработчика).
+    :param payload: Параметры задачи.
+    :param status: Статус: ``pending``, ``running`` или ``failed``.
+    :param attempts: Сколько раз задача забиралась воркером.
+    :param max_attempts: Максимальное количество попыток.
+    :param run_at: Время, раньше которого задача не выполняется.
+    :param locked_at: Время, когда воркер забрал задачу.
+    :param last_error: Последняя ошибка обработчика.
+    :param created_at: Время добавления задачи.
+    """
+
+    __tablename__: str = "jobs"
+    metadata: MetaData = metadata
+
+    id: int = Column(BigInteger, Sequence("job_id_seq"), primary_key=True)
+    type: str = Column(String(100), nullable=False)
+    payload: dict = Column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    status: str = Column(String(20), nullable=False, server_default="pending")
+    attempts: int = Column(Integer, nullable=False, server_default="0")
+    max_attempts: int = Column(Integer, nullable=False, server_default="5")
+    run_at: datetime = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_at: datetime = Column(DateTime(timezone=True))
+    last_error: str = Column(String)
+    created_at: datetime = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__: tuple = (
+        Index("ix_jobs_pending_type_run_at", type, run_at, postgresql_where=text("status = 'pending'")),
+    )
+
+
+class Notification(Base):
+    """
+    Модель представляющая сущность "Уведомление".
+
+    Одна строка собирает все события одного вида об одной цели за интервал времени
+    (например, лайки твита за сутки): новое событие увеличивает счётчик строки.
+
+    :param id: Уникальный идентификатор уведомления.
+    :param user_id: Идентификатор получателя.
+    :param kind: Вид события: ``like`` или ``follow``.
+    :param tweet_id: Идентификатор твита для лайков.
+    :param bucket: Начало интервала времени, за который собраны события.
+    :param actor_ids: Идентификаторы последних пользователей, вызвавших событие (новые первыми).
+    :param actor_count: Количество разных пользователей, вызвавших событие.
+    :param updated_at: Время последнего события.
+    """
+
+    __tablename__: str = "notifications"
+    metadata: MetaData = metadata
+
+    id: int = Column(BigInteger, Sequence("notification_id_seq"), primary_key=True)
+    user_id: int = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind: str = Column(String(20), nullable=False)
+    tweet_id: int = Column(Integer, *tweet_foreign_key(ondelete="CASCADE"))
+    bucket: datetime = Column(DateTime(timezone=True), nullable=False)
+    actor_ids = Column(ARRAY(Integer), nullable=False)
+    actor_count: int = Column(Integer, nullable=False, server_default="1")
+    updated_at: datetime = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__: tuple = (
+        Index(
+            "ix_notifications_user_id_kind_target_bucket",
+            user_id, kind, func.coalesce(tweet_id, 0), bucket,
+            unique=True,
+        ),
+        Index("ix_notifications_user_id_updated_at_id", user_id, updated_at.desc(), id.desc()),
+    )
+
+
+class NotificationActor(Base):
+    """
+    Модель представляющая пользователя, уже учтённого в агрегированном уведомлении.
+
+    Ключ совпадает с ключом группировки ``notifications`` плюс пользователь события, поэтому
+    повторное событие того же пользователя (лайк после отмены лайка) не увеличивает счётчик.
+
+    :param user_id: Идентификатор получателя уведомления.
+    :param kind: Вид события: ``like`` или ``follow``.
+    :param target: Идентификатор твита для лайков, 0 для подписок.
+    :param bucket: Начало интервала времени уведомления.
+    :param actor_id: Идентификатор пользователя, вызвавшего событие.
+    """
+
+    __tablename__: str = "notification_actors"
+    metadata: MetaData = metadata
+
+    user_id: int = Column(Integer, primary_key=True)
+    kind: str = Column(String(20), primary_key=True)
+    target: int = Column(Integer, primary_key=True)
+    bucket: datetime = Column(DateTime(timezone=True), primary_key=True)
+    actor_id: int = Column(Integer, primary_key=True)
+
+
+class TweetChange(Base):
+    """
+    Модель представляющая запись журнала изменений твитов для синхронизации ленты.
+
+    :param id: Уникальный идентификатор записи, возрастает в порядке добавления.
+    :param txid: Идентификатор транзакции, добавившей запись (``txid_current()``).
+    :param user_id: Автор твита, а для записей ``feed`` - пользователь, чья лента изменилась целиком.
+    :param kind: Вид изменения: ``created``, ``deleted``, ``likes`` или ``feed``.
+    :param tweet_id: Идентификатор твита (для ``feed`` не задан).
+    :param created_at: Время изменения.
+    """
+
+    __tablename__: str = "tweet_changes"
+    metadata: MetaData = metadata
+
+    id: int = Column(BigInteger, Sequence("tweet_change_id_seq"), primary_key=True)
+    txid: int = Column(BigInteger, nullable=False, server_default=func.txid_current())
+    user_id: int = Column(Integer, nullable=False)
+    kind: str = Column(String(20), nullable=False)
+    tweet_id: int = Column(Integer)
+    created_at: datetime = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__: tuple = (
+        Index("ix_tweet_changes_user_id_txid", user_id, txid),
+    )
+
+
+class TweetChangesHorizon(Base):
+    """
+    Модель представляющая границу журнала изменений твитов.
+
+    Записи журнала с txid меньше границы удалены, поэтому клиенту с более старым водяным
+    знаком нужно загрузить ленту заново.
+
+    :param txid: Граница: все оставшиеся записи журнала имеют txid не меньше неё.
+    :param created_at: Время удаления записей до границы.
+    """
+
+    __tablename__: str = "tweet_changes_horizon"
+    metadata: MetaData = metadata
+
+    txid: int = Column(BigInteger, primary_key=True, autoincrement=False)
+    created_at: datetime = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class IdempotencyKey(Base):
+    """
+    Модель представляющая ключ идемпотентности запроса (заголовок ``Idempotency-Key``).
+
+    :param user_id: Идентификатор пользователя, отправившего запрос.
+    :param scope: Маршрут запроса, например ``POST /api/tweets``.
+    :param key: Значение заголовка.
+    :param fingerprint: Хэш тела запроса: ключ нельзя повторно использовать с другим телом.
+    :param response_status: Код ответа; не задан, пока запрос выполняется.
+    :param response_body: Тело ответа.
+    :param locked_at: Время начала выполнения запроса.
+    :param expires_at: Время, после которого ключ можно использовать заново.
+    """
+
+    __tablename__: str = "idempotency_keys"
+    metadata: MetaData = metadata
+
+    user_id: int = Column(Integer, primary_key=True)
+    scope: str = Column(String(100), primary_key=True)
+    key: str = Column(String(255), primary_key=True)
+    fingerprint: str = Column(String(64), nullable=False)
+    response_status: int = Column(Integer)
+    response_body = Column(JSONB)
+    locked_at: datetime = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    expires_at: datetime = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__: tuple = (
+        Index("ix_idempotency_keys_expires_at", expires_at),
+    )
+
+
+if DB_HASH_PARTITIONS:
+    # Секции создаются раньше обработчиков after_create, заполняющих таблицы начальными данными.
+    for partitioned_table in (Tweet.__table__, Like.__table__):
+        event.listen(partitioned_table, "after_create", create_hash_partitions)
@@ -0,0 +1,218 @@
+"""Модуль агрегированных уведомлений о лайках и подписках.
+
+Уведомления группируются при записи: лайк или подписка увеличивает счётчик строки
+``notifications`` с тем же получателем, видом события, целью (твитом) и интервалом
+времени ``NOTIFICATIONS_BUCKET_SECONDS`` одним ``INSERT ... ON CONFLICT DO UPDATE``
+в транзакции самого события. Поэтому чтение - один постраничный запрос по индексу
+``(user_id, updated_at DESC, id DESC)`` без агрегации лайков на лету.
+
+Счётчик считает разных пользователей: уже учтённые хранятся в ``notification_actors``
+с тем же ключом группировки, и повторное событие того же пользователя (лайк после
+отмены лайка) уведомление не меняет. Отмена лайка или подписки счётчик не уменьшает.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, and_, func, or_, select, type_coerce
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import Grouping
+
+from app.metrics import metrics
+from app.models import Notification, NotificationActor, User
+from app.utils import CustomException
+
+NOTIFICATIONS_BUCKET_SECONDS: int = int(os.getenv("NOTIFICATIONS_BUCKET_SECONDS", "86400"))
+# Сколько последних пользователей события хранится в строке для текста уведомления.
+NOTIFICATIONS_RECENT_ACTORS: int = 3
+NOTIFICATIONS_PAGE_SIZE: int = 20
+NOTIFICATIONS_MAX_PAGE_SIZE: int = 100
+EPOCH: datetime = datetime(1970, 1, 1, tzinfo=timezone.utc)
+NOTIFICATION_VERBS: Dict[str, str] = {
+    "like": "liked your tweet",
+    "follow": "followed you",
+}
+
+
+def bucket_start(bucket_seconds: int = NOTIFICATIONS_BUCKET_SECONDS):
+    """
+    Возвращает SQL-выражение начала текущего интервала группировки (по часам базы данных).
+
+    :param bucket_seconds: Длина интервала в секундах.
+    :return: Выражение типа timestamptz.
+    """
+    return func.to_timestamp(func.floor(func.extract("epoch", func.now()) / bucket_seconds) * bucket_seconds)
+
+
+async def record_event(
+    session: AsyncSession,
+    user_id: int,
+    kind: str,
+    actor_id: int,
+    tweet_id: Optional[int] = None,
+) -> None:
+    """
+    Добавляет событие в агрегированное уведомление получателя в транзакции сессии.
+
+    :param session: Сессия с открытой транзакцией.
+    :param user_id: Идентификатор получателя.
+    :param kind: Вид события: ``like`` или ``follow``.
+    :param actor_id: Идентификатор пользователя, вызвавшего событие.
+    :param tweet_id: Идентификатор твита для лайков.
+    """
+    if user_id == actor_id:
+        return
+
+    bucket = bucket_start()
+    # Строка добавляется, только если пользователь ещё не учтён в уведомлении.
+    new_actor = insert(NotificationActor).values(
+        user_id=user_id,
+        kind=kind,
+        target=tweet_id or 0,
+        bucket=bucket,
+        actor_id=actor_id,
+    ).on_conflict_do_nothing().returning(NotificationActor.actor_id).cte("new_actor")
+
+    # Скобки обязательны: срез в Postgres применяется к выражению в скобках, а не к вызову функции.
+    recent_actors = type_coerce(
+        Grouping(func.array_prepend(actor_id, func.array_remove(Notification.actor_ids, actor_id))),
+        ARRAY(Integer),
+    )
+    statement = insert(Notification).values(
+        user_id=user_id,
+        kind=kind,
+        tweet_id=tweet_id,
+        bucket=bucket,
+        actor_ids=[actor_id],
+        actor_count=1,
+        updated_at=func.now(),
+    )
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[
+                Notification.user_id, Notification.kind, func.coalesce(Notification.tweet_id, 0), Notification.bucket,
+            ],
+            set_={
+                "actor_ids": recent_actors[1:NOTIFICATIONS_RECENT_ACTORS],
+                "actor_count": Notification.actor_count + 1,
+                "updated_at": func.now(),
+            },
+            where=select(new_actor.c.actor_id).exists(),
+        ),
+    )
+    metrics.inc(f"notifications.{kind}")
+
+
+def encode_cursor(notification: Notification) -> str:
+    """
+    Возвращает курсор следующей страницы после уведомления.
+
+    :param notification: Последнее уведомление страницы.
+    :return: Курсор вида ``<микросекунды>_<id>``.
+    """
+    timestamp: int = (notification.updated_at - EPOCH) // timedelta(microseconds=1)
+    return f"{timestamp}_{notification.id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Разбирает курсор страницы.
+
+    :param cursor: Курсор из ``encode_cursor``.
+    :raises CustomException: Если курсор некорректен (400).
+    :return: Время и id последнего уведомления предыдущей страницы.
+    """
+    try:
+        timestamp, notification_id = (int(part) for part in cursor.split("_"))
+    except ValueError:
+        raise CustomException(status_code=400, detail="Invalid cursor")
+    return EPOCH + timedelta(microseconds=timestamp), notification_id
+
+
+def notifications_query(user_id: int, limit: int, cursor: Optional[str] = None) -> Select:
+    """
+    Формирует запрос страницы уведомлений пользователя, от новых к старым.
+
+    :param user_id: Идентификатор получателя.
+    :param limit: Размер страницы.
+    :param cursor: Курсор предыдущей страницы.
+    :return: Запрос.
+    """
+    query: Select = select(Notification).where(Notification.user_id == user_id)
+
+    if cursor is not None:
+        updated_at, notification_id = decode_cursor(cursor)
+        query = query.where(
+            or_(
+                Notification.updated_at < updated_at,
+                and_(Notification.updated_at == updated_at, Notification.id < notification_id),
+            ),
+        )
+
+    return query.order_by(Notification.updated_at.desc(), Notification.id.desc()).limit(limit)
+
+
+def notification_text(kind: str, actor_names: List[str], actor_count: int) -> str:
+    """
+    Формирует текст уведомления, например "user_2 and 41 others liked your tweet".
+
+    :param kind: Вид события.
+    :param actor_names: Имена последних пользователей события.
+    :param actor_count: Количество разных пользователей события.
+    :return: Текст уведомления.
+    """
+    name: str = actor_names[0] if actor_names else "Someone"
+    others: int = actor_count - 1
+    if others <= 0:
+        subject: str = name
+    elif others == 1:
+        subject = f"{name} and 1 other"
+    else:
+        subject = f"{name} and {others} others"
+    return f"{subject} {NOTIFICATION_VERBS[kind]}"
+
+
+async def get_notifications(session: AsyncSession, user_id: int, limit: int, cursor: Optional[str] = None) -> dict:
+    """
+    Возвращает страницу уведомлений пользователя.
+
+    :param session: Сессия.
+    :param user_id: Идентификатор получателя.
+    :param limit: Размер страницы.
+    :param cursor: Курсор предыдущей страницы.
+    :return: Данные для ``NotificationsOut``.
+    """
+    notifications: List[Notification] = (
+        await session.execute(notifications_query(user_id, limit, cursor))
+    ).scalars().all()
+
+    actor_ids = {actor_id for notification in notifications for actor_id in notification.actor_ids}
+    names: Dict[int, str] = {}
+    if actor_ids:
+        names = dict((await session.execute(select(User.id, User.name).where(User.id.in_(actor_ids)))).all())
+
+    items: list = []
+    for notification in notifications:
+        actors: list = [
+            {"id": actor_id, "name": names[actor_id]}
+            for actor_id in notification.actor_ids if actor_id in names
+        ]
+        items.append(
+            {
+                "id": notification.id,
+                "type": notification.kind,
+                "tweet_id": notification.tweet_id,
+                "actors": actors,
+                "count": notification.actor_count,
+                "text": notification_text(
+                    notification.kind, [actor["name"] for actor in actors], notification.actor_count,
+                ),
+                "updated_at": notification.updated_at,
+            },
+        )
+
+    next_cursor: Optional[str] = encode_cursor(notifications[-1]) if len(notifications) == limit else None
+    return {"result": True, "notifications": items, "next_cursor": next_cursor}
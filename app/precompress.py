@@ -0,0 +1,135 @@
+"""Модуль предварительного сжатия статических файлов.
+
+Создаёт рядом с файлами сборки фронтенда их копии ``.gz`` и, если установлен пакет
+``brotli``, ``.br``, которые затем отдаёт ``PrecompressedStaticFiles`` (и nginx).
+Копия не создаётся, если она не меньше исходного файла, и не пересоздаётся, если
+исходный файл не менялся.
+
+Запуск: ``python -m app.precompress [каталог] [--min-size N]``.
+"""
+
+import argparse
+import gzip
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterator, NamedTuple
+
+from app.static_files import COMPRESSIBLE_EXTENSIONS
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli необязателен, остаётся только gzip
+    brotli = None
+
+# Не app.routes.STATIC_PATH: сжатие выполняется при сборке образа, без DATABASE_URL.
+STATIC_PATH: Path = Path(__file__).parent.parent / "static"
+PRECOMPRESS_MIN_SIZE: int = 1024
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    ".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+}
+if brotli is not None:
+    COMPRESSORS[".br"] = lambda data: brotli.compress(data, quality=11)
+
+
+class PrecompressReport(NamedTuple):
+    """
+    Итог сжатия каталога.
+
+    :param files: Сколько файлов сжато.
+    :param original_bytes: Суммарный размер исходных файлов.
+    :param compressed_bytes: Суммарный размер созданных копий, по лучшей копии на файл.
+    """
+
+    files: int = 0
+    original_bytes: int = 0
+    compressed_bytes: int = 0
+
+
+def compressible_files(directory: Path, min_size: int) -> Iterator[Path]:
+    """
+    Перебирает файлы каталога, которые имеет смысл сжимать.
+
+    Загрузки пользователей - картинки - по расширению не подходят и не сжимаются.
+
+    :param directory: Каталог статических файлов.
+    :param min_size: Файлы меньше этого размера не сжимаются.
+    :return: Итератор путей.
+    """
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path: Path = Path(root) / name
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and path.stat().st_size >= min_size:
+                yield path
+
+
+def precompress_file(path: Path) -> int:
+    """
+    Создаёт сжатые копии файла.
+
+    :param path: Путь к файлу.
+    :return: Размер лучшей копии или размер файла, если ни одна копия не получилась меньше.
+    """
+    source_stat: os.stat_result = path.stat()
+    data: bytes = path.read_bytes()
+    best: int = source_stat.st_size
+
+    for extension, compress in COMPRESSORS.items():
+        variant: Path = path.with_name(path.name + extension)
+        if variant.exists() and variant.stat().st_mtime >= source_stat.st_mtime:
+            best = min(best, variant.stat().st_size)
+            continue
+
+        compressed: bytes = compress(data)
+        if len(compressed) >= source_stat.st_size:
+            variant.unlink(missing_ok=True)
+            continue
+
+        variant.write_bytes(compressed)
+        # Время изменения копии совпадает с исходным файлом: Last-Modified не зависит от варианта.
+        os.utime(variant, (source_stat.st_atime, source_stat.st_mtime))
+        best = min(best, len(compressed))
+
+    return best
+
+
+def precompress_directory(directory: Path = STATIC_PATH, min_size: int = PRECOMPRESS_MIN_SIZE) -> PrecompressReport:
+    """
+    Сжимает все подходящие файлы каталога.
+
+    :param directory: Каталог статических файлов.
+    :param min_size: Файлы меньше этого размера не сжимаются.
+    :return: Итог сжатия.
+    """
+    report: PrecompressReport = PrecompressReport()
+
+    for path in compressible_files(directory, min_size):
+        compressed: int = precompress_file(path)
+        report = PrecompressReport(
+            files=report.files + 1,
+            original_bytes=report.original_bytes + path.stat().st_size,
+            compressed_bytes=report.compressed_bytes + compressed,
+        )
+
+    return report
+
+
+def main() -> None:
+    """Точка входа командной строки."""
+    parser = argparse.ArgumentParser(description="Создаёт .br/.gz копии статических файлов.")
+    parser.add_argument("directory", nargs="?", type=Path, default=STATIC_PATH)
+    parser.add_argument("--min-size", type=int, default=PRECOMPRESS_MIN_SIZE)
+    args = parser.parse_args()
+
+    if brotli is None:
+        print("brotli is not installed, only .gz variants will be created")
+
+    report: PrecompressReport = precompress_directory(args.directory, args.min_size)
+    print(
+        f"files: {report.files}, original: {report.original_bytes} bytes, "
+        f"compressed: {report.compressed_bytes} bytes",
+    )
+
+
+if __name__ == "__main__":
+    main()
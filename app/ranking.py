@@ -0,0 +1,169 @@
+"""Модуль ранжирования ленты.
+
+Ранжировщик получает набор кандидатов в виде массивов NumPy (id, число лайков, время
+создания) и считает оценки всех кандидатов одной векторной операцией.
+"""
+
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from app.models import Tweet
+from app.utils import CustomException
+
+DEFAULT_RANKER: str = os.getenv("FEED_DEFAULT_RANKER", "popularity")
+ENGAGEMENT_GRAVITY: float = float(os.getenv("FEED_ENGAGEMENT_GRAVITY", "1.8"))
+
+
+class Candidates(NamedTuple):
+    """
+    Кандидаты в ленту в виде параллельных массивов.
+
+    :param ids: Идентификаторы твитов.
+    :param like_counts: Количество лайков.
+    :param created_at: Время создания, секунды Unix.
+    """
+
+    ids: np.ndarray
+    like_counts: np.ndarray
+    created_at: np.ndarray
+
+    @classmethod
+    def from_tweets(cls, tweets: Iterable[Tweet], like_counts: Optional[Sequence[int]] = None) -> "Candidates":
+        """
+        Собирает массивы кандидатов из загруженных твитов.
+
+        :param tweets: Твиты с загруженными лайками или записи ``FeedTweetRecord``.
+        :param like_counts: Количество лайков твитов, если лайки не загружены (обязательно для записей).
+        :return: Кандидаты.
+        """
+        tweets = list(tweets)
+        count: int = len(tweets)
+        if like_counts is None:
+            like_counts = [len(tweet.likes) for tweet in tweets]
+        return cls(
+            ids=np.fromiter((tweet.id for tweet in tweets), dtype=np.int64, count=count),
+            like_counts=np.fromiter(like_counts, dtype=np.int64, count=count),
+            created_at=np.fromiter(
+                (tweet.created_at.timestamp() if tweet.created_at else 0.0 for tweet in tweets),
+                dtype=np.float64,
+                count=count,
+            ),
+        )
+
+
+class Ranker(ABC):
+    """Базовый ранжировщик: чем больше оценка, тем выше твит в ленте."""
+
+    name: str
+
+    @abstractmethod
+    def scores(self, candidates: Candidates) -> np.ndarray:
+        """
+        Считает оценки всех кандидатов.
+
+        :param candidates: Кандидаты.
+        :return: Массив оценок той же длины.
+        """
+
+    def rank(self, candidates: Candidates) -> np.ndarray:
+        """
+        Возвращает порядок кандидатов по убыванию оценки.
+
+        Сортировка устойчивая: при равных оценках сохраняется исходный порядок.
+
+        :param candidates: Кандидаты.
+        :return: Индексы кандидатов в порядке ленты.
+        """
+        return np.argsort(-self.scores(candidates), kind="stable")
+
+
+class PopularityRanker(Ranker):
+    """Сортировка по количеству лайков."""
+
+    name: str = "popularity"
+
+    def scores(self, candidates: Candidates) -> np.ndarray:
+        """
+        Оценка - количество лайков.
+
+        :param candidates: Кандидаты.
+        :return: Массив оценок.
+        """
+        return candidates.like_counts
+
+
+class RecentRanker(Ranker):
+    """Обратный хронологический порядок."""
+
+    name: str = "recent"
+
+    def scores(self, candidates: Candidates) -> np.ndarray:
+        """
+        Оценка - время создания.
+
+        :param candidates: Кандидаты.
+        :return: Массив оценок.
+        """
+        return candidates.created_at
+
+    def rank(self, candidates: Candidates) -> np.ndarray:
+        """
+        Сортирует по времени создания, а твиты одной транзакции - по id.
+
+        :param candidates: Кандидаты.
+        :return: Индексы кандидатов в порядке ленты.
+        """
+        return np.lexsort((-candidates.ids, -candidates.created_at))
+
+
+class EngagementRanker(Ranker):
+    """
+    Вовлечённость с затуханием по времени: ``(лайки + 1) / (возраст в часах + 2) ** gravity``.
+
+    :param gravity: Скорость затухания: чем больше, тем быстрее старые твиты опускаются.
+    :param now: Текущее время, секунды Unix (по умолчанию - время вызова).
+    """
+
+    name: str = "engagement"
+
+    def __init__(self, gravity: float = ENGAGEMENT_GRAVITY, now: Optional[float] = None):
+        self.gravity = gravity
+        self.now = now
+
+    def scores(self, candidates: Candidates) -> np.ndarray:
+        """
+        Оценка - вовлечённость с затуханием по времени.
+
+        :param candidates: Кандидаты.
+        :return: Массив оценок.
+        """
+        now: float = time.time() if self.now is None else self.now
+        age_hours: np.ndarray = np.maximum(now - candidates.created_at, 0.0) / 3600
+        return (candidates.like_counts + 1) / np.power(age_hours + 2, self.gravity)
+
+
+RANKERS: Dict[str, Ranker] = {
+    ranker.name: ranker
+    for ranker in (PopularityRanker(), RecentRanker(), EngagementRanker())
+}
+
+
+def get_ranker(name: str) -> Ranker:
+    """
+    Возвращает ранжировщик по имени.
+
+    :param name: Имя ранжировщика.
+    :return: Ранжировщик.
+    :raises CustomException: Если ранжировщика с таким именем нет (400).
+    """
+    ranker: Optional[Ranker] = RANKERS.get(name)
+    if ranker is None:
+        raise CustomException(
+            status_code=400,
+            detail=f"Unknown ranking '{name}', expected one of: {', '.join(RANKERS)}",
+        )
+    return ranker
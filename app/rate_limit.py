@@ -0,0 +1,266 @@
+"""Модуль ограничения нагрузки на API.
+
+Каждый запрос к ``/api`` относится к классу маршрутов (чтение, запись, загрузка медиа).
+Для пары (клиент, класс маршрутов) ведётся token bucket, а общее число одновременно
+обрабатываемых запросов ограничено ёмкостью пула соединений. Лишние запросы получают
+429/503 с заголовком ``Retry-After`` сразу, а не ждут свободного соединения в пуле.
+
+Клиент определяется по API-ключу, только если ключ уже прошёл проверку ``check_api_key``;
+запросы с неизвестным ключом учитываются по адресу клиента. Иначе перебор случайных ключей
+получал бы новое ведро на каждый запрос и вытеснял вёдра настоящих пользователей.
+"""
+
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+from fastapi.responses import JSONResponse
+
+from app.database import DB_MAX_OVERFLOW, DB_POOL_SIZE, statement_timeout_ms
+
+
+class BucketConfig(NamedTuple):
+    """
+    Параметры token bucket.
+
+    :param rate: Скорость пополнения, токенов в секунду.
+    :param burst: Ёмкость ведра (максимальный всплеск запросов).
+    """
+
+    rate: float
+    burst: int
+
+
+def parse_limit(limit: str) -> BucketConfig:
+    """
+    Разбирает лимит из строки вида ``"<токенов в секунду>,<ёмкость>"``.
+
+    :param limit: Строка лимита, например ``"10,20"``.
+    :return: Параметры token bucket.
+    """
+    rate, burst = limit.split(",")
+    return BucketConfig(rate=float(rate), burst=int(burst))
+
+
+RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+ROUTE_LIMITS: Dict[str, BucketConfig] = {
+    "read": parse_limit(os.getenv("RATE_LIMIT_READ", "50,100")),
+    "write": parse_limit(os.getenv("RATE_LIMIT_WRITE", "10,20")),
+    "media": parse_limit(os.getenv("RATE_LIMIT_MEDIA", "2,10")),
+    "upload": parse_limit(os.getenv("RATE_LIMIT_UPLOAD", "20,40")),
+}
+STATEMENT_TIMEOUTS_MS: Dict[str, int] = {
+    "read": int(os.getenv("STATEMENT_TIMEOUT_READ_MS", "2000")),
+    "write": int(os.getenv("STATEMENT_TIMEOUT_WRITE_MS", "5000")),
+    "media": int(os.getenv("STATEMENT_TIMEOUT_MEDIA_MS", "5000")),
+    "upload": int(os.getenv("STATEMENT_TIMEOUT_UPLOAD_MS", "5000")),
+}
+# Классы, запросы которых долго принимают тело, не занимая соединение с базой данных
+# (части возобновляемой загрузки): они не учитываются в MAX_CONCURRENT_REQUESTS.
+STREAMING_CLASSES: frozenset = frozenset({"upload"})
+MAX_CONCURRENT_REQUESTS: int = int(os.getenv("MAX_CONCURRENT_REQUESTS", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+RATE_LIMIT_KNOWN_KEYS: int = int(os.getenv("RATE_LIMIT_KNOWN_KEYS", "10000"))
+
+
+class RateLimitBackend(ABC):
+    """Хранилище состояния token bucket. Реализация может быть общей для нескольких процессов."""
+
+    @abstractmethod
+    async def acquire(self, key: str, limit: BucketConfig) -> float:
+        """
+        Пытается забрать один токен из ведра ``key``.
+
+        :param key: Ключ ведра.
+        :param limit: Параметры ведра.
+        :return: 0, если токен получен, иначе сколько секунд ждать следующего токена.
+        """
+
+
+class InMemoryBackend(RateLimitBackend):
+    """
+    Хранилище token bucket в памяти процесса.
+
+    Хранит не больше ``max_keys`` вёдер: давно не использованные вытесняются,
+    поэтому поток запросов со случайными ключами не раздувает память.
+
+    :param max_keys: Максимальное количество вёдер.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def acquire(self, key: str, limit: BucketConfig) -> float:
+        """
+        Пытается забрать один токен из ведра ``key``.
+
+        :param key: Ключ ведра.
+        :param limit: Параметры ведра.
+        :return: 0, если токен получен, иначе сколько секунд ждать следующего токена.
+        """
+        now: float = time.monotonic()
+        bucket: Optional[tuple[float, float]] = self._buckets.pop(key, None)
+        tokens: float = limit.burst if bucket is None else min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.popitem(last=False)
+
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            return 0.0
+
+        self._buckets[key] = (tokens, now)
+        return (1 - tokens) / limit.rate
+
+
+class KnownApiKeys:
+    """
+    API-ключи, прошедшие проверку, в порядке последнего использования.
+
+    Хранит не больше ``max_keys`` ключей: давно не использованные вытесняются.
+
+    :param max_keys: Максимальное количество ключей.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_KNOWN_KEYS):
+        self.max_keys = max_keys
+        self._keys: OrderedDict[str, None] = OrderedDict()
+
+    def add(self, api_key: str) -> None:
+        """
+        Запоминает действительный API-ключ.
+
+        :param api_key: API-ключ.
+        """
+        self._keys[api_key] = None
+        self._keys.move_to_end(api_key)
+        if len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+
+    def __contains__(self, api_key: str) -> bool:
+        """
+        Проверяет, прошёл ли ключ проверку.
+
+        :param api_key: API-ключ.
+        :return: True, если ключ известен.
+        """
+        if api_key not in self._keys:
+            return False
+        self._keys.move_to_end(api_key)
+        return True
+
+
+known_api_keys: KnownApiKeys = KnownApiKeys()
+
+
+def route_class(method: str, path: str) -> str:
+    """
+    Определяет класс маршрута запроса.
+
+    :param method: HTTP-метод.
+    :param path: Путь запроса.
+    :return: ``"upload"``, ``"media"``, ``"read"`` или ``"write"``.
+    """
+    if path.startswith("/api/medias/uploads/") and method in {"PATCH", "HEAD"}:
+        return "upload"
+    if path.startswith("/api/medias") and method != "GET":
+        return "media"
+    if method in {"GET", "HEAD", "OPTIONS"}:
+        return "read"
+    return "write"
+
+
+def _error_response(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error_type": "CustomException", "error_message": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class RateLimitMiddleware:
+    """
+    ASGI-middleware контроля допуска запросов к ``/api``.
+
+    :param app: Оборачиваемое ASGI-приложение.
+    :param backend: Хранилище token bucket.
+    :param limits: Лимиты по классам маршрутов.
+    :param max_concurrent: Максимальное число одновременно обрабатываемых запросов.
+    :param statement_timeouts: Таймауты SQL-запросов по классам маршрутов в миллисекундах (0 - без таймаута).
+    :param enabled: Включено ли ограничение по token bucket.
+    :param known_keys: API-ключи, прошедшие проверку (по умолчанию - общие для процесса).
+    """
+
+    def __init__(
+        self,
+        app,
+        backend: Optional[RateLimitBackend] = None,
+        limits: Optional[Dict[str, BucketConfig]] = None,
+        max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+        statement_timeouts: Optional[Dict[str, int]] = None,
+        enabled: bool = RATE_LIMIT_ENABLED,
+        known_keys: Optional[KnownApiKeys] = None,
+    ):
+        self.app = app
+        self.backend = backend or InMemoryBackend()
+        self.limits = ROUTE_LIMITS if limits is None else limits
+        self.max_concurrent = max_concurrent
+        self.statement_timeouts = STATEMENT_TIMEOUTS_MS if statement_timeouts is None else statement_timeouts
+        self.enabled = enabled
+        self.known_keys = known_api_keys if known_keys is None else known_keys
+        self.in_flight: int = 0
+
+    async def __call__(self, scope, receive, send) -> None:
+        """
+        Пропускает запрос дальше или сразу отвечает 429/503.
+
+        :param scope: ASGI scope.
+        :param receive: ASGI receive.
+        :param send: ASGI send.
+        """
+        if scope["type"] != "http" or not scope["path"].startswith("/api"):
+            await self.app(scope, receive, send)
+            return
+
+        request_class: str = route_class(scope["method"], scope["path"])
+
+        if self.enabled and request_class in self.limits:
+            wait: float = await self.backend.acquire(
+                f"{self._client_key(scope)}:{request_class}",
+                self.limits[request_class],
+            )
+            if wait > 0:
+                await _error_response(429, "Too many requests", wait)(scope, receive, send)
+                return
+
+        counted: bool = request_class not in STREAMING_CLASSES
+        if counted and self.in_flight >= self.max_concurrent:
+            await _error_response(503, "Server is overloaded", 1)(scope, receive, send)
+            return
+
+        self.in_flight += 1 if counted else 0
+        token = statement_timeout_ms.set(self.statement_timeouts.get(request_class) or None)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            statement_timeout_ms.reset(token)
+            self.in_flight -= 1 if counted else 0
+
+    def _client_key(self, scope) -> str:
+        """
+        Возвращает ключ клиента: проверенный API-ключ, а без него - адрес клиента.
+
+        За прокси адрес клиента подставляет uvicorn (``--proxy-headers --forwarded-allow-ips``),
+        иначе все клиенты прокси делили бы одно ведро.
+
+        :param scope: ASGI scope.
+        :return: Ключ клиента.
+        """
+        for name, value in scope["headers"]:
+            if name == b"api-key" and value.decode("latin-1") in self.known_keys:
+                return f"key:{value.decode('latin-1')}"
+        client = scope.get("client")
+        return f"ip:{client[0] if client else ''}"
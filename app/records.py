@@ -0,0 +1,189 @@
+"""Модуль лёгкого пути чтения ленты и профиля.
+
+Лента и профиль читаются запросами SQLAlchemy Core, которые выбирают только нужные
+колонки, в компактные записи ``NamedTuple`` вместо объектов ORM: без identity map,
+коллекций связей и ``to_json`` по ``__table__.columns``. Ответ собирается прямо из записей.
+Запросы не зависят от списка id твитов, поэтому число параметров не растёт вместе с лентой.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import String, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.selectable import CompoundSelect
+
+from app.models import Follower, Like, Tweet, User
+
+# Лайки твита без лайков в режиме ленты full.
+NO_LIKES: Dict[str, Any] = {"likes": []}
+
+
+class FeedTweetRecord(NamedTuple):
+    """
+    Твит ленты.
+
+    :param id: ID твита.
+    :param content: Текст твита.
+    :param media_ids: ID медиафайлов твита.
+    :param created_at: Время создания твита.
+    :param author_id: ID автора.
+    :param author_name: Имя автора.
+    """
+
+    id: int
+    content: str
+    media_ids: Optional[List[int]]
+    created_at: datetime
+    author_id: int
+    author_name: str
+
+
+class ProfileRecord(NamedTuple):
+    """
+    Строка профиля: сам пользователь, подписчик или пользователь, на которого он подписан.
+
+    :param relation: ``user``, ``followers`` или ``following``.
+    :param id: ID пользователя.
+    :param name: Имя пользователя.
+    """
+
+    relation: str
+    id: int
+    name: str
+
+
+def feed_tweets_query(user_id: int) -> Select:
+    """
+    Запрос твитов пользователей, на которых подписан пользователь, с их авторами.
+
+    :param user_id: ID пользователя, для которого собирается лента.
+    :return: Запрос SQLAlchemy.
+    """
+    return (
+        select(Tweet.id, Tweet.tweet_data, Tweet.tweet_media_ids, Tweet.created_at, User.id, User.name).
+        join(User, User.id == Tweet.user_id).
+        join(Follower, Follower.followed_id == Tweet.user_id).
+        where(Follower.follower_id == user_id).
+        order_by(Tweet.id)
+    )
+
+
+def feed_likes_query(user_id: int) -> Select:
+    """
+    Запрос лайков твитов ленты с именами лайкнувших в порядке их установки.
+
+    :param user_id: ID пользователя, для которого собирается лента.
+    :return: Запрос SQLAlchemy.
+    """
+    return (
+        select(Like.tweet_id, Like.user_id, User.name).
+        join(User, User.id == Like.user_id).
+        join(Tweet, Tweet.id == Like.tweet_id).
+        join(Follower, Follower.followed_id == Tweet.user_id).
+        where(Follower.follower_id == user_id).
+        order_by(Like.tweet_id, Like.id)
+    )
+
+
+def profile_query(user_id: int) -> CompoundSelect:
+    """
+    Запрос пользователя, его подписчиков и подписок одним обращением к базе данных.
+
+    :param user_id: ID пользователя.
+    :return: Запрос SQLAlchemy.
+    """
+    return union_all(
+        select(literal("user", String).label("relation"), User.id, User.name).
+        where(User.id == user_id),
+        select(literal("followers", String), User.id, User.name).
+        join(Follower, Follower.follower_id == User.id).
+        where(Follower.followed_id == user_id),
+        select(literal("following", String), User.id, User.name).
+        join(Follower, Follower.followed_id == User.id).
+        where(Follower.follower_id == user_id),
+    ).order_by("relation", "id")
+
+
+async def get_feed_tweets(session: AsyncSession, user_id: int) -> List[FeedTweetRecord]:
+    """
+    Читает твиты ленты пользователя.
+
+    :param session: Сессия базы данных.
+    :param user_id: ID пользователя, для которого собирается лента.
+    :return: Твиты ленты в порядке id.
+    """
+    result = await session.execute(feed_tweets_query(user_id))
+    return [FeedTweetRecord._make(row) for row in result]
+
+
+async def get_feed_likes(session: AsyncSession, user_id: int) -> Dict[int, Dict[str, Any]]:
+    """
+    Читает лайки твитов ленты пользователя.
+
+    :param session: Сессия базы данных.
+    :param user_id: ID пользователя, для которого собирается лента.
+    :return: Словарь ID твита -> {"likes": [...]}; твитов без лайков в нём нет.
+    """
+    likes: Dict[int, Dict[str, Any]] = {}
+    result = await session.execute(feed_likes_query(user_id))
+    for tweet_id, liker_id, name in result:
+        likes.setdefault(tweet_id, {"likes": []})["likes"].append({"user_id": liker_id, "name": name})
+    return likes
+
+
+async def get_profile(session: AsyncSession, user_id: int) -> List[ProfileRecord]:
+    """
+    Читает профиль пользователя.
+
+    :param session: Сессия базы данных.
+    :param user_id: ID пользователя.
+    :return: Строки профиля; пустой список, если пользователя нет.
+    """
+    result = await session.execute(profile_query(user_id))
+    return [ProfileRecord._make(row) for row in result]
+
+
+def feed_response(
+    tweets: Iterable[FeedTweetRecord],
+    media_dict: Dict[int, Any],
+    like_data: Dict[int, Dict[str, Any]],
+    no_likes: Dict[str, Any] = NO_LIKES,
+) -> List[Dict[str, Any]]:
+    """
+    Формирует ответ на запрос ленты из записей.
+
+    :param tweets: Твиты ленты в порядке ответа.
+    :param media_dict: Словарь медиафайлов.
+    :param like_data: Лайки твитов: из ``get_feed_likes`` или сводки из ``utils.get_like_summaries``.
+    :param no_likes: Значение для твитов, которых нет в ``like_data``.
+    :return: Список твитов.
+    """
+    return [
+        {
+            "id": tweet.id,
+            "content": tweet.content,
+            "attachments": [media_dict.get(media_id) for media_id in tweet.media_ids] if tweet.media_ids else [],
+            "author": {"id": tweet.author_id, "name": tweet.author_name},
+            **like_data.get(tweet.id, no_likes),
+        }
+        for tweet in tweets
+    ]
+
+
+def profile_response(records: Iterable[ProfileRecord]) -> Dict[str, Any]:
+    """
+    Формирует ответ на запрос профиля из записей.
+
+    :param records: Строки профиля из ``get_profile``.
+    :return: Данные профиля: {"result", "user", "followers", "following"}.
+    """
+    profile: Dict[str, Any] = {"result": True, "user": None, "followers": [], "following": []}
+    for relation, user_id, name in records:
+        author: Dict[str, Any] = {"id": user_id, "name": name}
+        if relation == "user":
+            profile["user"] = author
+        else:
+            profile[relation].append(author)
+    return profile
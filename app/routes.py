@@ -1,17 +1,37 @@
 """Модуль, содержащий определения маршрутов для приложения."""
 
-from os import path
+from os import path, remove
 from pathlib import Path
-from uuid import uuid4
+from typing import Optional, Union
+from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, File, UploadFile
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from fastapi import APIRouter, Depends, File, Header, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app import utils
+from app import changes, idempotency, invalidation, jobs, notifications, records, uploads, utils
+from app.coalesce import read_flight
 from app.database import async_session
-from app.models import Follower, Like, Media, Tweet, User
-from app.schemas import MediaOut, OperationOut, TweetIn, TweetOut, TweetsOut, UserProfileOut
+from app.metrics import metrics
+from app.ranking import DEFAULT_RANKER, Candidates, Ranker, get_ranker
+from app.models import Follower, Like, Media, MediaUpload, Tweet, User
+from app.schemas import (
+    LikesOut,
+    MediaOut,
+    MediaUploadIn,
+    MediaUploadOut,
+    NotificationsOut,
+    OperationOut,
+    ThreadOut,
+    TweetChangesOut,
+    TweetIn,
+    TweetOut,
+    TweetsOut,
+    TweetsSummaryOut,
+    UserProfileOut,
+)
 
 STATIC_PATH: Path = Path(__file__).parent.parent / "static"
 UPLOAD_DIR: str = "static/images"
@@ -23,31 +43,64 @@ router: APIRouter = APIRouter(
 
 
 @router.post("/tweets", status_code=201, response_model=TweetOut)
-async def add_tweet(tweet_data: TweetIn, user: User = Depends(utils.check_api_key)):
+async def add_tweet(
+    tweet_data: TweetIn,
+    idempotency_key: Optional[str] = Header(None),
+    user: User = Depends(utils.check_api_key),
+):
     """
-    Добавление нового твита.
+    Добавление нового твита или ответа на твит (reply_to).
+
+    Повтор запроса с тем же заголовком Idempotency-Key возвращает ответ первого запроса
+    и не создаёт второй твит.
 
     :param tweet_data: Данные нового твита.
+    :param idempotency_key: Ключ идемпотентности запроса.
     :param user: Пользователь, добавляющий твит (проверенный с помощью API-ключа).
-    :raises CustomException: Если данные твита неверны (400).
+    :raises CustomException: Если данные твита неверны или его медиа не найдены (400),
+        или твит, на который отвечают, не найден (404).
     :return: Информация о добавленном твите.
     """
     if not tweet_data:
         raise utils.CustomException(status_code=400, detail="Invalid tweet data")
 
+    return await idempotency.idempotent(
+        idempotency_key,
+        user.id,
+        "POST /api/tweets",
+        idempotency.fingerprint(tweet_data.json(sort_keys=True).encode()),
+        201,
+        lambda session: create_tweet(session, tweet_data, user),
+    )
+
+
+async def create_tweet(session: AsyncSession, tweet_data: TweetIn, user: User) -> TweetOut:
+    """
+    Сохраняет новый твит.
+
+    :param session: Сессия с открытой транзакцией.
+    :param tweet_data: Данные нового твита.
+    :param user: Пользователь, добавляющий твит.
+    :raises CustomException: Если медиа твита не найдены (400) или твит, на который отвечают, не найден (404).
+    :return: Информация о добавленном твите.
+    """
+    if tweet_data.tweet_media_ids:
+        await utils.check_media_exist(session, tweet_data.tweet_media_ids)
+
     tweet: Tweet = Tweet(
         tweet_data=tweet_data.tweet_data,
         tweet_media_ids=tweet_data.tweet_media_ids,
         user_id=user.id,
     )
 
-    async with async_session() as session:
-        async with session.begin():
-            session.add(tweet)
-            await session.flush()
-            tweet_id = tweet.id if tweet else None
+    # id нужен до вставки: он входит в путь твита в обсуждении.
+    tweet.id = await session.scalar(select(func.nextval("tweet_id_seq")))
+    tweet.conversation_id, tweet.path = await utils.thread_position(session, tweet.id, tweet_data.reply_to)
+    session.add(tweet)
+    await session.flush()
+    await changes.record_change(session, user.id, "created", tweet.id)
 
-    return TweetOut(result=True, id=tweet_id)
+    return TweetOut(result=True, id=tweet.id)
 
 
 @router.delete("/tweets/{tweet_id}", status_code=202, response_model=OperationOut)
@@ -55,6 +108,8 @@ async def delete_tweet(tweet_id: int, user: User = Depends(utils.check_api_key))
     """
     Удаление твита по его идентификатору.
 
+    Медиафайлы твита удаляет фоновая задача media.delete, поставленная в той же транзакции.
+
     :param tweet_id: id удаляемого твита.
     :param user: Пользователь, удаляющий твит (проверенный с помощью API-ключа).
     :raises CustomException: Если твит не принадлежит текущему пользователю (403).
@@ -67,12 +122,84 @@ async def delete_tweet(tweet_id: int, user: User = Depends(utils.check_api_key))
             if tweet.user_id != user.id:
                 raise utils.CustomException(status_code=403, detail="You are not allowed to delete this tweet")
 
-            await session.delete(tweet)
+            for query in utils.tweet_delete_queries(tweet_id, user.id):
+                await session.execute(query)
+            await changes.record_change(session, user.id, "deleted", tweet_id)
+            if tweet.tweet_media_ids:
+                await jobs.enqueue(session, "media.delete", {"media_ids": tweet.tweet_media_ids})
             await session.commit()
 
     return OperationOut(result=True)
 
 
+@router.get("/tweets/changes", response_model=TweetChangesOut)
+async def get_feed_changes(since: Optional[int] = Query(None, ge=0), user: User = Depends(utils.check_api_key)):
+    """
+    Изменения ленты с прошлой синхронизации: новые твиты, id удалённых и новые счётчики лайков.
+
+    Клиент передаёт watermark из предыдущего ответа. Если в ответе reset=true (нет since,
+    изменились подписки или изменений слишком много), ленту нужно загрузить заново
+    через GET /api/tweets и продолжить с нового watermark.
+
+    :param since: Водяной знак прошлой синхронизации
+    :param user: Пользователь, синхронизирующий ленту (проверенный с помощью API-ключа)
+    :return: Изменения ленты и новый водяной знак
+    """
+    async with async_session() as session:
+        async with session.begin():
+            return await changes.get_changes(session, user.id, since)
+
+
+@router.get("/tweets/{tweet_id}/thread", response_model=ThreadOut)
+async def get_thread(
+    tweet_id: int,
+    max_depth: Optional[int] = Query(None, ge=0),
+    limit: int = Query(utils.THREAD_PAGE_SIZE, ge=1, le=utils.THREAD_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: User = Depends(utils.check_api_key),
+):
+    """
+    Ветка обсуждения: твит и все ответы на него в порядке обхода дерева в глубину.
+
+    Для всего обсуждения запрашивается корневой твит (conversation_id в ответе).
+
+    :param tweet_id: id твита, с которого начинается ветка
+    :param max_depth: Максимальная глубина ответов относительно твита
+    :param limit: Размер страницы
+    :param cursor: Курсор следующей страницы из предыдущего ответа
+    :param user: Пользователь, запрашивающий обсуждение (проверенный с помощью API-ключа)
+    :raises CustomException: Если твит не найден (404) или курсор некорректен (400)
+    :return: Страница ветки обсуждения и курсор следующей страницы
+    """
+    after: Optional[list] = utils.parse_thread_cursor(cursor) if cursor is not None else None
+
+    async with async_session() as session:
+        async with session.begin():
+            position = (await session.execute(utils.tweet_path_query(tweet_id))).one_or_none()
+            if position is None:
+                raise utils.CustomException(status_code=404, detail="Tweet not found")
+
+            _, conversation_id, path = position
+            if path is None:
+                conversation_id, path = tweet_id, [tweet_id]
+
+            tweets = (
+                await session.execute(utils.thread_query(conversation_id, path, limit, max_depth, after))
+            ).scalars().all()
+            media_dict: dict = await utils.get_media_names(
+                session,
+                (media_id for tweet in tweets for media_id in tweet.tweet_media_ids or ()),
+            )
+            tweets_data = await utils.thread_response(media_dict=media_dict, tweets=tweets)
+
+    return ThreadOut(
+        result=True,
+        conversation_id=conversation_id,
+        tweets=tweets_data,
+        next_cursor=".".join(map(str, tweets[-1].path)) if len(tweets) == limit else None,
+    )
+
+
 @router.post("/tweets/{tweet_id}/likes", status_code=201, response_model=OperationOut)
 async def add_like(tweet_id: int, user: User = Depends(utils.check_api_key)):
     """
@@ -85,18 +212,57 @@ async def add_like(tweet_id: int, user: User = Depends(utils.check_api_key)):
     """
     async with async_session() as session:
         async with session.begin():
-            await utils.check_tweet_exist(session=session, check_id=tweet_id)
+            tweet: Tweet = await utils.check_tweet_exist(session=session, check_id=tweet_id)
 
             if await utils.check_like_exist(session=session, tweet_id=tweet_id, user_id=user.id):
                 raise utils.CustomException(status_code=400, detail="Like already exists!")
 
             like: Like = Like(tweet_id=tweet_id, user_id=user.id)
             session.add(like)
-            await session.flush()
+
+            try:
+                await session.flush()
+            except IntegrityError:
+                # Параллельный запрос успел поставить тот же лайк (уникальный индекс likes(tweet_id, user_id)).
+                raise utils.CustomException(status_code=400, detail="Like already exists!")
+
+            await notifications.record_event(session, tweet.user_id, "like", user.id, tweet_id=tweet_id)
+            await changes.record_change(session, tweet.user_id, "likes", tweet_id)
 
     return OperationOut(result=True)
 
 
+@router.get("/tweets/{tweet_id}/likes", response_model=LikesOut)
+async def get_likes(
+    tweet_id: int,
+    limit: int = Query(utils.LIKES_PAGE_SIZE, ge=1, le=utils.LIKES_MAX_PAGE_SIZE),
+    cursor: int = Query(0, ge=0),
+    user: User = Depends(utils.check_api_key),
+):
+    """
+    Список пользователей, лайкнувших твит, в порядке установки лайков.
+
+    :param tweet_id: id твита
+    :param limit: Размер страницы
+    :param cursor: Курсор следующей страницы из предыдущего ответа
+    :param user: Пользователь, запрашивающий лайки (проверенный с помощью API-ключа)
+    :raises CustomException: Если твит не найден (404)
+    :return: Страница лайков и курсор следующей страницы
+    """
+    async with async_session() as session:
+        async with session.begin():
+            if (await session.execute(utils.tweet_query(tweet_id))).scalar_one_or_none() is None:
+                raise utils.CustomException(status_code=404, detail="Tweet not found")
+
+            rows = (await session.execute(utils.likes_page_query(tweet_id, limit, cursor))).all()
+
+    return LikesOut(
+        result=True,
+        likes=[{"user_id": liker_id, "name": name} for _, liker_id, name in rows],
+        next_cursor=rows[-1][0] if len(rows) == limit else None,
+    )
+
+
 @router.delete("/tweets/{tweet_id}/likes", status_code=202, response_model=OperationOut)
 async def delete_like(tweet_id: int, user: User = Depends(utils.check_api_key)):
     """
@@ -109,14 +275,15 @@ async def delete_like(tweet_id: int, user: User = Depends(utils.check_api_key)):
     """
     async with async_session() as session:
         async with session.begin():
-            await utils.check_tweet_exist(session=session, check_id=tweet_id)
+            tweet: Tweet = await utils.check_tweet_exist(session=session, check_id=tweet_id)
 
             unlike = await utils.check_like_exist(session=session, tweet_id=tweet_id, user_id=user.id)
 
             if not unlike:
                 raise utils.CustomException(status_code=404, detail="Like not found")
 
-            await session.delete(unlike)
+            await session.execute(utils.like_delete_query(tweet_id, user.id))
+            await changes.record_change(session, tweet.user_id, "likes", tweet_id)
             await session.commit()
 
     return OperationOut(result=True)
@@ -147,6 +314,9 @@ async def add_follow(follow_id: int, user: User = Depends(utils.check_api_key)):
             follow: Follower = Follower(follower_id=user.id, followed_id=follow_id)
             session.add(follow)
             await session.flush()
+            await notifications.record_event(session, follow_id, "follow", user.id)
+            await changes.record_change(session, user.id, "feed")
+            await invalidation.publish(session, "profile", [user.id, follow_id])
 
     return OperationOut(result=True)
 
@@ -169,46 +339,80 @@ async def delete_follow(follow_id: int, user: User = Depends(utils.check_api_key
                 raise utils.CustomException(status_code=404, detail="Follow not found")
 
             await session.delete(unfollow)
+            await changes.record_change(session, user.id, "feed")
+            await invalidation.publish(session, "profile", [user.id, follow_id])
             await session.commit()
 
     return OperationOut(result=True)
 
 
-@router.get("/tweets", response_model=TweetsOut)
-async def get_user_tweets(user: User = Depends(utils.check_api_key)):
+@router.get("/tweets", response_model=Union[TweetsSummaryOut, TweetsOut])
+async def get_user_tweets(
+    ranking: str = DEFAULT_RANKER,
+    likes: str = "full",
+    user: User = Depends(utils.check_api_key),
+):
     """
-    Пользователь может получить ленту из твитов отсортированных в порядке убывания.
+    Пользователь может получить ленту из твитов от пользователей, которых он фоловит.
 
-    По популярности от пользователей, которых он фоловит.
+    Порядок задаёт ранжировщик: popularity (по убыванию популярности, по умолчанию),
+    recent (сначала новые) или engagement (популярность с затуханием по времени).
+    С likes=summary вместо всех лайкнувших каждый твит содержит like_count, первых
+    лайкнувших и liked_by_me; полный список отдаёт GET /api/tweets/{id}/likes.
+    Параллельные запросы ленты одного пользователя разделяют одно чтение из базы данных.
 
+    :param ranking: Имя ранжировщика ленты
+    :param likes: Режим лайков: full (все лайкнувшие, по умолчанию) или summary
     :param user: Пользователь, добавляющий твит (проверенный с помощью API-ключа)
+    :raises CustomException: Если ранжировщик или режим лайков неизвестен (400)
     :return: Информация о ленте твитов текущего пользователя
     """
-    async with async_session() as session:
-        async with session.begin():
-            try:
-                followed_users = (
-                    await session.execute(
-                        select(User).
-                        join(Follower, User.id == Follower.followed_id).
-                        filter(Follower.follower_id == user.id).
-                        options(selectinload(User.tweets).selectinload(Tweet.likes).selectinload(Like.user))
-                    )
-                )
-            except utils.CustomException as ce:
-                return {"result": False, "error_type": "CustomException", "error_message": ce.detail}
-
-            followed_users = followed_users.all()
-
-            tweets: list = [tweet for followed_user in followed_users for tweet in followed_user[0].tweets]
-            sorted_tweets: list = sorted(tweets, key=lambda tweet: len(tweet.likes), reverse=True)
+    ranker: Ranker = get_ranker(ranking)
+    if likes not in utils.FEED_LIKES_MODES:
+        raise utils.CustomException(
+            status_code=400,
+            detail=f"Unknown likes mode '{likes}', expected one of: {', '.join(utils.FEED_LIKES_MODES)}",
+        )
+
+    summary: bool = likes == "summary"
+    return await read_flight.do(
+        ("feed", user.id, ranker.name, likes),
+        lambda: load_user_tweets(user.id, ranker, summary=summary),
+    )
 
-            media_data = await session.execute(select(Media))
-            media_data = media_data.all()
-            media_dict: dict = {media[0].id: media[0].file_name for media in media_data}
 
-            tweets_data = await utils.tweet_response(media_dict=media_dict, tweets=sorted_tweets)
+async def load_user_tweets(user_id: int, ranker: Ranker, summary: bool = False):
+    """
+    Читает ленту пользователя из базы данных.
 
+    :param user_id: id пользователя, для которого собирается лента
+    :param ranker: Ранжировщик ленты
+    :param summary: Отдать сводки лайков вместо всех лайкнувших
+    :return: Информация о ленте твитов пользователя
+    """
+    async with async_session() as session:
+        async with session.begin():
+            tweets: list = await records.get_feed_tweets(session, user_id)
+            if summary:
+                like_data: dict = await utils.get_like_summaries(session, [tweet.id for tweet in tweets], user_id)
+                no_likes: dict = utils.EMPTY_LIKE_SUMMARY
+                like_counts: list = [like_data.get(tweet.id, no_likes)["like_count"] for tweet in tweets]
+            else:
+                like_data = await records.get_feed_likes(session, user_id)
+                no_likes = records.NO_LIKES
+                like_counts = [len(like_data.get(tweet.id, no_likes)["likes"]) for tweet in tweets]
+
+            order = ranker.rank(Candidates.from_tweets(tweets, like_counts=like_counts))
+            sorted_tweets: list = [tweets[index] for index in order]
+
+            media_dict: dict = await utils.get_media_names(
+                session,
+                (media_id for tweet in sorted_tweets for media_id in tweet.media_ids or ()),
+            )
+
+    tweets_data: list = records.feed_response(sorted_tweets, media_dict, like_data, no_likes)
+    if summary:
+        return TweetsSummaryOut(result=True, tweets=tweets_data)
     return TweetsOut(result=True, tweets=tweets_data)
 
 
@@ -223,6 +427,44 @@ async def get_user_profile(user: User = Depends(utils.check_api_key)):
     return await utils.get_user_profile_data(user.id)
 
 
+@router.get("/users/me/tweets/export")
+async def export_user_tweets(user: User = Depends(utils.check_api_key)):
+    """
+    Пользователь может выгрузить все свои твиты в формате NDJSON (по одному JSON-объекту на строку).
+
+    :param user: Пользователь, выгружающий твиты (проверенный с помощью API-ключа)
+    :return: Потоковый ответ с твитами пользователя
+    """
+    return StreamingResponse(
+        utils.stream_user_tweets(user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="tweets.ndjson"'},
+    )
+
+
+@router.get("/notifications", response_model=NotificationsOut)
+async def get_notifications(
+    limit: int = Query(notifications.NOTIFICATIONS_PAGE_SIZE, ge=1, le=notifications.NOTIFICATIONS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: User = Depends(utils.check_api_key),
+):
+    """
+    Пользователь может получить свои уведомления о лайках и подписках, от новых к старым.
+
+    События одного вида об одной цели за интервал времени собраны в одно уведомление
+    ("user_2 and 41 others liked your tweet").
+
+    :param limit: Размер страницы
+    :param cursor: Курсор следующей страницы из предыдущего ответа
+    :param user: Пользователь, получающий уведомления (проверенный с помощью API-ключа)
+    :raises CustomException: Если курсор некорректен (400)
+    :return: Страница уведомлений и курсор следующей страницы
+    """
+    async with async_session() as session:
+        async with session.begin():
+            return await notifications.get_notifications(session, user.id, limit, cursor)
+
+
 @router.get("/users/{user_id}", response_model=UserProfileOut)
 async def get_user_by_id(user_id: int, user: User = Depends(utils.check_api_key)):
     """
@@ -236,11 +478,19 @@ async def get_user_by_id(user_id: int, user: User = Depends(utils.check_api_key)
 
 
 @router.post("/medias", status_code=201, response_model=MediaOut)
-async def upload_media(file: UploadFile = File(...), user: User = Depends(utils.check_api_key)):
+async def upload_media(
+    file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None),
+    user: User = Depends(utils.check_api_key),
+):
     """
     Endpoint для загрузки файлов из твита. Загрузка происходит через отправку формы.
 
+    Повтор запроса с тем же заголовком Idempotency-Key возвращает ответ первого запроса
+    и не сохраняет файл второй раз.
+
     :param file: Файл для загрузки в твит
+    :param idempotency_key: Ключ идемпотентности запроса
     :param user: Пользователь, добавляющий файл в твит (проверенный с помощью API-ключа)
     :raises CustomException: Если формат файла некорректный (400)
     :return: Информация об успешном добавлении файла
@@ -248,18 +498,217 @@ async def upload_media(file: UploadFile = File(...), user: User = Depends(utils.
     if not utils.allowed_file(file.filename):
         raise utils.CustomException(status_code=400, detail="Invalid file type")
 
-    unique_filename: str = f"{uuid4()}{path.splitext(file.filename)[1]}"
+    content: bytes = file.file.read()
+
+    return await idempotency.idempotent(
+        idempotency_key,
+        user.id,
+        "POST /api/medias",
+        idempotency.fingerprint(file.filename.encode(), content),
+        201,
+        lambda session: save_media(session, file.filename, content),
+    )
+
+
+async def save_media(session: AsyncSession, filename: str, content: bytes) -> MediaOut:
+    """
+    Сохраняет загруженный файл и запись о нём.
+
+    :param session: Сессия с открытой транзакцией
+    :param filename: Исходное имя файла
+    :param content: Содержимое файла
+    :return: Информация об успешном добавлении файла
+    """
+    unique_filename: str = f"{uuid4()}{path.splitext(filename)[1]}"
     file_path: str = path.join(UPLOAD_DIR, unique_filename)
 
     with open(file_path, "wb") as file_object:
-        file_object.write(file.file.read())
+        file_object.write(content)
+
+    media: Media = Media(file_name=f"/static/images/{unique_filename}")
+    session.add(media)
+    await session.flush()
+
+    return MediaOut(result=True, media_id=media.id)
+
+
+@router.post("/medias/uploads", status_code=201, response_model=MediaUploadOut)
+async def create_media_upload(
+    upload: MediaUploadIn,
+    response: Response,
+    user: User = Depends(utils.check_api_key),
+):
+    """
+    Начало возобновляемой загрузки медиафайла: файл затем передаётся частями через PATCH.
+
+    :param upload: Имя и размер файла
+    :param response: Ответ, в который добавляются заголовки Location и Upload-Offset
+    :param user: Пользователь, загружающий файл (проверенный с помощью API-ключа)
+    :raises CustomException: Если формат файла некорректный (400) или файл слишком большой (413)
+    :return: Состояние загрузки
+    """
+    if not utils.allowed_file(upload.filename):
+        raise utils.CustomException(status_code=400, detail="Invalid file type")
+
+    if upload.length > uploads.MEDIA_UPLOAD_MAX_LENGTH:
+        raise utils.CustomException(
+            status_code=413, detail=f"File is too large, max {uploads.MEDIA_UPLOAD_MAX_LENGTH} bytes",
+        )
+
+    media_upload: MediaUpload = MediaUpload(
+        id=str(uuid4()),
+        user_id=user.id,
+        file_name=upload.filename,
+        upload_length=upload.length,
+        upload_offset=0,
+        expires_at=uploads.expiry(),
+    )
+    uploads.create_temp_file(media_upload.id)
 
     async with async_session() as session:
         async with session.begin():
+            session.add(media_upload)
 
-            media: Media = Media(file_name=f"/static/images/{unique_filename}")
+    response.headers["Location"] = f"/api/medias/uploads/{media_upload.id}"
+    response.headers.update(uploads.offset_headers(media_upload))
+    return uploads.upload_out(media_upload)
 
-            session.add(media)
-            await session.flush()
+
+@router.head("/medias/uploads/{upload_id}")
+async def get_media_upload_offset(upload_id: UUID, user: User = Depends(utils.check_api_key)):
+    """
+    Состояние возобновляемой загрузки: сколько байт уже принято (заголовок Upload-Offset).
+
+    :param upload_id: id загрузки
+    :param user: Пользователь, загружающий файл (проверенный с помощью API-ключа)
+    :raises CustomException: Если загрузка не найдена или истекла (404)
+    :return: Пустой ответ с заголовками Upload-Offset и Upload-Length
+    """
+    async with async_session() as session:
+        async with session.begin():
+            media_upload: MediaUpload = await uploads.get_upload(session, str(upload_id), user.id)
+
+    return Response(headers=uploads.offset_headers(media_upload))
+
+
+@router.patch("/medias/uploads/{upload_id}", response_model=MediaUploadOut)
+async def append_media_upload(
+    upload_id: UUID,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., ge=0),
+    content_type: Optional[str] = Header(None),
+    user: User = Depends(utils.check_api_key),
+):
+    """
+    Передача части файла возобновляемой загрузки, начиная с байта Upload-Offset.
+
+    Тело запроса (Content-Type: application/offset+octet-stream) дописывается к уже принятым
+    байтам. При обрыве соединения принятая часть тела сохраняется.
+
+    :param upload_id: id загрузки
+    :param request: Запрос, тело которого читается потоково
+    :param response: Ответ, в который добавляется заголовок Upload-Offset
+    :param upload_offset: Смещение части: должно совпадать с числом уже принятых байт
+    :param content_type: Тип тела запроса
+    :param user: Пользователь, загружающий файл (проверенный с помощью API-ключа)
+    :raises CustomException: Если загрузка не найдена (404), смещение не совпадает или загрузку
+        дописывает другой запрос (409), часть длиннее оставшегося файла (400) или тип тела неверный (415)
+    :return: Состояние загрузки
+    """
+    if content_type != uploads.UPLOAD_CONTENT_TYPE:
+        raise utils.CustomException(status_code=415, detail=f"Content-Type must be {uploads.UPLOAD_CONTENT_TYPE}")
+
+    with uploads.locked_temp_file(str(upload_id)) as file_object:
+        async with async_session() as session:
+            async with session.begin():
+                media_upload: MediaUpload = await uploads.get_upload(session, str(upload_id), user.id)
+
+        if upload_offset != media_upload.upload_offset:
+            raise utils.CustomException(
+                status_code=409, detail=f"Upload-Offset mismatch, expected {media_upload.upload_offset}",
+            )
+
+        written: int = await uploads.append_chunk(
+            file_object, upload_offset, request.stream(), media_upload.upload_length - upload_offset,
+        )
+
+        async with async_session() as session:
+            async with session.begin():
+                await uploads.save_offset(session, media_upload, upload_offset + written)
+
+    response.headers.update(uploads.offset_headers(media_upload))
+    return uploads.upload_out(media_upload)
+
+
+@router.post("/medias/uploads/{upload_id}/complete", status_code=201, response_model=MediaOut)
+async def complete_media_upload(upload_id: UUID, user: User = Depends(utils.check_api_key)):
+    """
+    Завершение возобновляемой загрузки: принятый файл становится медиафайлом для твита.
+
+    :param upload_id: id загрузки
+    :param user: Пользователь, загружающий файл (проверенный с помощью API-ключа)
+    :raises CustomException: Если загрузка не найдена (404) или принят не весь файл (409)
+    :return: Информация об успешном добавлении файла
+    """
+    with uploads.locked_temp_file(str(upload_id)):
+        published_name: Optional[str] = None
+        try:
+            async with async_session() as session:
+                async with session.begin():
+                    media_upload: MediaUpload = await uploads.get_upload(session, str(upload_id), user.id)
+
+                    if media_upload.upload_offset != media_upload.upload_length:
+                        raise utils.CustomException(
+                            status_code=409,
+                            detail=f"Upload is incomplete: {media_upload.upload_offset} of "
+                                   f"{media_upload.upload_length} bytes received",
+                        )
+
+                    published_name = uploads.published_name(media_upload)
+                    file_name: str = uploads.publish_file(media_upload, UPLOAD_DIR)
+                    media: Media = Media(file_name=f"/static/images/{file_name}")
+                    session.add(media)
+                    await session.delete(media_upload)
+                    await session.flush()
+        except BaseException:
+            # Без строки medias файл остаётся временным: завершение можно повторить.
+            if published_name is not None:
+                uploads.unpublish_file(str(upload_id), published_name, UPLOAD_DIR)
+            raise
 
     return MediaOut(result=True, media_id=media.id)
+
+
+@router.delete("/medias/uploads/{upload_id}", status_code=202, response_model=OperationOut)
+async def delete_media_upload(upload_id: UUID, user: User = Depends(utils.check_api_key)):
+    """
+    Отмена возобновляемой загрузки: принятые байты удаляются.
+
+    :param upload_id: id загрузки
+    :param user: Пользователь, загружающий файл (проверенный с помощью API-ключа)
+    :raises CustomException: Если загрузка не найдена (404)
+    :return: Информация об успешной отмене загрузки
+    """
+    with uploads.locked_temp_file(str(upload_id)):
+        async with async_session() as session:
+            async with session.begin():
+                media_upload: MediaUpload = await uploads.get_upload(session, str(upload_id), user.id)
+                await session.delete(media_upload)
+
+        remove(uploads.temp_path(media_upload.id))
+
+    return OperationOut(result=True)
+
+
+@router.get("/metrics")
+async def get_metrics(user: User = Depends(utils.check_api_key)):
+    """
+    Метрики приложения (счётчики в памяти текущего процесса).
+
+    Доступны только с действительным API-ключом: метрики раскрывают внутренности маршрутов и задач.
+
+    :param user: Пользователь, запрашивающий метрики (проверенный с помощью API-ключа).
+    :return: Словарь имя счётчика -> значение
+    """
+    return metrics.snapshot()
@@ -1,8 +1,9 @@
 """Модуль описания схем ответов."""
 
+from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class OperationOut(BaseModel):
@@ -17,11 +18,28 @@ class MediaOut(OperationOut):
     media_id: int
 
 
+class MediaUploadIn(BaseModel):
+    """Модель данных для начала возобновляемой загрузки медиафайла."""
+
+    filename: str
+    length: int = Field(..., gt=0)
+
+
+class MediaUploadOut(OperationOut):
+    """Модель данных для состояния возобновляемой загрузки медиафайла."""
+
+    upload_id: str
+    offset: int
+    length: int
+    expires_at: datetime
+
+
 class TweetIn(BaseModel):
     """Модель данных для создания твита."""
 
     tweet_data: str
     tweet_media_ids: Optional[List[int]] = []
+    reply_to: Optional[int] = None
 
 
 class TweetOut(OperationOut):
@@ -54,6 +72,62 @@ class Tweet(BaseModel):
     likes: List[Like] = []
 
 
+class TweetSummary(BaseModel):
+    """Модель данных для твита со сводкой лайков вместо полного списка лайкнувших."""
+
+    id: int
+    content: str
+    attachments: List[str] = []
+    author: Author
+    like_count: int
+    likes: List[Like] = []
+    liked_by_me: bool
+
+
+class TweetLikesChange(BaseModel):
+    """Модель данных для изменения лайков твита."""
+
+    id: int
+    like_count: int
+    liked_by_me: bool
+
+
+class TweetChangesOut(OperationOut):
+    """Модель данных для изменений ленты с водяного знака."""
+
+    watermark: int
+    reset: bool = False
+    created: List[TweetSummary] = []
+    deleted: List[int] = []
+    likes: List[TweetLikesChange] = []
+
+
+class ThreadTweet(BaseModel):
+    """Модель данных для твита в ветке обсуждения."""
+
+    id: int
+    content: str
+    attachments: List[str] = []
+    author: Author
+    parent_id: Optional[int] = None
+    depth: int
+
+
+class ThreadOut(OperationOut):
+    """Модель данных для страницы ветки обсуждения."""
+
+    conversation_id: int
+    tweets: List[ThreadTweet]
+    next_cursor: Optional[str] = None
+
+
+class LikesOut(OperationOut):
+    """Модель данных для страницы лайков твита."""
+
+    likes: List[Like]
+    next_cursor: Optional[int] = None
+
+
 class ErrorResponse(BaseModel):
     """Модель данных для ответа с ошибкой."""
 
@@ -67,34 +141,34 @@ class TweetsOut(OperationOut):
     tweets: List[Tweet]
 
 
+class TweetsSummaryOut(OperationOut):
+    """Модель данных для ответа, содержащего список твитов со сводками лайков."""
+
+    tweets: List[TweetSummary]
+
+
+class Notification(BaseModel):
+    """Модель данных для агрегированного уведомления."""
+
+    id: int
+    type: str
+    tweet_id: Optional[int] = None
+    actors: List[Author] = []
+    count: int
+    text: str
+    updated_at: datetime
+
+
+class NotificationsOut(OperationOut):
+    """Модель данных для страницы уведомлений."""
+
+    notifications: List[Notification]
+    next_cursor: Optional[str] = None
+
+
 class UserProfileOut(OperationOut):
     """Модель данных для профиля пользователя."""
 
     user: Author
     followers: Optional[List[Author]] = []
     following: Optional[List[Author]] = []
-
-    @classmethod
-    def from_db_user(cls, user_with_relationships):
-        """
-        Создает объект класса UserProfileOut из объекта пользователя из базы данных.
-
-        :param user_with_relationships: Объект пользователя с отношениями (подписчики и подписки).
-        :return: Объект класса UserProfileOut.
-        """
-        followers = [
-            follower.follower.to_json()
-            for follower in user_with_relationships.followers
-        ] if user_with_relationships.followers else []
-
-        following = [
-            followed.followed.to_json()
-            for followed in user_with_relationships.following
-        ] if user_with_relationships.following else []
-
-        return cls(
-            result=True,
-            user=user_with_relationships.to_json(),
-            followers=followers,
-            following=following,
-        )
@@ -0,0 +1,256 @@
+"""Модуль раздачи статических файлов с предварительно сжатыми вариантами.
+
+Рядом с файлами сборки фронтенда лежат их сжатые копии ``.br`` и ``.gz``
+(их создаёт ``python -m app.precompress``). Обработчик выбирает вариант по
+``Accept-Encoding``, отдаёт файлы с хэшем содержимого в имени с
+``Cache-Control: immutable`` и поддерживает запросы диапазонов (``Range``).
+"""
+
+import mimetypes
+import os
+import re
+import stat
+from email.utils import parsedate
+from typing import Optional, Set, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+# Файлы, которые имеет смысл сжимать; картинки и шрифты уже сжаты.
+COMPRESSIBLE_EXTENSIONS: Tuple[str, ...] = (".css", ".html", ".ico", ".js", ".json", ".map", ".svg", ".txt", ".xml")
+# Вариант -> (Content-Encoding, расширение файла) в порядке предпочтения.
+PRECOMPRESSED_VARIANTS: Tuple[Tuple[str, str], ...] = (("br", ".br"), ("gzip", ".gz"))
+# Имена вида app.7c9275be.js: при изменении содержимого меняется имя файла.
+HASHED_NAME_RE: re.Pattern = re.compile(r"\.[0-9a-f]{8,}\.[^/]+$")
+BYTE_RANGE_RE: re.Pattern = re.compile(r"^bytes=(\d*)-(\d*)$", re.IGNORECASE)
+IMMUTABLE_CACHE_CONTROL: str = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL: str = "no-cache"
+
+
+def accepted_encodings(accept_encoding: str) -> Set[str]:
+    """
+    Разбирает заголовок ``Accept-Encoding``.
+
+    :param accept_encoding: Значение заголовка.
+    :return: Кодировки, которые клиент принимает (с ненулевым q).
+    """
+    accepted: Set[str] = set()
+
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality: float = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+
+    return accepted
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбирает заголовок ``Range`` с одним диапазоном байт.
+
+    Несколько диапазонов и некорректный заголовок игнорируются: отдаётся весь файл, как разрешает RFC 9110.
+
+    :param range_header: Значение заголовка.
+    :param size: Размер файла.
+    :return: Первый и последний байт диапазона включительно или None, если заголовок нужно проигнорировать.
+    :raises ValueError: Если диапазон не пересекается с файлом (416).
+    """
+    match: Optional[re.Match] = BYTE_RANGE_RE.match(range_header.strip())
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+
+    first, last = match.groups()
+    if not first:
+        suffix: int = int(last)
+        if suffix == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - suffix, 0), size - 1
+
+    start: int = int(first)
+    end: int = int(last) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(FileResponse):
+    """
+    Ответ 206 с частью файла.
+
+    :param path: Путь к файлу.
+    :param start: Первый байт диапазона.
+    :param end: Последний байт диапазона включительно.
+    :param size: Размер файла.
+    """
+
+    def __init__(self, path: str, start: int, end: int, size: int, **kwargs):
+        super().__init__(path, status_code=206, **kwargs)
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        Отправляет диапазон файла частями по ``chunk_size`` байт.
+
+        :param scope: ASGI scope.
+        :param receive: ASGI receive.
+        :param send: ASGI send.
+        """
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        remaining: int = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk: bytes = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """Раздача статических файлов с выбором сжатого варианта, долгим кэшированием и диапазонами."""
+
+    async def find_variant(
+        self,
+        full_path: str,
+        request_headers: Headers,
+    ) -> Tuple[str, Optional[os.stat_result], Optional[str]]:
+        """
+        Ищет сжатый вариант файла, который принимает клиент.
+
+        :param full_path: Путь к исходному файлу.
+        :param request_headers: Заголовки запроса.
+        :return: Путь, stat и Content-Encoding варианта или (full_path, None, None), если варианта нет.
+        """
+        accepted: Set[str] = accepted_encodings(request_headers.get("accept-encoding", ""))
+
+        for encoding, extension in PRECOMPRESSED_VARIANTS:
+            if encoding not in accepted and "*" not in accepted:
+                continue
+            try:
+                variant_stat: os.stat_result = await anyio.to_thread.run_sync(os.stat, full_path + extension)
+            except FileNotFoundError:
+                continue
+            if stat.S_ISREG(variant_stat.st_mode):
+                return full_path + extension, variant_stat, encoding
+
+        return full_path, None, None
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        """
+        Возвращает ответ для файла, выбирая сжатый вариант, если он есть.
+
+        :param path: Путь к файлу относительно каталога.
+        :param scope: ASGI scope.
+        :return: Ответ.
+        """
+        if scope["method"] in ("GET", "HEAD"):
+            full_path, stat_result = await self.lookup_path(path)
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                return await self.static_file_response(full_path, stat_result, scope)
+
+        return await super().get_response(path, scope)
+
+    async def static_file_response(self, full_path: str, stat_result: os.stat_result, scope: Scope) -> Response:
+        """
+        Собирает ответ для найденного файла.
+
+        :param full_path: Путь к исходному файлу.
+        :param stat_result: stat исходного файла.
+        :param scope: ASGI scope.
+        :return: Ответ 200, 206, 304 или 416.
+        """
+        request_headers: Headers = Headers(scope=scope)
+        variant_path, variant_stat, encoding = await self.find_variant(full_path, request_headers)
+
+        headers: dict = {
+            "accept-ranges": "bytes",
+            "cache-control": (
+                IMMUTABLE_CACHE_CONTROL if HASHED_NAME_RE.search(os.path.basename(full_path))
+                else REVALIDATE_CACHE_CONTROL
+            ),
+        }
+        if full_path.endswith(COMPRESSIBLE_EXTENSIONS):
+            headers["vary"] = "Accept-Encoding"
+        if encoding is not None:
+            headers["content-encoding"] = encoding
+            stat_result = variant_stat
+
+        # Тип берётся по исходному имени: app.js.br - это по-прежнему JavaScript.
+        media_type: str = mimetypes.guess_type(full_path)[0] or "text/plain"
+        response: FileResponse = FileResponse(
+            variant_path,
+            stat_result=stat_result,
+            method=scope["method"],
+            headers=headers,
+            media_type=media_type,
+        )
+        if encoding is not None:
+            response.headers["etag"] = f'{response.headers["etag"]}-{encoding}'
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        range_header: Optional[str] = request_headers.get("range")
+        if range_header is None or not self.range_applies(request_headers, response.headers):
+            return response
+
+        try:
+            byte_range: Optional[Tuple[int, int]] = parse_range(range_header, stat_result.st_size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={"content-range": f"bytes */{stat_result.st_size}", **headers},
+            )
+        if byte_range is None:
+            return response
+
+        headers["etag"] = response.headers["etag"]
+        headers["last-modified"] = response.headers["last-modified"]
+        return FileRangeResponse(
+            variant_path,
+            *byte_range,
+            size=stat_result.st_size,
+            method=scope["method"],
+            headers=headers,
+            media_type=media_type,
+        )
+
+    @staticmethod
+    def range_applies(request_headers: Headers, response_headers: Headers) -> bool:
+        """
+        Проверяет условие ``If-Range``: если файл изменился, отдаётся целиком.
+
+        :param request_headers: Заголовки запроса.
+        :param response_headers: Заголовки ответа.
+        :return: True, если диапазон можно отдать.
+        """
+        if_range: Optional[str] = request_headers.get("if-range")
+        if if_range is None:
+            return True
+        if if_range == response_headers["etag"]:
+            return True
+
+        if_range_date = parsedate(if_range)
+        last_modified = parsedate(response_headers["last-modified"])
+        return if_range_date is not None and last_modified is not None and if_range_date >= last_modified
@@ -0,0 +1,258 @@
+"""Модуль возобновляемой загрузки медиафайлов.
+
+Загрузка большого файла идёт частями по протоколу в духе tus: ``POST /api/medias/uploads``
+создаёт сессию (имя файла проверяется тем же ``allowed_file``, что и в ``POST /api/medias``),
+``PATCH`` с заголовком ``Upload-Offset`` дописывает часть во временный файл ``<id>.part``,
+``HEAD`` возвращает, сколько байт уже принято, а ``POST .../complete`` переносит файл
+к остальным медиа и создаёт строку ``medias``. После обрыва соединения клиент узнаёт
+смещение через ``HEAD`` и продолжает с него, не отправляя принятые байты повторно.
+
+Часть дописывается в конец файла без чтения уже принятых данных; на время записи файл
+блокируется (``flock``), поэтому части одной загрузки не пишутся одновременно, а соединение
+с базой данных не занято, пока принимается тело запроса. Запись и ``fsync`` выполняются
+в потоке (``asyncio.to_thread``) и не останавливают цикл событий. Если транзакция завершения
+не зафиксировалась, перенесённый файл возвращается на место, и завершение можно повторить.
+Загрузка, не получавшая частей ``MEDIA_UPLOAD_TTL_SECONDS``, удаляется сборщиком ``app.media_gc``
+вместе с временным файлом.
+"""
+
+import asyncio
+import fcntl
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, BinaryIO, Dict, Iterator
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+from starlette.requests import ClientDisconnect
+
+from app.models import MediaUpload
+from app.schemas import MediaUploadOut
+from app.utils import CustomException
+
+# Каталог временных файлов; не должен отдаваться как статика.
+MEDIA_UPLOAD_TMP_DIR: str = os.getenv("MEDIA_UPLOAD_TMP_DIR", "uploads")
+MEDIA_UPLOAD_TTL_SECONDS: float = float(os.getenv("MEDIA_UPLOAD_TTL_SECONDS", str(24 * 60 * 60)))
+MEDIA_UPLOAD_MAX_LENGTH: int = int(os.getenv("MEDIA_UPLOAD_MAX_LENGTH", str(50 * 1024 * 1024)))
+UPLOAD_CONTENT_TYPE: str = "application/offset+octet-stream"
+TEMP_SUFFIX: str = ".part"
+
+
+def temp_path(upload_id: str) -> str:
+    """
+    Возвращает путь к временному файлу загрузки.
+
+    :param upload_id: ID загрузки.
+    :return: Путь к файлу.
+    """
+    return os.path.join(MEDIA_UPLOAD_TMP_DIR, f"{upload_id}{TEMP_SUFFIX}")
+
+
+def expiry() -> datetime:
+    """
+    Возвращает время, после которого загрузка без новых частей считается брошенной.
+
+    :return: Время истечения.
+    """
+    return datetime.now(timezone.utc) + timedelta(seconds=MEDIA_UPLOAD_TTL_SECONDS)
+
+
+def upload_query(upload_id: str, user_id: int) -> Select:
+    """
+    Запрос неистёкшей загрузки пользователя.
+
+    :param upload_id: ID загрузки.
+    :param user_id: ID пользователя.
+    :return: Запрос SQLAlchemy.
+    """
+    return select(MediaUpload).where(
+        MediaUpload.id == upload_id,
+        MediaUpload.user_id == user_id,
+        MediaUpload.expires_at > func.now(),
+    )
+
+
+async def get_upload(session: AsyncSession, upload_id: str, user_id: int) -> MediaUpload:
+    """
+    Возвращает неистёкшую загрузку пользователя.
+
+    :param session: Сессия базы данных.
+    :param upload_id: ID загрузки.
+    :param user_id: ID пользователя.
+    :return: Загрузка.
+    :raises CustomException: Если загрузки нет, она истекла или принадлежит другому пользователю (404).
+    """
+    media_upload = (await session.execute(upload_query(upload_id, user_id))).scalar_one_or_none()
+
+    if media_upload is None:
+        raise CustomException(status_code=404, detail="Upload not found")
+
+    return media_upload
+
+
+async def save_offset(session: AsyncSession, media_upload: MediaUpload, offset: int) -> None:
+    """
+    Сохраняет число принятых байт и продлевает срок загрузки.
+
+    :param session: Сессия базы данных.
+    :param media_upload: Загрузка.
+    :param offset: Сколько байт принято.
+    :raises CustomException: Если сборщик успел удалить истёкшую загрузку (404).
+    """
+    expires_at: datetime = expiry()
+    result = await session.execute(
+        update(MediaUpload).
+        where(MediaUpload.id == media_upload.id).
+        values(upload_offset=offset, expires_at=expires_at).
+        execution_options(synchronize_session=False),
+    )
+
+    if not result.rowcount:
+        raise CustomException(status_code=404, detail="Upload not found")
+
+    media_upload.upload_offset = offset
+    media_upload.expires_at = expires_at
+
+
+def create_temp_file(upload_id: str) -> None:
+    """
+    Создаёт пустой временный файл загрузки.
+
+    :param upload_id: ID загрузки.
+    """
+    os.makedirs(MEDIA_UPLOAD_TMP_DIR, exist_ok=True)
+    with open(temp_path(upload_id), "xb"):
+        pass
+
+
+@contextmanager
+def locked_temp_file(upload_id: str) -> Iterator[BinaryIO]:
+    """
+    Открывает временный файл загрузки и блокирует его на время работы с ним.
+
+    :param upload_id: ID загрузки.
+    :return: Файл, открытый на чтение и запись.
+    :raises CustomException: Если файла нет (404) или с ним уже работает другой запрос (409).
+    """
+    try:
+        file_object: BinaryIO = open(temp_path(upload_id), "r+b")
+    except FileNotFoundError:
+        raise CustomException(status_code=404, detail="Upload not found")
+
+    with file_object:
+        try:
+            fcntl.flock(file_object, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise CustomException(status_code=409, detail="Upload is busy with another request")
+        yield file_object
+
+
+async def append_chunk(file_object: BinaryIO, offset: int, chunk: AsyncIterator[bytes], remaining: int) -> int:
+    """
+    Дописывает часть загрузки в файл со смещения ``offset``.
+
+    Данные после ``offset`` (остаток части, запись которой не была подтверждена) отбрасываются.
+    При обрыве соединения сохраняется то, что успело прийти.
+
+    :param file_object: Заблокированный временный файл.
+    :param offset: Сколько байт уже принято.
+    :param chunk: Тело запроса.
+    :param remaining: Сколько байт ещё может принять загрузка.
+    :return: Сколько байт записано.
+    :raises CustomException: Если часть длиннее оставшейся части файла (400).
+    """
+    await asyncio.to_thread(file_object.truncate, offset)
+    file_object.seek(offset)
+    written: int = 0
+
+    try:
+        async for data in chunk:
+            if written + len(data) > remaining:
+                raise CustomException(status_code=400, detail="Chunk exceeds Upload-Length")
+            await asyncio.to_thread(file_object.write, data)
+            written += len(data)
+    except ClientDisconnect:
+        pass
+
+    # Смещение в базе не должно опережать данные на диске.
+    await asyncio.to_thread(sync_file, file_object)
+    return written
+
+
+def sync_file(file_object: BinaryIO) -> None:
+    """
+    Сбрасывает буфер файла и дожидается записи данных на диск.
+
+    :param file_object: Файл.
+    """
+    file_object.flush()
+    os.fsync(file_object.fileno())
+
+
+def published_name(media_upload: MediaUpload) -> str:
+    """
+    Возвращает имя файла завершённой загрузки в каталоге медиафайлов.
+
+    :param media_upload: Загрузка.
+    :return: ID загрузки с расширением исходного файла.
+    """
+    return f"{media_upload.id}{os.path.splitext(media_upload.file_name)[1]}"
+
+
+def publish_file(media_upload: MediaUpload, upload_dir: str) -> str:
+    """
+    Переносит файл завершённой загрузки в каталог медиафайлов.
+
+    :param media_upload: Загрузка.
+    :param upload_dir: Каталог медиафайлов.
+    :return: Имя итогового файла: ID загрузки с расширением исходного файла.
+    """
+    file_name: str = published_name(media_upload)
+    shutil.move(temp_path(media_upload.id), os.path.join(upload_dir, file_name))
+    return file_name
+
+
+def unpublish_file(upload_id: str, file_name: str, upload_dir: str) -> None:
+    """
+    Возвращает перенесённый файл на место временного, если транзакция завершения не зафиксирована.
+
+    :param upload_id: ID загрузки.
+    :param file_name: Имя файла в каталоге медиафайлов.
+    :param upload_dir: Каталог медиафайлов.
+    """
+    file_path: str = os.path.join(upload_dir, file_name)
+    if os.path.exists(file_path) and not os.path.exists(temp_path(upload_id)):
+        shutil.move(file_path, temp_path(upload_id))
+
+
+def offset_headers(media_upload: MediaUpload) -> Dict[str, str]:
+    """
+    Возвращает заголовки состояния загрузки.
+
+    :param media_upload: Загрузка.
+    :return: ``Upload-Offset``, ``Upload-Length`` и запрет кэширования.
+    """
+    return {
+        "Upload-Offset": str(media_upload.upload_offset),
+        "Upload-Length": str(media_upload.upload_length),
+        "Cache-Control": "no-store",
+    }
+
+
+def upload_out(media_upload: MediaUpload) -> MediaUploadOut:
+    """
+    Формирует ответ с состоянием загрузки.
+
+    :param media_upload: Загрузка.
+    :return: Ответ.
+    """
+    return MediaUploadOut(
+        result=True,
+        upload_id=media_upload.id,
+        offset=media_upload.upload_offset,
+        length=media_upload.upload_length,
+        expires_at=media_upload.expires_at,
+    )
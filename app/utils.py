@@ -1,16 +1,33 @@
 """Модуль вспомогательных функций."""
 
-from typing import Any, Dict, List
+import json
+import os
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
 
 from fastapi import Header, HTTPException
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-
+from sqlalchemy import Integer, cast, delete, exists, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import joinedload, noload, selectinload
+from sqlalchemy.sql import Delete, Select
+
+from app import records
+from app.cache import auth_cache, media_cache, profile_cache
+from app.coalesce import read_flight
 from app.database import async_session
-from app.models import Follower, Like, Tweet, User
+from app.models import Follower, Like, Media, Notification, NotificationActor, Tweet, User
+from app.rate_limit import known_api_keys
 from app.schemas import UserProfileOut
 
 allowed_extensions: set[str] = {'png', 'jpg', 'jpeg', 'gif'}
+EXPORT_CHUNK_SIZE: int = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+# Режимы лайков в ленте: full - все лайкнувшие, summary - счётчик, первые лайкнувшие и liked_by_me.
+FEED_LIKES_MODES: tuple[str, ...] = ("full", "summary")
+FEED_TOP_LIKERS: int = int(os.getenv("FEED_TOP_LIKERS", "3"))
+LIKES_PAGE_SIZE: int = 50
+LIKES_MAX_PAGE_SIZE: int = 200
+EMPTY_LIKE_SUMMARY: Dict[str, Any] = {"like_count": 0, "likes": [], "liked_by_me": False}
+THREAD_PAGE_SIZE: int = 100
+THREAD_MAX_PAGE_SIZE: int = 500
 
 
 class CustomException(HTTPException):
@@ -35,24 +52,328 @@ def allowed_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1] in allowed_extensions
 
 
+def user_by_api_key_query(api_key: str) -> Select:
+    """
+    Запрос пользователя по API-ключу.
+
+    :param api_key: API-ключ пользователя.
+    :return: Запрос SQLAlchemy.
+    """
+    return select(User).filter(User.secret_key == api_key)
+
+
+def user_query(user_id: int) -> Select:
+    """
+    Запрос пользователя по ID.
+
+    :param user_id: ID пользователя.
+    :return: Запрос SQLAlchemy.
+    """
+    return select(User).where(User.id == user_id)
+
+
+def tweet_with_likes_query(tweet_id: int) -> Select:
+    """
+    Запрос твита вместе с его лайками.
+
+    :param tweet_id: ID твита.
+    :return: Запрос SQLAlchemy.
+    """
+    return select(Tweet).options(selectinload(Tweet.likes)).where(Tweet.id == tweet_id)
+
+
+def tweet_query(tweet_id: int) -> Select:
+    """
+    Запрос ID твита без загрузки лайков.
+
+    :param tweet_id: ID твита.
+    :return: Запрос SQLAlchemy.
+    """
+    return select(Tweet.id).where(Tweet.id == tweet_id)
+
+
+def tweets_query(tweet_ids: List[int]) -> Select:
+    """
+    Запрос твитов с авторами по ID, без загрузки лайков.
+
+    :param tweet_ids: ID твитов.
+    :return: Запрос SQLAlchemy.
+    """
+    return (
+        select(Tweet).
+        options(noload(Tweet.likes), joinedload(Tweet.user)).
+        where(Tweet.id.in_(tweet_ids)).
+        order_by(Tweet.id)
+    )
+
+
+def tweet_path_query(tweet_id: int) -> Select:
+    """
+    Запрос положения твита в обсуждении.
+
+    :param tweet_id: ID твита.
+    :return: Запрос SQLAlchemy.
+    """
+    return select(Tweet.id, Tweet.conversation_id, Tweet.path).where(Tweet.id == tweet_id)
+
+
+def thread_query(
+    conversation_id: int,
+    path: List[int],
+    limit: int,
+    max_depth: Optional[int] = None,
+    after: Optional[List[int]] = None,
+) -> Select:
+    """
+    Запрос ветки обсуждения: твит и все ответы на него в порядке обхода дерева в глубину.
+
+    Пути ответов на твит с путём ``[a, b]`` лежат в диапазоне ``[a, b] <= path < [a, b + 1]``,
+    поэтому ветка читается одним диапазонным сканированием индекса (conversation_id, path).
+
+    :param conversation_id: ID корневого твита обсуждения.
+    :param path: Путь твита, с которого начинается ветка.
+    :param limit: Размер страницы.
+    :param max_depth: Максимальная глубина ответов относительно твита (None - без ограничения).
+    :param after: Путь последнего твита предыдущей страницы.
+    :return: Запрос SQLAlchemy.
+    """
+    query: Select = (
+        select(Tweet).
+        options(noload(Tweet.likes), joinedload(Tweet.user)).
+        where(
+            Tweet.conversation_id == conversation_id,
+            Tweet.path >= path,
+            Tweet.path < path[:-1] + [path[-1] + 1],
+        )
+    )
+    if after is not None:
+        query = query.where(Tweet.path > after)
+    if max_depth is not None:
+        query = query.where(func.cardinality(Tweet.path) <= len(path) + max_depth)
+    return query.order_by(Tweet.path).limit(limit)
+
+
+def like_query(tweet_id: int, user_id: int) -> Select:
+    """
+    Запрос лайка пользователя на твит.
+
+    :param tweet_id: ID твита.
+    :param user_id: ID пользователя.
+    :return: Запрос SQLAlchemy.
+    """
+    return select(Like).where(Like.tweet_id == tweet_id, Like.user_id == user_id)
+
+
+def like_delete_query(tweet_id: int, user_id: int) -> Delete:
+    """
+    Запрос удаления лайка пользователя с твита.
+
+    Условие по tweet_id (ключ секционирования likes) оставляет в плане одну секцию.
+
+    :param tweet_id: ID твита.
+    :param user_id: ID пользователя.
+    :return: Запрос SQLAlchemy.
+    """
+    return delete(Like).where(Like.tweet_id == tweet_id, Like.user_id == user_id)
+
+
+def tweet_delete_queries(tweet_id: int, user_id: int) -> List[Delete]:
+    """
+    Запросы удаления твита автора вместе с его лайками, уведомлениями о них и учтёнными в них пользователями.
+
+    Каждый запрос содержит ключ секционирования своей таблицы (tweet_id для likes,
+    user_id для tweets), поэтому затрагивает одну секцию. Уведомления удаляются явно:
+    у секционированной таблицы tweets нет внешнего ключа с ON DELETE CASCADE.
+
+    :param tweet_id: ID твита.
+    :param user_id: ID автора твита.
+    :return: Запросы SQLAlchemy в порядке выполнения.
+    """
+    return [
+        delete(Like).where(Like.tweet_id == tweet_id),
+        delete(Notification).where(Notification.tweet_id == tweet_id),
+        delete(NotificationActor).where(
+            NotificationActor.user_id == user_id,
+            NotificationActor.kind == "like",
+            NotificationActor.target == tweet_id,
+        ),
+        delete(Tweet).where(Tweet.id == tweet_id, Tweet.user_id == user_id),
+    ]
+
+
+def follow_query(follow_id: int, user_id: int) -> Select:
+    """
+    Запрос подписки пользователя на другого пользователя.
+
+    :param follow_id: ID пользователя, на которого подписываются.
+    :param user_id: ID пользователя, который подписывается.
+    :return: Запрос SQLAlchemy.
+    """
+    return select(Follower).where(Follower.followed_id == follow_id, Follower.follower_id == user_id)
+
+
+def like_summary_query(tweet_ids: List[int], user_id: int, top: int = FEED_TOP_LIKERS) -> Select:
+    """
+    Запрос сводки лайков твитов: по строке на твит с общим числом лайков, лайком пользователя
+    и первыми ``top`` лайкнувшими.
+
+    Все подзапросы читают лайки одного твита по индексам: число лайков считается по индексу
+    ``(tweet_id, id)`` без чтения таблицы, первые лайкнувшие - первые ``top`` записей того же
+    индекса, liked_by_me - EXISTS по паре ``(tweet_id, user_id)``: одна запись уникального индекса
+    на твит или, если планировщику так дешевле, один проход по лайкам пользователя. Сортировки
+    всех лайков популярного твита нет.
+
+    :param tweet_ids: ID твитов.
+    :param user_id: ID пользователя, для которого проверяется liked_by_me.
+    :param top: Сколько первых лайкнувших вернуть.
+    :return: Запрос SQLAlchemy.
+    """
+    feed = func.unnest(cast(tweet_ids, ARRAY(Integer))).table_valued(
+        "tweet_id",
+    ).render_derived(name="feed")
+    tweet_likes = Like.tweet_id == feed.c.tweet_id
+    return select(
+        feed.c.tweet_id,
+        select(func.count()).select_from(Like).where(tweet_likes).scalar_subquery().label("like_count"),
+        exists().where(tweet_likes).where(Like.user_id == user_id).label("liked_by_me"),
+        func.array(
+            select(Like.user_id).where(tweet_likes).order_by(Like.id).limit(top).scalar_subquery(),
+        ).label("liker_ids"),
+        func.array(
+            select(User.name).
+            select_from(Like).
+            join(User, User.id == Like.user_id).
+            where(tweet_likes).
+            order_by(Like.id).
+            limit(top).
+            scalar_subquery(),
+        ).label("liker_names"),
+    )
+
+
+def likes_page_query(tweet_id: int, limit: int, after_id: int = 0) -> Select:
+    """
+    Запрос страницы лайков твита в порядке их установки.
+
+    :param tweet_id: ID твита.
+    :param limit: Размер страницы.
+    :param after_id: ID последнего лайка предыдущей страницы.
+    :return: Запрос SQLAlchemy.
+    """
+    return (
+        select(Like.id, Like.user_id, User.name).
+        join(User, User.id == Like.user_id).
+        where(Like.tweet_id == tweet_id, Like.id > after_id).
+        order_by(Like.id).
+        limit(limit)
+    )
+
+
+def media_names_query(media_ids: List[int]) -> Select:
+    """
+    Запрос имён файлов медиа по их ID.
+
+    :param media_ids: ID медиа.
+    :return: Запрос SQLAlchemy.
+    """
+    return select(Media.id, Media.file_name).where(Media.id.in_(media_ids))
+
+
+def media_lock_query(media_ids: List[int]) -> Select:
+    """
+    Запрос, блокирующий строки медиа, которые прикрепляются к твиту (``FOR KEY SHARE``).
+
+    Блокировка держится до конца транзакции твита: сборщик неиспользуемых медиа берёт
+    кандидатов через ``FOR UPDATE SKIP LOCKED`` и пропускает их, пока твит не зафиксирован.
+
+    :param media_ids: ID медиа.
+    :return: Запрос SQLAlchemy.
+    """
+    return select(Media.id).where(Media.id.in_(media_ids)).with_for_update(key_share=True)
+
+
+def tweet_export_query(user_id: int) -> Select:
+    """
+    Запрос твитов пользователя для выгрузки: только колонки, без загрузки лайков в ORM.
+
+    Вложения собираются так же, как в ленте: в порядке ``tweet_media_ids``, null вместо ненайденного медиа.
+
+    :param user_id: ID пользователя.
+    :return: Запрос SQLAlchemy.
+    """
+    like_count = select(func.count(Like.id)).where(Like.tweet_id == Tweet.id).scalar_subquery()
+    attached = func.unnest(Tweet.tweet_media_ids).table_valued(
+        "media_id", with_ordinality="position",
+    ).render_derived(name="attached")
+    attachments = func.array(
+        select(Media.file_name).
+        select_from(attached).
+        outerjoin(Media, Media.id == attached.c.media_id).
+        order_by(attached.c.position).
+        scalar_subquery(),
+    )
+    return (
+        select(Tweet.id, Tweet.tweet_data, attachments, like_count, Tweet.created_at).
+        where(Tweet.user_id == user_id).
+        order_by(Tweet.id)
+    )
+
+
+def hot_queries() -> List[Select]:
+    """
+    Запросы горячего пути, которые прогреваются при быстром старте.
+
+    Параметры не совпадают ни с одной строкой: важны только скомпилированный SQL
+    и подготовленные выражения на соединениях пула.
+
+    :return: Список запросов SQLAlchemy.
+    """
+    return [
+        user_by_api_key_query(""),
+        user_query(0),
+        tweet_with_likes_query(0),
+        tweet_query(0),
+        tweets_query([0]),
+        tweet_path_query(0),
+        thread_query(0, [0], THREAD_PAGE_SIZE),
+        like_query(tweet_id=0, user_id=0),
+        follow_query(follow_id=0, user_id=0),
+        records.feed_tweets_query(0),
+        records.feed_likes_query(0),
+        like_summary_query([0], 0),
+        likes_page_query(0, LIKES_PAGE_SIZE),
+        records.profile_query(0),
+        media_names_query([0]),
+    ]
+
+
 async def check_api_key(api_key: str = Header(...)) -> User:
     """
     Проверяет API-ключ пользователя.
 
+    Действительный ключ запоминается, чтобы ограничение частоты запросов велось по нему.
+
     :param api_key: API-ключ пользователя.
     :return: Объект пользователя, если ключ действителен.
     :raises CustomException: Если ключ недействителен (401).
     """
+    user = auth_cache.get(api_key)
+    if user is not None:
+        known_api_keys.add(api_key)
+        return user
+
+    generation: int = auth_cache.generation
     async with async_session() as session:
         async with session.begin():
-            user = await session.execute(
-                select(User).filter(User.secret_key == api_key),
-            )
+            user = await session.execute(user_by_api_key_query(api_key))
             user = user.scalar_one_or_none()
 
             if not user:
                 raise CustomException(status_code=401, detail="Invalid API Key")
-            return user
+
+    auth_cache.set(api_key, user, generation=generation)
+    known_api_keys.add(api_key)
+    return user
 
 
 async def check_user_exist(session, check_id: int):
@@ -63,10 +384,7 @@ async def check_user_exist(session, check_id: int):
     :param check_id: ID пользователя для проверки.
     :raises CustomException: Если пользователь не найден (404).
     """
-    follow_user = await session.execute(
-        select(User).
-        where(User.id == check_id),
-    )
+    follow_user = await session.execute(user_query(check_id))
     follow_user = follow_user.scalar_one_or_none()
 
     if not follow_user:
@@ -82,11 +400,7 @@ async def check_tweet_exist(session, check_id: int):
     :return: Объект твита, если существует.
     :raises CustomException: Если твит не найден (404).
     """
-    tweet = await session.execute(
-        select(Tweet).
-        options(selectinload(Tweet.likes)).
-        where(Tweet.id == check_id),
-    )
+    tweet = await session.execute(tweet_with_likes_query(check_id))
     tweet = tweet.scalar_one_or_none()
 
     if not tweet:
@@ -95,6 +409,48 @@ async def check_tweet_exist(session, check_id: int):
     return tweet
 
 
+async def check_media_exist(session, media_ids: List[int]) -> None:
+    """
+    Проверяет, что все медиа твита существуют, и блокирует их до конца транзакции.
+
+    :param session: Сессия базы данных.
+    :param media_ids: ID медиа твита.
+    :raises CustomException: Если какого-то медиа нет (400).
+    """
+    locked = set((await session.execute(media_lock_query(media_ids))).scalars().all())
+
+    if locked != set(media_ids):
+        raise CustomException(status_code=400, detail="Media not found")
+
+
+async def thread_position(session, tweet_id: int, reply_to: Optional[int]) -> Tuple[int, List[int]]:
+    """
+    Определяет обсуждение и путь нового твита.
+
+    :param session: Сессия базы данных.
+    :param tweet_id: ID нового твита.
+    :param reply_to: ID твита, на который отвечает новый твит, или None.
+    :return: ID корневого твита обсуждения и путь нового твита.
+    :raises CustomException: Если твит, на который отвечают, не найден (404).
+    """
+    if reply_to is None:
+        return tweet_id, [tweet_id]
+
+    parent = (await session.execute(tweet_path_query(reply_to))).one_or_none()
+    if parent is None:
+        raise CustomException(status_code=404, detail="Tweet not found")
+
+    parent_id, conversation_id, parent_path = parent
+    if parent_path is None:
+        # Твит добавлен в обход API (например, загрузкой данных): он становится корнем обсуждения.
+        conversation_id, parent_path = parent_id, [parent_id]
+        await session.execute(
+            update(Tweet).where(Tweet.id == parent_id).values(conversation_id=conversation_id, path=parent_path),
+        )
+
+    return conversation_id, parent_path + [tweet_id]
+
+
 async def check_like_exist(session, tweet_id: int, user_id: int):
     """
     Проверяет существование лайка.
@@ -104,9 +460,7 @@ async def check_like_exist(session, tweet_id: int, user_id: int):
     :param user_id: ID пользователя.
     :return: Объект лайка, если существует.
     """
-    like = await session.execute(
-        select(Like).where(Like.tweet_id == tweet_id, Like.user_id == user_id),
-    )
+    like = await session.execute(like_query(tweet_id=tweet_id, user_id=user_id))
 
     return like.scalar_one_or_none()
 
@@ -120,10 +474,7 @@ async def check_follow_exist(session, follow_id: int, user_id: int):
     :param user_id: ID пользователя, который подписывается.
     :return: Объект подписки, если существует.
     """
-    follow = await session.execute(
-        select(Follower).
-        where(Follower.followed_id == follow_id, Follower.follower_id == user_id),
-    )
+    follow = await session.execute(follow_query(follow_id=follow_id, user_id=user_id))
 
     return follow.scalar_one_or_none()
 
@@ -132,27 +483,101 @@ async def get_user_profile_data(user_id: int) -> UserProfileOut:
     """
     Получает данные профиля пользователя.
 
+    Параллельные запросы одного и того же профиля разделяют одно чтение из базы данных.
+
+    :param user_id: ID пользователя.
+    :return: Данные профиля пользователя.
+    """
+    profile = profile_cache.get(user_id)
+    if profile is None:
+        generation: int = profile_cache.generation
+        profile = await read_flight.do(("profile", user_id), lambda: load_user_profile_data(user_id))
+        profile_cache.set(user_id, profile, generation=generation)
+    return profile
+
+
+async def load_user_profile_data(user_id: int) -> UserProfileOut:
+    """
+    Читает данные профиля пользователя из базы данных.
+
     :param user_id: ID пользователя.
     :return: Данные профиля пользователя.
+    :raises CustomException: Если пользователь не найден (404).
     """
     async with async_session() as session:
         async with session.begin():
-            await check_user_exist(session, user_id)
-            query = select(User).filter(User.id == user_id).options(
-                selectinload(User.followers).selectinload(Follower.follower),
-                selectinload(User.following).selectinload(Follower.followed),
-            )
-            user_with_relationships = await session.execute(query)
-            user_data = user_with_relationships.scalar()
-            return UserProfileOut.from_db_user(user_data)
+            profile: Dict[str, Any] = records.profile_response(await records.get_profile(session, user_id))
+
+    if profile["user"] is None:
+        raise CustomException(status_code=404, detail="User not found")
+    return UserProfileOut(**profile)
+
+
+async def get_media_names(session, media_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Получает имена файлов медиа по их ID, сначала из кэша, остальные - одним запросом.
+
+    :param session: Сессия базы данных.
+    :param media_ids: ID медиа.
+    :return: Словарь ID медиа -> имя файла.
+    """
+    media_dict: Dict[int, str] = {}
+    missing: List[int] = []
+
+    for media_id in set(media_ids):
+        file_name = media_cache.get(media_id)
+        if file_name is None:
+            missing.append(media_id)
+        else:
+            media_dict[media_id] = file_name
+
+    if missing:
+        generation: int = media_cache.generation
+        media_data = await session.execute(media_names_query(missing))
+        for media_id, file_name in media_data.all():
+            media_dict[media_id] = file_name
+            media_cache.set(media_id, file_name, generation=generation)
+
+    return media_dict
 
 
-async def tweet_response(media_dict: Dict[int, Any], tweets: List[Tweet]) -> List[Dict[str, Any]]:
+async def get_like_summaries(session, tweet_ids: List[int], user_id: int) -> Dict[int, Dict[str, Any]]:
+    """
+    Получает сводку лайков твитов одним запросом.
+
+    :param session: Сессия базы данных.
+    :param tweet_ids: ID твитов.
+    :param user_id: ID пользователя, для которого проверяется liked_by_me.
+    :return: Словарь ID твита -> {"like_count", "likes", "liked_by_me"}; твитов без лайков в нём нет.
+    """
+    summaries: Dict[int, Dict[str, Any]] = {}
+    if not tweet_ids:
+        return summaries
+
+    rows = await session.execute(like_summary_query(tweet_ids, user_id, FEED_TOP_LIKERS))
+    for tweet_id, like_count, liked_by_me, liker_ids, liker_names in rows.all():
+        if like_count:
+            summaries[tweet_id] = {
+                "like_count": like_count,
+                "likes": [{"user_id": liker_id, "name": name} for liker_id, name in zip(liker_ids, liker_names)],
+                "liked_by_me": liked_by_me,
+            }
+
+    return summaries
+
+
+async def tweet_response(
+    media_dict: Dict[int, Any],
+    tweets: List[Tweet],
+    like_summaries: Optional[Dict[int, Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
     """
     Формирует ответ на запрос твитов.
 
     :param media_dict: Словарь медиафайлов.
     :param tweets: Список твитов.
+    :param like_summaries: Сводки лайков из ``get_like_summaries``; если не переданы,
+        в ответ попадают все лайки твитов.
     :return: Список ответов на запрос твитов.
     """
     return [
@@ -163,10 +588,87 @@ async def tweet_response(media_dict: Dict[int, Any], tweets: List[Tweet]) -> Lis
                 media_dict.get(media_id, None) for media_id in tweet.tweet_media_ids
             ] if tweet.tweet_media_ids else [],
             "author": {"id": tweet.user.id, "name": tweet.user.name},
-            "likes": [
-                {"user_id": like.user.id, "name": like.user.name}
-                for like in tweet.likes
-            ] if tweet.likes else [],
+            **(
+                like_summaries.get(tweet.id, EMPTY_LIKE_SUMMARY) if like_summaries is not None else {
+                    "likes": [
+                        {"user_id": like.user.id, "name": like.user.name}
+                        for like in tweet.likes
+                    ] if tweet.likes else [],
+                }
+            ),
+        }
+        for tweet in tweets
+    ]
+
+
+def parse_thread_cursor(cursor: str) -> List[int]:
+    """
+    Разбирает курсор страницы обсуждения.
+
+    :param cursor: Путь последнего твита предыдущей страницы через точку, например ``1.5.9``.
+    :return: Путь.
+    :raises CustomException: Если курсор некорректен (400).
+    """
+    try:
+        return [int(part) for part in cursor.split(".")]
+    except ValueError:
+        raise CustomException(status_code=400, detail="Invalid cursor")
+
+
+async def thread_response(media_dict: Dict[int, Any], tweets: List[Tweet]) -> List[Dict[str, Any]]:
+    """
+    Формирует ответ на запрос ветки обсуждения.
+
+    Родитель ответа берётся из пути, поэтому после удаления твита его ответы сохраняют
+    место в дереве, а ``parent_id`` указывает на удалённый твит.
+
+    :param media_dict: Словарь медиафайлов.
+    :param tweets: Твиты ветки в порядке обхода дерева.
+    :return: Список твитов ветки.
+    """
+    return [
+        {
+            "id": tweet.id,
+            "content": tweet.tweet_data,
+            "attachments": [
+                media_dict.get(media_id, None) for media_id in tweet.tweet_media_ids
+            ] if tweet.tweet_media_ids else [],
+            "author": {"id": tweet.user.id, "name": tweet.user.name},
+            "parent_id": tweet.path[-2] if len(tweet.path) > 1 else None,
+            "depth": len(tweet.path) - 1,
         }
         for tweet in tweets
     ]
+
+
+async def stream_user_tweets(user_id: int, chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Выгружает твиты пользователя в формате NDJSON через курсор на стороне сервера.
+
+    Строки читаются из курсора пачками по ``chunk_size``, и следующая пачка запрашивается
+    только после того, как предыдущая отправлена клиенту, поэтому память не зависит
+    от числа твитов, а медленный клиент притормаживает чтение из базы данных.
+
+    :param user_id: ID пользователя.
+    :param chunk_size: Сколько твитов читать из курсора за раз.
+    :return: Асинхронный итератор частей тела ответа.
+    """
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.stream(
+                tweet_export_query(user_id).execution_options(yield_per=chunk_size),
+            )
+            async for rows in result.partitions(chunk_size):
+                yield "".join(
+                    json.dumps(
+                        {
+                            "id": tweet_id,
+                            "content": content,
+                            "attachments": attachments,
+                            "likes": likes,
+                            "created_at": created_at.isoformat(),
+                        },
+                        ensure_ascii=False,
+                    ) + "\n"
+                    for tweet_id, content, attachments, likes, created_at in rows
+                ).encode()
@@ -0,0 +1,110 @@
+"""Накладные расходы журнала запросов на один запрос: старый log_requests против AccessLogMiddleware.
+
+База данных не нужна. Запуск: ``python -m benchmarks.bench_access_log [число_запросов]``.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from fastapi import FastAPI, Request
+from httpx import AsyncClient
+
+from app import access_log
+from app.access_log import AccessLogMiddleware, start_access_log, stop_access_log
+
+REQUESTS: int = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+
+def make_app() -> FastAPI:
+    """
+    Создает минимальное приложение с одним маршрутом.
+
+    :return: Приложение FastAPI.
+    """
+    bench_app: FastAPI = FastAPI()
+
+    @bench_app.get("/api/tweets/{tweet_id}")
+    async def get_tweet(tweet_id: int):
+        return {"result": True, "id": tweet_id}
+
+    return bench_app
+
+
+def make_legacy_app(devnull) -> FastAPI:
+    """
+    Создает приложение со старым middleware: два f-string лога и синхронный обработчик.
+
+    :param devnull: Поток, в который пишет обработчик.
+    :return: Приложение FastAPI.
+    """
+    legacy_app: FastAPI = make_app()
+    legacy_logger: logging.Logger = logging.getLogger("bench.legacy")
+    legacy_logger.setLevel(logging.INFO)
+    legacy_logger.propagate = False
+    legacy_logger.addHandler(logging.StreamHandler(devnull))
+
+    @legacy_app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        legacy_logger.info(f"Request received: {request.method} {request.url}")
+        response = await call_next(request)
+        legacy_logger.info(f"Response sent: {response.status_code}")
+        return response
+
+    return legacy_app
+
+
+def make_access_log_app(sample_rate: float) -> FastAPI:
+    """
+    Создает приложение с AccessLogMiddleware.
+
+    :param sample_rate: Доля успешных запросов, попадающих в журнал.
+    :return: Приложение FastAPI.
+    """
+    new_app: FastAPI = make_app()
+    new_app.add_middleware(AccessLogMiddleware, sample_rate=sample_rate)
+    return new_app
+
+
+async def measure(bench_app: FastAPI) -> float:
+    """
+    Измеряет среднее время одного запроса.
+
+    :param bench_app: Приложение для замера.
+    :return: Микросекунды на запрос.
+    """
+    async with AsyncClient(app=bench_app, base_url="http://bench") as client:
+        for _ in range(200):
+            await client.get("/api/tweets/1")
+
+        started: float = time.perf_counter()
+        for request_number in range(REQUESTS):
+            await client.get(f"/api/tweets/{request_number}")
+        return (time.perf_counter() - started) / REQUESTS * 1_000_000
+
+
+async def main() -> None:
+    """Печатает накладные расходы каждого варианта относительно приложения без журнала."""
+    with open(os.devnull, "w") as devnull:
+        access_log._stream_handler.setStream(devnull)
+        start_access_log()
+
+        baseline: float = await measure(make_app())
+        variants: dict[str, FastAPI] = {
+            "log_requests (before)": make_legacy_app(devnull),
+            "AccessLogMiddleware, sample_rate=1.0": make_access_log_app(1.0),
+            "AccessLogMiddleware, sample_rate=0.1": make_access_log_app(0.1),
+        }
+
+        print(f"baseline without logging: {baseline:8.1f} us/request")
+        for name, variant in variants.items():
+            elapsed: float = await measure(variant)
+            print(f"{name:40} {elapsed:8.1f} us/request, overhead {elapsed - baseline:7.1f} us")
+
+        stop_access_log()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
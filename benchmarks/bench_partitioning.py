@@ -0,0 +1,194 @@
+"""Запросы по автору и по твиту к обычным и hash-секционированным tweets и likes: планы и задержка.
+
+Нужна база данных со схемой приложения (DATABASE_URL). В схемах ``bench_plain`` и ``bench_hash``
+создаются копии таблиц users, tweets и likes (колонки и индексы берутся из таблиц приложения,
+в ``bench_hash`` tweets секционирована по user_id, likes - по tweet_id) с одинаковыми данными.
+Запросы приложения выполняются в каждой схеме через ``search_path``. Для каждого запроса
+печатаются секции, которые план действительно читает, и средняя задержка. Схемы удаляются после замера.
+Запуск: ``python -m benchmarks.bench_partitioning [число_твитов] [число_секций]``.
+"""
+
+import asyncio
+import random
+import re
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import Executable
+
+from app import utils
+from app.database import db_engine
+
+TWEETS: int = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+PARTITIONS: int = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+USERS: int = 10_000
+LIKES_PER_TWEET: int = 3
+REPEATS: int = 300
+SCHEMAS: Dict[str, str] = {"bench_plain": "plain", "bench_hash": "hash-partitioned"}
+PARTITION_KEYS: Dict[str, str] = {"tweets": "user_id", "likes": "tweet_id"}
+PRIMARY_KEYS: Dict[str, str] = {"users": "id", "tweets": "id", "likes": "id"}
+PLAN_CACHE_MODES: Tuple[str, ...] = ("auto", "force_custom_plan")
+
+# Запрос по id в параметре: автор или твит выбирается случайно для каждого повтора.
+QUERIES: Dict[str, Callable[[int], Executable]] = {
+    "user tweets (by user_id)": utils.tweet_export_query,
+    "likes page (by tweet_id)": lambda tweet_id: utils.likes_page_query(tweet_id, utils.LIKES_PAGE_SIZE),
+    "like of user (by tweet_id)": lambda tweet_id: utils.like_query(tweet_id, 1 + tweet_id % USERS),
+    "tweet by id (no key)": utils.tweet_query,
+}
+QUERY_KEYS: Dict[str, int] = {
+    "user tweets (by user_id)": USERS,
+    "likes page (by tweet_id)": TWEETS,
+    "like of user (by tweet_id)": TWEETS,
+    "tweet by id (no key)": TWEETS,
+}
+INDEX_TABLE_RE: re.Pattern = re.compile(r" ON (ONLY )?\S+ USING ")
+SCANNED_RE: re.Pattern = re.compile(r" on ((?:tweets|likes)(?:_p\d+)?)\b(?![^\n]*never executed)")
+
+
+async def copy_table(connection: AsyncConnection, schema: str, table_name: str) -> None:
+    """
+    Создаёт копию таблицы приложения без строк, индексов и внешних ключей.
+
+    :param connection: Соединение с базой данных.
+    :param schema: Схема копии.
+    :param table_name: Имя таблицы.
+    """
+    partition_key: Optional[str] = PARTITION_KEYS.get(table_name) if schema == "bench_hash" else None
+    partition_by: str = f" PARTITION BY HASH ({partition_key})" if partition_key else ""
+    await connection.execute(text(
+        f"CREATE TABLE {schema}.{table_name} (LIKE public.{table_name} INCLUDING DEFAULTS){partition_by}",
+    ))
+    if partition_key:
+        for remainder in range(PARTITIONS):
+            await connection.execute(text(
+                f"CREATE TABLE {schema}.{table_name}_p{remainder} PARTITION OF {schema}.{table_name} "
+                f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})",
+            ))
+
+
+async def create_indexes(connection: AsyncConnection, schema: str, table_name: str) -> None:
+    """
+    Строит первичный ключ и индексы копии по определениям индексов таблицы приложения.
+
+    :param connection: Соединение с базой данных.
+    :param schema: Схема копии.
+    :param table_name: Имя таблицы.
+    """
+    primary_key: List[str] = [PRIMARY_KEYS[table_name]]
+    if schema == "bench_hash" and table_name in PARTITION_KEYS:
+        primary_key.append(PARTITION_KEYS[table_name])
+    await connection.execute(text(f"ALTER TABLE {schema}.{table_name} ADD PRIMARY KEY ({', '.join(primary_key)})"))
+
+    definitions = await connection.execute(
+        text(
+            "SELECT pg_get_indexdef(x.indexrelid) FROM pg_index x "
+            "WHERE x.indrelid = to_regclass(:table_name) "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)",
+        ),
+        {"table_name": f"public.{table_name}"},
+    )
+    for definition in definitions.scalars().all():
+        await connection.execute(text(INDEX_TABLE_RE.sub(f" ON {schema}.{table_name} USING ", definition, count=1)))
+
+
+async def seed(schema: str) -> None:
+    """
+    Создаёт схему с копиями таблиц и заполняет их одинаковыми данными.
+
+    :param schema: Имя схемы.
+    """
+    async with db_engine.begin() as connection:
+        await connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        await connection.execute(text(f"CREATE SCHEMA {schema}"))
+        for table_name in PRIMARY_KEYS:
+            await copy_table(connection, schema, table_name)
+
+        await connection.execute(text(
+            f"INSERT INTO {schema}.users (id, name, secret_key) "
+            f"SELECT n, 'bench_' || n, 'bench_' || n FROM generate_series(1, {USERS}) n",
+        ))
+        await connection.execute(text(
+            f"INSERT INTO {schema}.tweets (id, tweet_data, user_id, conversation_id, path) "
+            f"SELECT n, 'Tweet ' || n, 1 + (n::bigint * 7919) % {USERS}, n, ARRAY[n] "
+            f"FROM generate_series(1, {TWEETS}) n",
+        ))
+        await connection.execute(text(
+            f"INSERT INTO {schema}.likes (id, user_id, tweet_id) "
+            f"SELECT t * {LIKES_PER_TWEET} + k, 1 + (t + k * 13) % {USERS}, t "
+            f"FROM generate_series(1, {TWEETS}) t, generate_series(0, {LIKES_PER_TWEET - 1}) k",
+        ))
+        for table_name in PRIMARY_KEYS:
+            await create_indexes(connection, schema, table_name)
+
+    async with db_engine.connect() as connection:
+        await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text(f"VACUUM ANALYZE {schema}.users, {schema}.tweets, {schema}.likes"))
+
+
+async def scanned_relations(connection: AsyncConnection, statement: Executable) -> List[str]:
+    """
+    Возвращает таблицы и секции, которые выполненный план действительно прочитал.
+
+    :param connection: Соединение с установленным ``search_path``.
+    :param statement: Запрос.
+    :return: Имена таблиц и секций.
+    """
+    sql: str = str(statement.compile(db_engine, compile_kwargs={"literal_binds": True}))
+    plan = await connection.execute(text(f"EXPLAIN (ANALYZE, COSTS OFF, TIMING OFF, SUMMARY OFF) {sql}"))
+    return sorted(set(SCANNED_RE.findall("\n".join(plan.scalars().all()))))
+
+
+async def measure(schema: str, plan_cache_mode: str) -> None:
+    """
+    Печатает прочитанные секции и среднюю задержку каждого запроса в схеме.
+
+    :param schema: Имя схемы.
+    :param plan_cache_mode: Режим ``plan_cache_mode``: ``auto`` (после пяти выполнений подготовленный
+        запрос получает общий план, секции отсекаются при его запуске) или ``force_custom_plan``
+        (план строится для каждого значения параметров, секции отсекаются при планировании).
+    """
+    async with db_engine.connect() as connection:
+        await connection.execute(text(f"SET search_path TO {schema}, public"))
+        await connection.execute(text(f"SET plan_cache_mode = {plan_cache_mode}"))
+        print(f"{SCHEMAS[schema]}, plan_cache_mode={plan_cache_mode}:")
+        for name, query in QUERIES.items():
+            keys: List[int] = random.Random(name).choices(range(1, QUERY_KEYS[name] + 1), k=REPEATS)
+            relations: List[str] = await scanned_relations(connection, query(keys[0]))
+
+            for key in keys[:10]:
+                await connection.execute(query(key))
+            started: float = time.perf_counter()
+            for key in keys:
+                (await connection.execute(query(key))).all()
+            latency: float = (time.perf_counter() - started) * 1000 / REPEATS
+
+            print(f"  {name:28} {latency:7.3f} ms, reads {len(relations):2}: {', '.join(relations)}")
+        await connection.rollback()
+
+
+async def main() -> None:
+    """Создаёт обе схемы, печатает планы и задержки и удаляет схемы."""
+    try:
+        for schema in SCHEMAS:
+            started: float = time.perf_counter()
+            await seed(schema)
+            print(f"{schema}: {TWEETS} tweets, {TWEETS * LIKES_PER_TWEET} likes, "
+                  f"seeded in {time.perf_counter() - started:.1f} s")
+
+        print(f"{PARTITIONS} partitions, {USERS} users; mean of {REPEATS} queries with random keys")
+        for plan_cache_mode in PLAN_CACHE_MODES:
+            for schema in SCHEMAS:
+                await measure(schema, plan_cache_mode)
+    finally:
+        async with db_engine.begin() as connection:
+            for schema in SCHEMAS:
+                await connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        await db_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""Ранжирование 100 тысяч кандидатов: sorted с lambda против векторных ранжировщиков.
+
+Подключение к базе данных не выполняется, но DATABASE_URL должна быть задана (её читает app.database).
+Запуск: ``python -m benchmarks.bench_ranking [число_кандидатов]``.
+"""
+
+import sys
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Callable
+
+import numpy as np
+
+from app.ranking import RANKERS, Candidates
+
+CANDIDATES: int = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+REPEATS: int = 5
+
+
+def best_of(func: Callable[[], object]) -> float:
+    """
+    Возвращает лучшее время из нескольких запусков.
+
+    :param func: Замеряемая функция.
+    :return: Миллисекунды.
+    """
+    timings: list[float] = []
+    for _ in range(REPEATS):
+        started: float = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def main() -> None:
+    """Печатает время ранжирования для старой сортировки и каждого ранжировщика."""
+    rng: np.random.Generator = np.random.default_rng(0)
+    now: float = time.time()
+    candidates: Candidates = Candidates(
+        ids=np.arange(1, CANDIDATES + 1, dtype=np.int64),
+        like_counts=rng.zipf(2.0, CANDIDATES).clip(max=100_000).astype(np.int64),
+        created_at=now - rng.uniform(0, 30 * 24 * 3600, CANDIDATES),
+    )
+    tweets: list[SimpleNamespace] = [
+        SimpleNamespace(
+            id=int(tweet_id),
+            likes=[None] * int(like_count),
+            created_at=datetime.fromtimestamp(created_at, tz=timezone.utc),
+        )
+        for tweet_id, like_count, created_at in zip(candidates.ids, candidates.like_counts, candidates.created_at)
+    ]
+
+    timings: dict[str, float] = {
+        "sorted(key=len(tweet.likes)) (before)": best_of(
+            lambda: sorted(tweets, key=lambda tweet: len(tweet.likes), reverse=True),
+        ),
+        "Candidates.from_tweets": best_of(lambda: Candidates.from_tweets(tweets)),
+    }
+    for name, ranker in RANKERS.items():
+        timings[f"{name} ranker"] = best_of(lambda: ranker.rank(candidates))
+
+    print(f"{CANDIDATES} candidates, best of {REPEATS}")
+    for name, elapsed in timings.items():
+        print(f"{name:40} {elapsed:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Чтение ленты из 10 тысяч твитов и профиля: загрузка в ORM против записей Core.
+
+Нужна база данных со схемой приложения (DATABASE_URL). Тестовые пользователи, твиты и лайки
+добавляются перед замером и удаляются после него.
+Запуск: ``python -m benchmarks.bench_read_path [число_твитов]``.
+"""
+
+import asyncio
+import sys
+import time
+import tracemalloc
+from typing import Awaitable, Callable
+
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.orm import selectinload
+
+from app import utils
+from app.database import async_session, db_engine
+from app.models import Follower, Like, Tweet, User
+from app.ranking import Candidates, get_ranker
+from app.routes import load_user_tweets
+from app.schemas import TweetsOut, UserProfileOut
+
+TWEETS: int = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+AUTHORS: int = 100
+FOLLOWERS: int = 2_000
+LIKES_PER_TWEET: int = 3
+REPEATS: int = 5
+
+
+async def seed() -> tuple[int, list[int]]:
+    """
+    Добавляет читателя, авторов ленты, подписчиков читателя, твиты и лайки.
+
+    :return: ID читателя и ID всех добавленных пользователей.
+    """
+    async with db_engine.begin() as connection:
+        user_ids: list[int] = list((await connection.execute(
+            text(
+                "INSERT INTO users (id, name, secret_key) "
+                "SELECT nextval('user_id_seq'), 'bench_' || n, 'bench_' || n "
+                "FROM generate_series(0, :count) n RETURNING id",
+            ),
+            {"count": AUTHORS + FOLLOWERS},
+        )).scalars())
+        reader, authors, followers = user_ids[0], user_ids[1:AUTHORS + 1], user_ids[AUTHORS + 1:]
+
+        await connection.execute(insert(Follower), [
+            *({"follower_id": reader, "followed_id": author} for author in authors),
+            *({"follower_id": follower, "followed_id": reader} for follower in followers),
+        ])
+        await connection.execute(
+            text(
+                "INSERT INTO tweets (id, tweet_data, user_id) "
+                "SELECT nextval('tweet_id_seq'), 'Tweet ' || n, a.ids[1 + n % cardinality(a.ids)] "
+                "FROM generate_series(1, :count) n, (SELECT CAST(:authors AS integer[]) AS ids) a",
+            ),
+            {"authors": authors, "count": TWEETS},
+        )
+        await connection.execute(
+            text(
+                "INSERT INTO likes (id, user_id, tweet_id) "
+                "SELECT nextval('like_id_seq'), l.ids[1 + (t.id * 7 + k) % cardinality(l.ids)], t.id "
+                "FROM tweets t, generate_series(1, :per_tweet) k, (SELECT CAST(:likers AS integer[]) AS ids) l "
+                "WHERE t.user_id = ANY(CAST(:authors AS integer[]))",
+            ),
+            {"likers": followers, "authors": authors, "per_tweet": LIKES_PER_TWEET},
+        )
+        await connection.execute(text("ANALYZE users, followers, tweets, likes"))
+
+    return reader, user_ids
+
+
+async def cleanup(user_ids: list[int]) -> None:
+    """
+    Удаляет добавленные данные.
+
+    :param user_ids: ID добавленных пользователей.
+    """
+    bench_tweets = select(Tweet.id).where(Tweet.user_id.in_(user_ids))
+    async with db_engine.begin() as connection:
+        await connection.execute(delete(Like).where(Like.tweet_id.in_(bench_tweets) | Like.user_id.in_(user_ids)))
+        await connection.execute(delete(Tweet).where(Tweet.user_id.in_(user_ids)))
+        await connection.execute(
+            delete(Follower).where(Follower.follower_id.in_(user_ids) | Follower.followed_id.in_(user_ids)),
+        )
+        await connection.execute(delete(User).where(User.id.in_(user_ids)))
+
+
+async def orm_feed(user_id: int) -> TweetsOut:
+    """
+    Прежнее чтение ленты: авторы, их твиты и лайки с лайкнувшими загружаются в ORM.
+
+    :param user_id: ID читателя.
+    :return: Лента.
+    """
+    async with async_session() as session:
+        async with session.begin():
+            followed_users = (await session.execute(
+                select(User).
+                join(Follower, User.id == Follower.followed_id).
+                filter(Follower.follower_id == user_id).
+                options(selectinload(User.tweets).selectinload(Tweet.likes).selectinload(Like.user)),
+            )).all()
+            tweets: list = [tweet for followed_user in followed_users for tweet in followed_user[0].tweets]
+            order = get_ranker("popularity").rank(Candidates.from_tweets(tweets))
+            sorted_tweets: list = [tweets[index] for index in order]
+            media_dict: dict = await utils.get_media_names(session, ())
+            tweets_data = await utils.tweet_response(media_dict=media_dict, tweets=sorted_tweets)
+    return TweetsOut(result=True, tweets=tweets_data)
+
+
+async def orm_profile(user_id: int) -> UserProfileOut:
+    """
+    Прежнее чтение профиля: пользователь, подписчики и подписки загружаются в ORM и ``to_json``.
+
+    :param user_id: ID пользователя.
+    :return: Профиль.
+    """
+    async with async_session() as session:
+        async with session.begin():
+            user = (await session.execute(
+                select(User).filter(User.id == user_id).options(
+                    selectinload(User.followers).selectinload(Follower.follower),
+                    selectinload(User.following).selectinload(Follower.followed),
+                ),
+            )).scalar()
+            return UserProfileOut(
+                result=True,
+                user=user.to_json(),
+                followers=[follower.follower.to_json() for follower in user.followers],
+                following=[followed.followed.to_json() for followed in user.following],
+            )
+
+
+async def measure(read: Callable[[], Awaitable[object]]) -> tuple[float, float, float]:
+    """
+    Измеряет чтение: лучшее процессорное и полное время и пик выделенной памяти.
+
+    :param read: Замеряемое чтение.
+    :return: Процессорное время в мс, полное время в мс, пик памяти в МиБ.
+    """
+    await read()
+    cpu_timings: list[float] = []
+    wall_timings: list[float] = []
+    for _ in range(REPEATS):
+        cpu_started: float = time.process_time()
+        wall_started: float = time.perf_counter()
+        await read()
+        cpu_timings.append((time.process_time() - cpu_started) * 1000)
+        wall_timings.append((time.perf_counter() - wall_started) * 1000)
+
+    tracemalloc.start()
+    await read()
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(cpu_timings), min(wall_timings), peak / 1024 / 1024
+
+
+async def main() -> None:
+    """Печатает время и память каждого варианта чтения ленты и профиля."""
+    reader, user_ids = await seed()
+    try:
+        ranker = get_ranker("popularity")
+        variants: dict[str, Callable[[], Awaitable[object]]] = {
+            "feed: ORM (before)": lambda: orm_feed(reader),
+            "feed: Core records": lambda: load_user_tweets(reader, ranker),
+            "profile: ORM (before)": lambda: orm_profile(reader),
+            "profile: Core records": lambda: utils.load_user_profile_data(reader),
+        }
+
+        print(f"{TWEETS} tweets from {AUTHORS} authors, {LIKES_PER_TWEET} likes each, "
+              f"profile with {FOLLOWERS} followers; best of {REPEATS}")
+        for name, read in variants.items():
+            cpu, wall, peak = await measure(read)
+            print(f"{name:25} cpu {cpu:8.1f} ms, wall {wall:8.1f} ms, peak memory {peak:7.1f} MiB")
+    finally:
+        await cleanup(user_ids)
+        await db_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""Окружение Alembic для асинхронного движка приложения."""
+
+import asyncio
+from logging.config import fileConfig
+from typing import Dict, Optional
+
+from alembic import context
+from sqlalchemy import pool, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import models  # noqa: F401 регистрирует таблицы в metadata
+from app.database import DATABASE_URL, metadata, wait_for_database
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = metadata
+
+
+def run_migrations_offline() -> None:
+    """Генерирует SQL миграций без подключения к базе данных (``alembic upgrade --sql``)."""
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+    """
+    Применяет миграции через синхронное соединение.
+
+    Секции таблиц при ``DB_HASH_PARTITIONS`` (``<таблица>_p<остаток>``) не описаны в metadata:
+    autogenerate и ``alembic check`` их не отражают, иначе предлагали бы удалить живые секции
+    вместе с их индексами.
+
+    :param connection: Соединение с базой данных.
+    """
+
+    def include_name(name: Optional[str], type_: str, parent_names: Dict[str, Optional[str]]) -> bool:
+        """
+        Пропускает секции при отражении схемы; индексы пропущенной таблицы не отражаются вместе с ней.
+
+        :param name: Имя объекта.
+        :param type_: Тип объекта (``table``, ``index``, ``column``, ...).
+        :param parent_names: Имена родительских объектов.
+        :return: True, если объект сравнивается с metadata.
+        """
+        if type_ != "table":
+            return True
+        return not connection.scalar(
+            text("SELECT relispartition FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": name},
+        )
+
+    context.configure(connection=connection, target_metadata=target_metadata, include_name=include_name)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_migrations_online() -> None:
+    """Применяет миграции к базе данных из DATABASE_URL."""
+    connectable = create_async_engine(DATABASE_URL, poolclass=pool.NullPool)
+    await wait_for_database(connectable)
+
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await connectable.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_migrations_online())
@@ -0,0 +1,115 @@
+"""Общие операции для ревизий Alembic."""
+
+from typing import List, Optional, Tuple
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def create_index_concurrently(index_name: str, create_sql: str) -> None:
+    """
+    Строит индекс через ``CREATE INDEX CONCURRENTLY IF NOT EXISTS``.
+
+    Вызывать внутри ``op.get_context().autocommit_block()``: CONCURRENTLY нельзя
+    выполнять в транзакции. Прерванное построение оставляет невалидный индекс,
+    который IF NOT EXISTS пропустил бы, поэтому такой индекс сначала удаляется.
+
+    :param index_name: Имя индекса.
+    :param create_sql: Команда ``CREATE [UNIQUE] INDEX CONCURRENTLY IF NOT EXISTS ...``.
+    """
+    op.execute(
+        f"DO $$ BEGIN IF EXISTS (SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        f"WHERE c.relname = '{index_name}' AND NOT i.indisvalid) "
+        f"THEN DROP INDEX {index_name}; END IF; END $$",
+    )
+    op.execute(create_sql)
+
+
+def drop_index_concurrently(index_name: str) -> None:
+    """
+    Удаляет индекс через ``DROP INDEX CONCURRENTLY IF EXISTS``.
+
+    :param index_name: Имя индекса.
+    """
+    op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+
+
+def is_partitioned(table_name: str) -> bool:
+    """
+    Проверяет, секционирована ли таблица.
+
+    :param table_name: Имя таблицы.
+    :return: True, если таблица секционирована.
+    """
+    return bool(op.get_bind().execute(
+        sa.text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table_name))"),
+        {"table_name": table_name},
+    ).scalar())
+
+
+def rebuild_table(
+    table_name: str,
+    primary_key: List[str],
+    partition_key: Optional[str] = None,
+    partitions: int = 0,
+) -> None:
+    """
+    Пересоздаёт таблицу с переносом строк: секционированной по hash ключа или обычной.
+
+    Новая таблица получает те же колонки и значения по умолчанию, первичный ключ
+    ``primary_key``, прежние внешние ключи и индексы (их определения берутся
+    из каталога до удаления старой таблицы). Внешние ключи других таблиц, ссылающиеся
+    на пересоздаваемую, удаляются: восстанавливать их, если это возможно, должна ревизия.
+    Таблица переписывается целиком под исключительной блокировкой.
+
+    :param table_name: Имя таблицы.
+    :param primary_key: Колонки первичного ключа; у секционированной таблицы он включает ключ секционирования.
+    :param partition_key: Колонка ключа секционирования; None - обычная таблица.
+    :param partitions: Число секций ``<таблица>_p<остаток>``.
+    """
+    bind = op.get_bind()
+    indexes: List[str] = list(bind.execute(
+        sa.text(
+            "SELECT pg_get_indexdef(x.indexrelid) FROM pg_index x WHERE x.indrelid = to_regclass(:table_name) "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid) "
+            "ORDER BY x.indexrelid",
+        ),
+        {"table_name": table_name},
+    ).scalars())
+    foreign_keys: List[Tuple[str, str]] = list(bind.execute(
+        sa.text(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(:table_name) AND contype = 'f' ORDER BY oid",
+        ),
+        {"table_name": table_name},
+    ).all())
+    referencing: List[Tuple[str, str]] = list(bind.execute(
+        sa.text(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE confrelid = to_regclass(:table_name) AND contype = 'f' AND conrelid <> confrelid",
+        ),
+        {"table_name": table_name},
+    ).all())
+
+    new_table: str = f"{table_name}_rebuilt"
+    partition_by: str = f" PARTITION BY HASH ({partition_key})" if partition_key else ""
+    op.execute(f"CREATE TABLE {new_table} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS){partition_by}")
+    if partition_key:
+        for remainder in range(partitions):
+            op.execute(
+                f"CREATE TABLE {table_name}_p{remainder} PARTITION OF {new_table} "
+                f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})",
+            )
+    op.execute(f"INSERT INTO {new_table} SELECT * FROM {table_name}")
+
+    for referencing_table, constraint_name in referencing:
+        op.execute(f"ALTER TABLE {referencing_table} DROP CONSTRAINT {constraint_name}")
+    op.execute(f"DROP TABLE {table_name}")
+    op.execute(f"ALTER TABLE {new_table} RENAME TO {table_name}")
+
+    op.execute(f"ALTER TABLE {table_name} ADD CONSTRAINT {table_name}_pkey PRIMARY KEY ({', '.join(primary_key)})")
+    for constraint_name, definition in foreign_keys:
+        op.execute(f"ALTER TABLE {table_name} ADD CONSTRAINT {constraint_name} {definition}")
+    for definition in indexes:
+        # Индекс секционированной таблицы описан как ON ONLY: такой индекс не строится на секциях.
+        op.execute(definition.replace(" ON ONLY ", " ON ", 1))
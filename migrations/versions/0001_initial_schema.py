@@ -0,0 +1,74 @@
+"""Исходная схема, которую раньше создавал metadata.create_all.
+
+Существующую базу, созданную create_all, достаточно пометить этой ревизией:
+``alembic stamp 0001``.
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-01-15 12:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.schema import CreateSequence, DropSequence
+
+revision: str = "0001"
+down_revision: str | None = None
+branch_labels = None
+depends_on = None
+
+SEQUENCES: tuple[str, ...] = ("user_id_seq", "tweet_id_seq", "like_id_seq", "media_id_seq")
+
+
+def upgrade() -> None:
+    for sequence_name in SEQUENCES:
+        op.execute(CreateSequence(sa.Sequence(sequence_name)))
+
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), sa.Sequence("user_id_seq"), primary_key=True),
+        sa.Column("name", sa.String(50), nullable=False),
+        sa.Column("secret_key", sa.String(), nullable=False),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+
+    op.create_table(
+        "tweets",
+        sa.Column("id", sa.Integer(), sa.Sequence("tweet_id_seq"), primary_key=True),
+        sa.Column("tweet_data", sa.String(280), nullable=False),
+        sa.Column("tweet_media_ids", sa.ARRAY(sa.Integer())),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+    )
+    op.create_index("ix_tweets_id", "tweets", ["id"])
+    op.create_index("ix_tweets_user_id", "tweets", ["user_id"])
+
+    op.create_table(
+        "likes",
+        sa.Column("id", sa.Integer(), sa.Sequence("like_id_seq"), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("tweet_id", sa.Integer(), sa.ForeignKey("tweets.id")),
+    )
+    op.create_index("ix_likes_id", "likes", ["id"])
+    op.create_index("ix_likes_user_id", "likes", ["user_id"])
+    op.create_index("ix_likes_tweet_id", "likes", ["tweet_id"])
+
+    op.create_table(
+        "followers",
+        sa.Column("follower_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("followed_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+    )
+
+    op.create_table(
+        "medias",
+        sa.Column("id", sa.Integer(), sa.Sequence("media_id_seq"), primary_key=True),
+        sa.Column("file_name", sa.String()),
+    )
+    op.create_index("ix_medias_id", "medias", ["id"])
+
+
+def downgrade() -> None:
+    for table_name in ("medias", "followers", "likes", "tweets", "users"):
+        op.drop_table(table_name)
+
+    for sequence_name in SEQUENCES:
+        op.execute(DropSequence(sa.Sequence(sequence_name)))
@@ -0,0 +1,45 @@
+"""Индексы под рабочую нагрузку, строятся без блокировки записи (CONCURRENTLY).
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-01-15 12:30:00
+"""
+
+from alembic import op
+
+from migrations.helpers import create_index_concurrently, drop_index_concurrently
+
+revision: str = "0002"
+down_revision: str | None = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES: dict[str, str] = {
+    "ix_likes_tweet_id_user_id": "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_likes_tweet_id_user_id "
+                                 "ON likes (tweet_id, user_id)",
+    "ix_followers_followed_id": "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_followers_followed_id "
+                                "ON followers (followed_id)",
+    "ix_tweets_user_id_id_desc": "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tweets_user_id_id_desc "
+                                 "ON tweets (user_id, id DESC)",
+    "ix_users_secret_key": "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_secret_key ON users (secret_key)",
+}
+
+
+def upgrade() -> None:
+    # Уникальный индекс не построится поверх дублей, оставляем самый ранний лайк.
+    op.execute(
+        "DELETE FROM likes WHERE id IN ("
+        "SELECT id FROM (SELECT id, row_number() OVER (PARTITION BY tweet_id, user_id ORDER BY id) AS rn "
+        "FROM likes) AS ranked WHERE ranked.rn > 1)",
+    )
+
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции.
+    with op.get_context().autocommit_block():
+        for index_name, create_sql in INDEXES.items():
+            create_index_concurrently(index_name, create_sql)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for index_name in reversed(INDEXES):
+            drop_index_concurrently(index_name)
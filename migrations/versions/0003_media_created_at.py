@@ -0,0 +1,42 @@
+"""Время загрузки медиа и индексы для сборщика неиспользуемых медиафайлов.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-01-22 10:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from migrations.helpers import create_index_concurrently, drop_index_concurrently
+
+revision: str = "0003"
+down_revision: str | None = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES: dict[str, str] = {
+    "ix_medias_file_name": "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_medias_file_name ON medias (file_name)",
+    "ix_tweets_tweet_media_ids": "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tweets_tweet_media_ids "
+                                 "ON tweets USING gin (tweet_media_ids)",
+}
+
+
+def upgrade() -> None:
+    # now() стабильна, поэтому столбец добавляется без перезаписи таблицы.
+    op.add_column(
+        "medias",
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+    with op.get_context().autocommit_block():
+        for index_name, create_sql in INDEXES.items():
+            create_index_concurrently(index_name, create_sql)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for index_name in reversed(INDEXES):
+            drop_index_concurrently(index_name)
+
+    op.drop_column("medias", "created_at")
@@ -0,0 +1,27 @@
+"""Время создания твита для ранжирования ленты.
+
+Существующие твиты получают время применения миграции.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-01-29 10:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0004"
+down_revision: str | None = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tweets",
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("tweets", "created_at")
@@ -0,0 +1,45 @@
+"""Таблица фоновых задач.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-02-05 10:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateSequence, DropSequence
+
+revision: str = "0005"
+down_revision: str | None = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(CreateSequence(sa.Sequence("job_id_seq")))
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.BigInteger(), sa.Sequence("job_id_seq"), primary_key=True),
+        sa.Column("type", sa.String(100), nullable=False),
+        sa.Column("payload", postgresql.JSONB(), nullable=False, server_default=sa.text("'{}'::jsonb")),
+        sa.Column("status", sa.String(20), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("max_attempts", sa.Integer(), nullable=False, server_default="5"),
+        sa.Column("run_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column("locked_at", sa.DateTime(timezone=True)),
+        sa.Column("last_error", sa.String()),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index(
+        "ix_jobs_pending_type_run_at",
+        "jobs",
+        ["type", "run_at"],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_jobs_pending_type_run_at", table_name="jobs")
+    op.drop_table("jobs")
+    op.execute(DropSequence(sa.Sequence("job_id_seq")))
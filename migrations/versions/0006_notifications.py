@@ -0,0 +1,49 @@
+"""Таблица агрегированных уведомлений.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-02-12 10:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateSequence, DropSequence
+
+revision: str = "0006"
+down_revision: str | None = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(CreateSequence(sa.Sequence("notification_id_seq")))
+    op.create_table(
+        "notifications",
+        sa.Column("id", sa.BigInteger(), sa.Sequence("notification_id_seq"), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("kind", sa.String(20), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), sa.ForeignKey("tweets.id", ondelete="CASCADE")),
+        sa.Column("bucket", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("actor_ids", postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column("actor_count", sa.Integer(), nullable=False, server_default="1"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index(
+        "ix_notifications_user_id_kind_target_bucket",
+        "notifications",
+        ["user_id", "kind", sa.text("coalesce(tweet_id, 0)"), "bucket"],
+        unique=True,
+    )
+    op.create_index(
+        "ix_notifications_user_id_updated_at_id",
+        "notifications",
+        ["user_id", sa.text("updated_at DESC"), sa.text("id DESC")],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_notifications_user_id_updated_at_id", table_name="notifications")
+    op.drop_index("ix_notifications_user_id_kind_target_bucket", table_name="notifications")
+    op.drop_table("notifications")
+    op.execute(DropSequence(sa.Sequence("notification_id_seq")))
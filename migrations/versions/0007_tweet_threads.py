@@ -0,0 +1,48 @@
+"""Обсуждения: корень обсуждения и материализованный путь твита.
+
+Существующие твиты становятся корнями своих обсуждений. Столбцы заполняются
+пачками по id, чтобы не держать блокировку всей таблицы одной транзакцией.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2024-02-19 10:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+from migrations.helpers import create_index_concurrently, drop_index_concurrently
+
+revision: str = "0007"
+down_revision: str | None = "0006"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE: int = 10000
+INDEX_NAME: str = "ix_tweets_conversation_id_path"
+
+
+def upgrade() -> None:
+    op.add_column("tweets", sa.Column("conversation_id", sa.Integer()))
+    op.add_column("tweets", sa.Column("path", postgresql.ARRAY(sa.Integer())))
+
+    with op.get_context().autocommit_block():
+        max_id: int = op.get_bind().execute(sa.text("SELECT COALESCE(max(id), 0) FROM tweets")).scalar()
+        for start in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+            op.execute(
+                f"UPDATE tweets SET conversation_id = id, path = ARRAY[id] "
+                f"WHERE id >= {start} AND id < {start + BACKFILL_BATCH_SIZE} AND path IS NULL",
+            )
+        create_index_concurrently(
+            INDEX_NAME,
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} ON tweets (conversation_id, path)",
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        drop_index_concurrently(INDEX_NAME)
+
+    op.drop_column("tweets", "path")
+    op.drop_column("tweets", "conversation_id")
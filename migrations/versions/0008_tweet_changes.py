@@ -0,0 +1,42 @@
+"""Журнал изменений твитов для синхронизации ленты и время изменения твита.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2024-02-26 10:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.schema import CreateSequence, DropSequence
+
+revision: str = "0008"
+down_revision: str | None = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # now() стабильна, поэтому столбец добавляется без перезаписи таблицы.
+    op.add_column(
+        "tweets",
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+    op.execute(CreateSequence(sa.Sequence("tweet_change_id_seq")))
+    op.create_table(
+        "tweet_changes",
+        sa.Column("id", sa.BigInteger(), sa.Sequence("tweet_change_id_seq"), primary_key=True),
+        sa.Column("txid", sa.BigInteger(), nullable=False, server_default=sa.func.txid_current()),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(20), nullable=False),
+        sa.Column("tweet_id", sa.Integer()),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index("ix_tweet_changes_user_id_txid", "tweet_changes", ["user_id", "txid"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tweet_changes_user_id_txid", table_name="tweet_changes")
+    op.drop_table("tweet_changes")
+    op.execute(DropSequence(sa.Sequence("tweet_change_id_seq")))
+    op.drop_column("tweets", "updated_at")
@@ -0,0 +1,60 @@
+"""Необязательное hash-секционирование tweets по user_id и likes по tweet_id.
+
+Число секций задаётся ``alembic -x hash_partitions=N upgrade head`` или переменной
+окружения DB_HASH_PARTITIONS (та же переменная включает секционирование в моделях
+приложения); 0 - таблицы остаются обычными, и ревизия ничего не делает.
+
+Первичные ключи секционированных таблиц включают ключ секционирования, поэтому внешние
+ключи likes.tweet_id и notifications.tweet_id на tweets.id удаляются: лайки и уведомления
+твита удаляет приложение. Таблицы переписываются целиком под исключительной блокировкой.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2024-03-11 10:00:00
+"""
+
+import os
+
+from alembic import context, op
+
+from migrations.helpers import is_partitioned, rebuild_table
+
+revision: str = "0010"
+down_revision: str | None = "0009"
+branch_labels = None
+depends_on = None
+
+
+def hash_partitions() -> int:
+    """
+    Возвращает число секций из аргумента ``-x hash_partitions`` или DB_HASH_PARTITIONS.
+
+    :return: Число секций; 0 - без секционирования.
+    """
+    return int(context.get_x_argument(as_dictionary=True).get(
+        "hash_partitions", os.getenv("DB_HASH_PARTITIONS", "0"),
+    ))
+
+
+def upgrade() -> None:
+    partitions: int = hash_partitions()
+    if not partitions or is_partitioned("tweets"):
+        return
+
+    rebuild_table("tweets", ["id", "user_id"], partition_key="user_id", partitions=partitions)
+    rebuild_table("likes", ["id", "tweet_id"], partition_key="tweet_id", partitions=partitions)
+
+
+def downgrade() -> None:
+    if not is_partitioned("tweets"):
+        return
+
+    rebuild_table("likes", ["id"])
+    op.execute("ALTER TABLE likes ALTER COLUMN tweet_id DROP NOT NULL")
+    rebuild_table("tweets", ["id"])
+    op.execute("ALTER TABLE tweets ALTER COLUMN user_id DROP NOT NULL")
+
+    op.create_foreign_key("likes_tweet_id_fkey", "likes", "tweets", ["tweet_id"], ["id"])
+    op.create_foreign_key(
+        "notifications_tweet_id_fkey", "notifications", "tweets", ["tweet_id"], ["id"], ondelete="CASCADE",
+    )
@@ -0,0 +1,36 @@
+"""Сессии возобновляемой загрузки медиафайлов.
+
+Внешнего ключа на users нет, как у jobs и idempotency_keys: временные строки не мешают
+массовой загрузке с очисткой таблиц, а брошенные загрузки удаляет сборщик медиафайлов.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2024-03-18 10:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0011"
+down_revision: str | None = "0010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "media_uploads",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("file_name", sa.String(255), nullable=False),
+        sa.Column("upload_length", sa.BigInteger(), nullable=False),
+        sa.Column("upload_offset", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_media_uploads_expires_at", "media_uploads", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_media_uploads_expires_at", table_name="media_uploads")
+    op.drop_table("media_uploads")
@@ -0,0 +1,37 @@
+"""Пользователи, учтённые в агрегированных уведомлениях.
+
+Счётчик уведомления считает разных пользователей, а не события. Для существующих уведомлений
+учтёнными считаются сохранённые в них последние пользователи (``actor_ids``).
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2024-03-25 10:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0012"
+down_revision: str | None = "0011"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "notification_actors",
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        sa.Column("kind", sa.String(20), primary_key=True),
+        sa.Column("target", sa.Integer(), primary_key=True),
+        sa.Column("bucket", sa.DateTime(timezone=True), primary_key=True),
+        sa.Column("actor_id", sa.Integer(), primary_key=True),
+    )
+    op.execute(
+        "INSERT INTO notification_actors (user_id, kind, target, bucket, actor_id) "
+        "SELECT DISTINCT n.user_id, n.kind, coalesce(n.tweet_id, 0), n.bucket, a.actor_id "
+        "FROM notifications n CROSS JOIN unnest(n.actor_ids) AS a(actor_id)",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("notification_actors")
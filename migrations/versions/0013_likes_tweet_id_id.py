@@ -0,0 +1,48 @@
+"""Индекс лайков твита в порядке их установки.
+
+Индекс ``(tweet_id, id)`` заменяет ``ix_likes_tweet_id``: сводка лайков ленты берёт
+по нему первых лайкнувших и считает лайки твита без чтения таблицы. Секционированную
+таблицу нельзя индексировать через CONCURRENTLY, поэтому для неё индексы
+строятся и удаляются обычными командами.
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2024-04-01 10:00:00
+"""
+
+from alembic import op
+
+from migrations.helpers import create_index_concurrently, drop_index_concurrently, is_partitioned
+
+revision: str = "0013"
+down_revision: str | None = "0012"
+branch_labels = None
+depends_on = None
+
+
+def replace_index(create_name: str, create_columns: str, drop_name: str) -> None:
+    """
+    Строит индекс лайков и удаляет заменённый им.
+
+    :param create_name: Имя нового индекса.
+    :param create_columns: Колонки нового индекса.
+    :param drop_name: Имя удаляемого индекса.
+    """
+    if is_partitioned("likes"):
+        op.execute(f"CREATE INDEX IF NOT EXISTS {create_name} ON likes ({create_columns})")
+        op.execute(f"DROP INDEX IF EXISTS {drop_name}")
+        return
+
+    with op.get_context().autocommit_block():
+        create_index_concurrently(
+            create_name, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {create_name} ON likes ({create_columns})",
+        )
+        drop_index_concurrently(drop_name)
+
+
+def upgrade() -> None:
+    replace_index("ix_likes_tweet_id_id", "tweet_id, id", "ix_likes_tweet_id")
+
+
+def downgrade() -> None:
+    replace_index("ix_likes_tweet_id", "tweet_id", "ix_likes_tweet_id_id")
@@ -0,0 +1,36 @@
+"""Граница журнала изменений твитов и удаление tweets.updated_at.
+
+Старые записи ``tweet_changes`` удаляются по сроку хранения, а граница удалённого
+хранится в ``tweet_changes_horizon``. Столбец ``tweets.updated_at`` не читался:
+синхронизация ленты идёт по журналу изменений, а лайки строку твита не меняют.
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2024-04-08 10:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0014"
+down_revision: str | None = "0013"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tweet_changes_horizon",
+        sa.Column("txid", sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.drop_column("tweets", "updated_at")
+
+
+def downgrade() -> None:
+    # now() стабильна, поэтому столбец добавляется без перезаписи таблицы.
+    op.add_column(
+        "tweets",
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.drop_table("tweet_changes_horizon")
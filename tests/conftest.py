@@ -1,30 +1,212 @@
-"""Модуль основных настроек и фикстур для тестов."""
+"""Модуль основных настроек и фикстур для тестов.
 
+Схема и начальные данные создаются один раз в шаблонной базе ``<база>_template``
+(она пересоздаётся, только когда меняются модели или начальные данные), а каждый
+процесс pytest-xdist работает со своей копией ``<база>_test_<процесс>``, созданной
+через ``CREATE DATABASE ... TEMPLATE``. Каждый тест выполняется внутри транзакции
+соединения, которая откатывается после теста: сессии приложения привязываются к этому
+соединению и фиксируют свою работу в SAVEPOINT. Поэтому тесты не зависят друг от друга
+и от порядка запуска: ``pytest -n auto``.
+
+Тесты с пометкой ``commits`` (отдельные соединения, LISTEN/NOTIFY, COPY, SKIP LOCKED)
+работают с настоящими фиксациями; после них таблицы очищаются и заполняются начальными данными.
+"""
+
+import asyncio
+import hashlib
 import os
 
+import asyncpg
 import pytest_asyncio
-from asgi_lifespan import LifespanManager
-from httpx import AsyncClient
+from sqlalchemy import event, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+# Процессы xdist наследуют окружение главного процесса, поэтому исходный адрес сохраняется отдельно.
+BASE_DATABASE_URL: URL = make_url(os.environ.setdefault("TEST_BASE_DATABASE_URL", os.environ["DATABASE_URL"]))
+TEMPLATE_DATABASE: str = f"{BASE_DATABASE_URL.database}_template"
+WORKER_DATABASE: str = f"{BASE_DATABASE_URL.database}_test_{os.getenv('PYTEST_XDIST_WORKER', 'main')}"
+TEMPLATE_LOCK_ID: int = 7_044_044
+
+# Приложение читает DATABASE_URL при импорте, поэтому адрес копии задаётся до импорта app.
+os.environ["DATABASE_URL"] = BASE_DATABASE_URL.set(database=WORKER_DATABASE).render_as_string(hide_password=False)
+
+from asgi_lifespan import LifespanManager  # noqa: E402
+from httpx import AsyncClient  # noqa: E402
+from sqlalchemy.schema import CreateIndex, CreateTable  # noqa: E402
+
+from app.database import DB_HASH_PARTITIONS, INITIAL_DATA, async_session, db_engine, metadata  # noqa: E402
+from app.fastapi_app import UPLOAD_DIR, app  # noqa: E402
+
+# Значения последовательностей в шаблоне: (имя, last_value), заполняется в pytest_sessionstart.
+seed_sequences: list[tuple[str, int | None]] = []
+
+
+def asyncpg_url(database: str) -> str:
+    """
+    Возвращает строку подключения asyncpg к базе данных на том же сервере.
+
+    :param database: Имя базы данных.
+    :return: Строка подключения.
+    """
+    return BASE_DATABASE_URL.set(drivername="postgresql", database=database).render_as_string(hide_password=False)
+
+
+def schema_fingerprint() -> str:
+    """
+    Возвращает хэш схемы и начальных данных: шаблон пересоздаётся, когда он меняется.
+
+    :return: SHA-256 в шестнадцатеричном виде.
+    """
+    digest = hashlib.sha256(repr((INITIAL_DATA, DB_HASH_PARTITIONS)).encode())
+    for table in metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(db_engine)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(db_engine)).encode())
+    return digest.hexdigest()
+
+
+async def create_template(admin: asyncpg.Connection, fingerprint: str) -> None:
+    """
+    Создаёт шаблонную базу со схемой и начальными данными.
+
+    :param admin: Соединение с основной базой данных.
+    :param fingerprint: Хэш схемы, сохраняемый в комментарии базы.
+    """
+    await admin.execute(f'DROP DATABASE IF EXISTS "{TEMPLATE_DATABASE}"')
+    await admin.execute(f'CREATE DATABASE "{TEMPLATE_DATABASE}"')
+
+    template_engine = create_async_engine(
+        BASE_DATABASE_URL.set(database=TEMPLATE_DATABASE),
+        poolclass=NullPool,
+    )
+    try:
+        async with template_engine.begin() as connection:
+            await connection.run_sync(metadata.create_all)
+    finally:
+        await template_engine.dispose()
+
+    # Комментарий ставится последним: шаблон, создание которого прервалось, будет пересоздан.
+    await admin.execute(f"COMMENT ON DATABASE \"{TEMPLATE_DATABASE}\" IS '{fingerprint}'")
+
 
-from app.database import db_engine, metadata
-from app.fastapi_app import UPLOAD_DIR, app
+async def prepare_databases() -> list[tuple[str, int | None]]:
+    """
+    Создаёт (при необходимости) шаблонную базу и копию для текущего процесса.
+
+    Процессы pytest-xdist выполняют это по очереди под advisory-блокировкой.
+
+    :return: Значения последовательностей копии.
+    """
+    admin: asyncpg.Connection = await asyncpg.connect(asyncpg_url(BASE_DATABASE_URL.database))
+    try:
+        await admin.execute("SELECT pg_advisory_lock($1)", TEMPLATE_LOCK_ID)
+        try:
+            fingerprint: str = schema_fingerprint()
+            current: str | None = await admin.fetchval(
+                "SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = $1",
+                TEMPLATE_DATABASE,
+            )
+            if current != fingerprint:
+                await create_template(admin, fingerprint)
+
+            await admin.execute(f'DROP DATABASE IF EXISTS "{WORKER_DATABASE}" WITH (FORCE)')
+            await admin.execute(f'CREATE DATABASE "{WORKER_DATABASE}" TEMPLATE "{TEMPLATE_DATABASE}"')
+        finally:
+            await admin.execute("SELECT pg_advisory_unlock($1)", TEMPLATE_LOCK_ID)
+    finally:
+        await admin.close()
+
+    worker: asyncpg.Connection = await asyncpg.connect(asyncpg_url(WORKER_DATABASE))
+    try:
+        rows = await worker.fetch("SELECT sequencename, last_value FROM pg_sequences ORDER BY sequencename")
+    finally:
+        await worker.close()
+    return [(row["sequencename"], row["last_value"]) for row in rows]
+
+
+def pytest_sessionstart(session) -> None:
+    """
+    Готовит базу данных процесса перед запуском тестов.
+
+    Главный процесс ``pytest -n`` тесты не выполняет, и база ему не нужна.
+
+    :param session: Сессия pytest.
+    """
+    if session.config.getoption("numprocesses", None) and not hasattr(session.config, "workerinput"):
+        return
+    seed_sequences[:] = asyncio.run(prepare_databases())
+
+
+def reset_sequences_sql(restart: bool = False) -> str:
+    """
+    Возвращает запрос, возвращающий последовательности к значениям шаблона.
+
+    ``setval`` не откатывается вместе с транзакцией, поэтому последовательности
+    сбрасываются перед каждым тестом, и id в тестах не зависят от предыдущих тестов.
+
+    :param restart: Сбросить последовательности в начало (перед повторной вставкой начальных данных).
+    :return: SQL-запрос.
+    """
+    calls: list[str] = [
+        f"setval('{name}', 1, false)" if restart or last_value is None else f"setval('{name}', {last_value}, true)"
+        for name, last_value in seed_sequences
+    ]
+    return f"SELECT {', '.join(calls)}"
+
+
+async def restore_seed_data() -> None:
+    """Очищает таблицы и заново вставляет начальные данные после теста с настоящими фиксациями."""
+    async with db_engine.begin() as connection:
+        await connection.execute(text(f"TRUNCATE {', '.join(table.name for table in metadata.sorted_tables)}"))
+        await connection.execute(text(reset_sequences_sql(restart=True)))
+        for table in metadata.sorted_tables:
+            if INITIAL_DATA.get(table.name):
+                await connection.execute(table.insert(), INITIAL_DATA[table.name])
 
 
 @pytest_asyncio.fixture(autouse=True, scope="function")
-async def prepare_db() -> None:
+async def prepare_db(request) -> None:
     """
-    Подготавливает базу данных перед выполнением тестов.
+    Изолирует тест: выполняет его в транзакции, которая откатывается после теста.
 
-    Создает все таблицы базы данных перед тестированием и удаляет их после тестирования.
+    Сессии ``async_session`` привязываются к соединению теста. Каждая сессия работает
+    в SAVEPOINT: фиксация сессии освобождает его, откат возвращает к нему, и после
+    любого из них начинается новый SAVEPOINT для следующей сессии.
 
+    :param request: Запрос фикстуры pytest.
     :return: None
     """
-    async with LifespanManager(app):
-        async with db_engine.begin() as conn_create:
-            await conn_create.run_sync(metadata.create_all)
+    if request.node.get_closest_marker("commits"):
+        async with db_engine.begin() as connection:
+            await connection.execute(text(reset_sequences_sql()))
+        yield
+        await restore_seed_data()
+        await db_engine.dispose()
+        return
+
+    connection: AsyncConnection = await db_engine.connect()
+    transaction = await connection.begin()
+    await connection.execute(text(reset_sequences_sql()))
+    await connection.begin_nested()
+
+    def restart_savepoint(session: Session, session_transaction) -> None:
+        if session.bind is connection.sync_connection and not connection.sync_connection.in_nested_transaction():
+            connection.sync_connection.begin_nested()
+
+    event.listen(Session, "after_transaction_end", restart_savepoint)
+    async_session.configure(bind=connection)
+    try:
         yield
-        async with db_engine.begin() as conn_drop:
-            await conn_drop.run_sync(metadata.drop_all)
+    finally:
+        async_session.configure(bind=db_engine)
+        event.remove(Session, "after_transaction_end", restart_savepoint)
+        await transaction.rollback()
+        await connection.close()
+        # У каждого теста свой event loop: соединения пула нельзя переносить в следующий тест.
+        await db_engine.dispose()
 
 
 @pytest_asyncio.fixture(scope="function")
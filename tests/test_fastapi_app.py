@@ -1,12 +1,49 @@
 """Модуль, содержащий тесты для маршрутов приложения."""
 
+import asyncio
+import json
+import logging
+import os
+import re
+from contextlib import suppress
+from datetime import datetime, timezone
 from typing import Any
-
-from httpx import AsyncClient
-from sqlalchemy import select
-
-from app.database import async_session
-from app.models import Follower, Like, Media, Tweet
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from app.access_log import access_logger
+from app.bulk import export_tables, import_tables
+from app.cache import caches, profile_cache
+from app.coalesce import SingleFlight
+from app.compression import CompressionMiddleware
+from app.database import (
+    DB_HASH_PARTITIONS, async_session, db_engine, find_missing_indexes, wait_for_database, warm_up_pool,
+)
+from app.fastapi_app import app
+from app.idempotency import DatabaseIdempotencyStore, MemoryIdempotencyStore, StoredResponse, idempotent
+from app.invalidation import INVALIDATION_CHANNEL, InvalidationBus, asyncpg_dsn
+from app.jobs import JobHandler, JobWorker, enqueue
+from app.media_gc import CollectionReport, collect_orphan_media
+from app.metrics import metrics
+from app.models import Follower, Job, Like, Media, MediaUpload, NotificationActor, Tweet, TweetChange, User
+from app.precompress import precompress_directory
+from app.ranking import Candidates, EngagementRanker, PopularityRanker, RecentRanker
+from app.rate_limit import (
+    STATEMENT_TIMEOUTS_MS, BucketConfig, KnownApiKeys, RateLimitMiddleware, known_api_keys,
+)
+from app.schemas import TweetIn
+from app.static_files import IMMUTABLE_CACHE_CONTROL, PrecompressedStaticFiles
+from app import changes, records, routes, uploads, utils
+from app.utils import hot_queries, stream_user_tweets
 
 test_headers = {
     1: {"api-key": "test"},
@@ -22,6 +59,10 @@ async def test_add_tweet(client: AsyncClient) -> None:
     :param client: Клиент для отправки запросов API.
     :return: None
     """
+    async with async_session() as session:
+        async with session.begin():
+            session.add_all([Media(file_name=f"/static/images/{uuid4()}.jpg") for _ in range(3)])
+
     tweet_data: dict[str, Any] = {
         "tweet_data": "Test tweet",
         "tweet_media_ids": [1, 2, 3],
@@ -34,14 +75,35 @@ async def test_add_tweet(client: AsyncClient) -> None:
     async with async_session() as session:
         result_tweet = await session.execute(select(Tweet).where(Tweet.id == 4))
         new_tweet = result_tweet.scalar()
-        assert new_tweet.to_json() == {
+        new_tweet_json = new_tweet.to_json()
+        assert isinstance(new_tweet_json.pop("created_at"), datetime)
+        assert new_tweet_json == {
             "id": 4,
             "tweet_data": "Test tweet",
             "tweet_media_ids": [1, 2, 3],
             "user_id": 1,
+            "conversation_id": 4,
+            "path": [4],
         }
 
 
+async def test_add_tweet_with_missing_media(client: AsyncClient) -> None:
+    """
+    Тест для попытки прикрепить к твиту несуществующее медиа.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    response = await client.post(
+        "/api/tweets", headers=test_headers[1], json={"tweet_data": "Test tweet", "tweet_media_ids": [404]},
+    )
+    assert response.status_code == 400
+    assert response.json() == {"error_message": "Media not found", "error_type": "CustomException"}
+
+    async with async_session() as session:
+        assert (await session.execute(select(func.count(Tweet.id)))).scalar() == 3
+
+
 async def test_delete_tweet(client: AsyncClient) -> None:
     """
     Тест для удаления твита через API.
@@ -57,6 +119,7 @@ async def test_delete_tweet(client: AsyncClient) -> None:
         result_tweet = await session.execute(select(Tweet).where(Tweet.id == 1))
         old_tweet = result_tweet.scalar()
         assert old_tweet is None
+        assert (await session.execute(select(func.count(Like.id)).where(Like.tweet_id == 1))).scalar() == 0
 
 
 async def test_add_like(client: AsyncClient) -> None:
@@ -300,3 +363,1250 @@ async def test_upload_wrong_media(client: AsyncClient, cleanup_uploaded_files) -
     response = await client.post("/api/medias", headers=test_headers[1], files=files)
     assert response.status_code == 400
     assert response.json() == {"error_message": "Invalid file type", "error_type": "CustomException"}
+
+
+async def test_resumable_media_upload(client: AsyncClient, tmp_path, monkeypatch) -> None:
+    """
+    Тест для возобновляемой загрузки медиафайла частями.
+
+    :param client: Клиент для отправки запросов API.
+    :param tmp_path: Временный каталог для частично загруженных файлов.
+    :param monkeypatch: Фикстура для подмены каталога временных файлов.
+    :return: None
+    """
+    monkeypatch.setattr(uploads, "MEDIA_UPLOAD_TMP_DIR", str(tmp_path))
+    chunk_headers: dict = {**test_headers[1], "Content-Type": uploads.UPLOAD_CONTENT_TYPE}
+
+    response = await client.post(
+        "/api/medias/uploads", headers=test_headers[1], json={"filename": "test_file.txt", "length": 10},
+    )
+    assert response.status_code == 400
+
+    response = await client.post(
+        "/api/medias/uploads", headers=test_headers[1], json={"filename": "test_file.gif", "length": 10},
+    )
+    assert response.status_code == 201
+    upload_id: str = response.json()["upload_id"]
+    assert response.headers["Location"] == f"/api/medias/uploads/{upload_id}"
+    assert response.json()["offset"] == 0
+
+    response = await client.patch(
+        f"/api/medias/uploads/{upload_id}", headers={**chunk_headers, "Upload-Offset": "0"}, content=b"Hello",
+    )
+    assert response.status_code == 200
+    assert response.headers["Upload-Offset"] == "5"
+
+    # Повтор уже принятой части и часть длиннее файла не меняют принятые байты.
+    response = await client.patch(
+        f"/api/medias/uploads/{upload_id}", headers={**chunk_headers, "Upload-Offset": "0"}, content=b"Hello",
+    )
+    assert response.status_code == 409
+    response = await client.patch(
+        f"/api/medias/uploads/{upload_id}", headers={**chunk_headers, "Upload-Offset": "5"}, content=b"World!",
+    )
+    assert response.status_code == 400
+
+    response = await client.head(f"/api/medias/uploads/{upload_id}", headers=test_headers[1])
+    assert response.status_code == 200
+    assert (response.headers["Upload-Offset"], response.headers["Upload-Length"]) == ("5", "10")
+    assert (await client.head(f"/api/medias/uploads/{upload_id}", headers=test_headers[2])).status_code == 404
+
+    response = await client.post(f"/api/medias/uploads/{upload_id}/complete", headers=test_headers[1])
+    assert response.status_code == 409
+
+    response = await client.patch(
+        f"/api/medias/uploads/{upload_id}", headers={**chunk_headers, "Upload-Offset": "5"}, content=b"World",
+    )
+    assert response.json()["offset"] == 10
+
+    # Транзакция завершения не зафиксирована: файл возвращается во временный каталог.
+    async def failing_delete(self, instance) -> None:
+        raise RuntimeError("commit failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(AsyncSession, "delete", failing_delete)
+        with pytest.raises(RuntimeError):
+            await client.post(f"/api/medias/uploads/{upload_id}/complete", headers=test_headers[1])
+    assert [path.name for path in tmp_path.iterdir()] == [f"{upload_id}{uploads.TEMP_SUFFIX}"]
+    assert not os.path.exists(os.path.join(routes.UPLOAD_DIR, f"{upload_id}.gif"))
+
+    response = await client.post(f"/api/medias/uploads/{upload_id}/complete", headers=test_headers[1])
+    assert response.status_code == 201
+    assert response.json() == {"result": True, "media_id": 1}
+
+    media_path: str = os.path.join(routes.UPLOAD_DIR, f"{upload_id}.gif")
+    try:
+        with open(media_path, "rb") as media_file:
+            assert media_file.read() == b"HelloWorld"
+    finally:
+        os.remove(media_path)
+    assert list(tmp_path.iterdir()) == []
+
+    async with async_session() as session:
+        media = (await session.execute(select(Media).where(Media.id == 1))).scalar_one()
+        assert media.file_name == f"/static/images/{upload_id}.gif"
+        assert (await session.execute(select(MediaUpload))).scalars().all() == []
+
+
+async def test_find_missing_indexes(client: AsyncClient) -> None:
+    """
+    Тест для проверки поиска индексов, которых нет в базе данных.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    async with db_engine.connect() as conn:
+        async with conn.begin() as transaction:
+            assert await find_missing_indexes(conn) == []
+
+            await conn.execute(text("DROP INDEX ix_users_secret_key"))
+            assert await find_missing_indexes(conn) == ["ix_users_secret_key"]
+            await transaction.rollback()
+
+
+@pytest.mark.skipif(not DB_HASH_PARTITIONS, reason="tweets и likes не секционированы (DB_HASH_PARTITIONS=0)")
+async def test_partition_pruning() -> None:
+    """
+    Тест для секционирования: запросы по автору и по твиту читают одну секцию.
+
+    :return: None
+    """
+    queries: dict = {
+        "tweets": [utils.tweet_export_query(1), utils.tweet_delete_queries(1, 1)[-1]],
+        "likes": [
+            utils.like_query(1, 1), utils.likes_page_query(1, 10), utils.like_delete_query(1, 1),
+            utils.tweet_delete_queries(1, 1)[0],
+        ],
+    }
+
+    async with db_engine.connect() as conn:
+        for table_name, statements in queries.items():
+            for statement in statements:
+                sql: str = str(statement.compile(db_engine, compile_kwargs={"literal_binds": True}))
+                plan: list[str] = (await conn.execute(text(f"EXPLAIN {sql}"))).scalars().all()
+                partitions: set[str] = set(re.findall(rf"\bon ({table_name}_p\d+)\b", "\n".join(plan)))
+                assert len(partitions) == 1, f"{sql}\n" + "\n".join(plan)
+
+
+async def test_warm_up_pool(client: AsyncClient) -> None:
+    """
+    Тест для прогрева пула соединений горячими запросами.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    await db_engine.dispose()
+    await warm_up_pool(hot_queries(), size=3)
+
+    assert db_engine.pool.checkedin() == 3
+
+
+async def test_wait_for_unavailable_database() -> None:
+    """
+    Тест для ожидания недоступной базы данных: после таймаута ошибка пробрасывается.
+
+    :return: None
+    """
+    unavailable_engine = create_async_engine("postgresql+asyncpg://user@127.0.0.1:1/postgres")
+
+    with pytest.raises((OSError, DBAPIError)):
+        await wait_for_database(unavailable_engine, timeout=0.3, initial_delay=0.1)
+
+    await unavailable_engine.dispose()
+
+
+async def test_access_log_record(client: AsyncClient) -> None:
+    """
+    Тест для структурированной записи журнала запросов.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    records: list[logging.LogRecord] = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    access_logger.addHandler(handler)
+
+    try:
+        await client.get(f"/api/users/{2}", headers=test_headers[1])
+        await client.get(f"/api/users/{10}", headers=test_headers[1])
+    finally:
+        access_logger.removeHandler(handler)
+
+    ok_record, error_record = (record.msg for record in records)
+    assert ok_record["method"] == "GET"
+    assert ok_record["route"] == "/api/users/{user_id}"
+    assert ok_record["status"] == 200
+    assert ok_record["db_ms"] > 0
+    assert ok_record["duration_ms"] >= ok_record["db_ms"]
+    assert error_record["status"] == 404
+
+
+async def test_access_log_failed_query(client: AsyncClient) -> None:
+    """
+    Тест для учёта времени SQL-запроса, завершившегося ошибкой.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    async with db_engine.connect() as connection:
+        with pytest.raises(DBAPIError):
+            await connection.execute(text("SELECT 1 / 0"))
+        assert connection.sync_connection.info["query_start"] == []
+
+
+async def test_rate_limit_per_api_key() -> None:
+    """
+    Тест для ограничения частоты запросов по API-ключу и классу маршрута.
+
+    :return: None
+    """
+    limited_app = FastAPI()
+
+    @limited_app.get("/api/ping")
+    async def ping():
+        return {"result": True}
+
+    known_keys = KnownApiKeys()
+    for headers in test_headers.values():
+        known_keys.add(headers["api-key"])
+    limited_app.add_middleware(
+        RateLimitMiddleware, limits={"read": BucketConfig(rate=0.5, burst=2)}, known_keys=known_keys,
+    )
+
+    async with AsyncClient(app=limited_app, base_url="http://test") as limited_client:
+        statuses = [(await limited_client.get("/api/ping", headers=test_headers[1])).status_code for _ in range(3)]
+        assert statuses == [200, 200, 429]
+
+        response = await limited_client.get("/api/ping", headers=test_headers[1])
+        assert response.headers["Retry-After"] == "2"
+        assert response.json() == {"error_message": "Too many requests", "error_type": "CustomException"}
+
+        response = await limited_client.get("/api/ping", headers=test_headers[2])
+        assert response.status_code == 200
+
+        # Непроверенные ключи не получают своих вёдер: все они делят ведро адреса клиента.
+        statuses = [
+            (await limited_client.get("/api/ping", headers={"api-key": f"bogus_{number}"})).status_code
+            for number in range(3)
+        ]
+        assert statuses == [200, 200, 429]
+        assert (await limited_client.get("/api/ping", headers=test_headers[3])).status_code == 200
+
+
+async def test_rate_limit_per_client_address_behind_proxy() -> None:
+    """
+    Тест для отдельных вёдер клиентов с непроверенными ключами за прокси.
+
+    За nginx адрес соединения у всех запросов один; uvicorn с ``--proxy-headers`` берёт адрес
+    клиента из X-Forwarded-For, если запрос пришёл от доверенного прокси.
+
+    :return: None
+    """
+    limited_app = FastAPI()
+
+    @limited_app.get("/api/ping")
+    async def ping():
+        return {"result": True}
+
+    limited_app.add_middleware(
+        RateLimitMiddleware, limits={"read": BucketConfig(rate=0.5, burst=2)}, known_keys=KnownApiKeys(),
+    )
+    proxied_app = ProxyHeadersMiddleware(limited_app, trusted_hosts="172.28.0.250")
+    transport = ASGITransport(app=proxied_app, client=("172.28.0.250", 40000))
+
+    async with AsyncClient(transport=transport, base_url="http://test") as limited_client:
+        flooder = {"api-key": "bogus", "x-forwarded-for": "203.0.113.1"}
+        statuses = [(await limited_client.get("/api/ping", headers=flooder)).status_code for _ in range(3)]
+        assert statuses == [200, 200, 429]
+
+        newcomer = {"api-key": "not_validated_yet", "x-forwarded-for": "203.0.113.2"}
+        assert (await limited_client.get("/api/ping", headers=newcomer)).status_code == 200
+
+        # Подставленный клиентом X-Forwarded-For не помогает: nginx дописывает настоящий адрес в конец.
+        spoofed = {"api-key": "bogus", "x-forwarded-for": "203.0.113.2, 203.0.113.1"}
+        assert (await limited_client.get("/api/ping", headers=spoofed)).status_code == 429
+
+
+async def test_api_key_becomes_rate_limit_key(client: AsyncClient) -> None:
+    """
+    Тест для запоминания API-ключа после успешной проверки.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    await client.get("/api/users/me", headers={"api-key": "bogus"})
+    await client.get("/api/users/me", headers=test_headers[2])
+
+    assert "bogus" not in known_api_keys
+    assert "test_2" in known_api_keys
+
+
+async def test_statement_timeout_returns_503(client: AsyncClient, monkeypatch) -> None:
+    """
+    Тест для ответа 503, когда SQL-запрос отменён таймаутом класса маршрута.
+
+    :param client: Клиент для отправки запросов API.
+    :param monkeypatch: Фикстура для подмены таймаута.
+    :return: None
+    """
+    monkeypatch.setitem(STATEMENT_TIMEOUTS_MS, "read", 10)
+
+    async def slow_check_api_key() -> None:
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(text("SELECT pg_sleep(1)"))
+
+    app.dependency_overrides[utils.check_api_key] = slow_check_api_key
+    try:
+        response = await client.get("/api/users/me", headers=test_headers[1])
+    finally:
+        app.dependency_overrides.pop(utils.check_api_key)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert response.json() == {"error_message": "Database statement timeout", "error_type": "CustomException"}
+
+
+async def test_load_shedding_over_concurrency_limit() -> None:
+    """
+    Тест для немедленного ответа 503, когда превышен лимит одновременных запросов.
+
+    :return: None
+    """
+    release = asyncio.Event()
+    limited_app = FastAPI()
+
+    @limited_app.get("/api/slow")
+    async def slow():
+        await release.wait()
+        return {"result": True}
+
+    limited_app.add_middleware(RateLimitMiddleware, max_concurrent=1, enabled=False)
+
+    async with AsyncClient(app=limited_app, base_url="http://test") as limited_client:
+        slow_request = asyncio.create_task(limited_client.get("/api/slow"))
+        await asyncio.sleep(0.05)
+
+        response = await limited_client.get("/api/slow")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+        release.set()
+        assert (await slow_request).status_code == 200
+
+
+async def test_single_flight_coalesces_concurrent_calls(client: AsyncClient) -> None:
+    """
+    Тест для объединения одинаковых параллельных чтений и метрик объединения.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    flight = SingleFlight()
+    calls: list[int] = []
+
+    async def load() -> int:
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 42
+
+    coalesced_before = metrics.get("singleflight.test.coalesced")
+    results = await asyncio.gather(*(flight.do(("test", 1), load) for _ in range(5)))
+
+    assert results == [42] * 5
+    assert len(calls) == 1
+    assert metrics.get("singleflight.test.coalesced") - coalesced_before == 4
+
+    response = await client.get("/api/metrics")
+    assert response.status_code == 422
+
+    response = await client.get("/api/metrics", headers={"api-key": "bogus"})
+    assert response.status_code == 401
+
+    response = await client.get("/api/metrics", headers=test_headers[1])
+    assert response.status_code == 200
+    assert response.json()["singleflight.test.coalesced"] >= 4
+
+
+async def test_single_flight_cancellation() -> None:
+    """
+    Тест для отмены: отмена одного ожидающего не отменяет вычисление, отмена всех - отменяет.
+
+    :return: None
+    """
+    flight = SingleFlight()
+    started = asyncio.Event()
+    finished: list[bool] = []
+
+    async def load() -> str:
+        started.set()
+        await asyncio.sleep(0.05)
+        finished.append(True)
+        return "profile"
+
+    first = asyncio.create_task(flight.do(("test", 2), load))
+    second = asyncio.create_task(flight.do(("test", 2), load))
+    await started.wait()
+    first.cancel()
+
+    assert await second == "profile"
+    assert first.cancelled()
+
+    started.clear()
+    only = asyncio.create_task(flight.do(("test", 3), load))
+    await started.wait()
+    only.cancel()
+    await asyncio.sleep(0.1)
+
+    assert finished == [True]
+
+    # Вызов сразу после отмены последнего ожидающего начинает новое вычисление,
+    # а не присоединяется к отменённому.
+    started.clear()
+    cancelled = asyncio.create_task(flight.do(("test", 4), load))
+    await started.wait()
+    cancelled.cancel()
+    with suppress(asyncio.CancelledError):
+        await cancelled
+    assert await flight.do(("test", 4), load) == "profile"
+
+
+async def test_collect_orphan_media(client: AsyncClient, tmp_path) -> None:
+    """
+    Тест для сборщика медиафайлов, на которые не ссылается ни один твит.
+
+    :param client: Клиент для отправки запросов API.
+    :param tmp_path: Временный каталог загрузок.
+    :return: None
+    """
+    used_name, orphan_name, unregistered_name = (f"{uuid4()}.jpg" for _ in range(3))
+    for file_name in (used_name, orphan_name, unregistered_name, "example_app.png"):
+        (tmp_path / file_name).write_bytes(b"12345")
+
+    async with async_session() as session:
+        async with session.begin():
+            used_media = Media(file_name=f"/static/images/{used_name}")
+            orphan_media = Media(file_name=f"/static/images/{orphan_name}")
+            session.add_all([used_media, orphan_media])
+            await session.flush()
+            session.add(Tweet(tweet_data="With media", tweet_media_ids=[used_media.id], user_id=1))
+
+    report = await collect_orphan_media(grace_seconds=0, upload_dir=str(tmp_path), pause=0)
+
+    assert report == CollectionReport(media_rows=1, files=2, bytes_reclaimed=10)
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([used_name, "example_app.png"])
+
+    async with async_session() as session:
+        media_ids = (await session.execute(select(Media.id))).scalars().all()
+        assert media_ids == [used_media.id]
+
+
+@pytest.mark.commits
+async def test_collect_orphan_media_skips_media_of_uncommitted_tweet(tmp_path) -> None:
+    """
+    Тест для сборщика, который работает одновременно с созданием твита с тем же медиа.
+
+    Транзакция твита блокирует медиа раньше, чем твит становится виден сборщику,
+    поэтому сборщик пропускает его, а не удаляет из-под твита.
+
+    :param tmp_path: Временный каталог загрузок.
+    :return: None
+    """
+    file_name = f"{uuid4()}.jpg"
+    (tmp_path / file_name).write_bytes(b"12345")
+    async with async_session() as session:
+        async with session.begin():
+            media = Media(file_name=f"/static/images/{file_name}")
+            session.add(media)
+
+    async with async_session() as tweet_session:
+        async with tweet_session.begin():
+            await routes.create_tweet(
+                tweet_session, TweetIn(tweet_data="With media", tweet_media_ids=[media.id]), User(id=1),
+            )
+            report = await collect_orphan_media(grace_seconds=0, upload_dir=str(tmp_path), pause=0)
+            assert report == CollectionReport()
+
+    report = await collect_orphan_media(grace_seconds=0, upload_dir=str(tmp_path), pause=0)
+    assert report == CollectionReport()
+    assert [path.name for path in tmp_path.iterdir()] == [file_name]
+
+
+async def test_collect_expired_uploads(client: AsyncClient, tmp_path) -> None:
+    """
+    Тест для сборщика брошенных возобновляемых загрузок.
+
+    :param client: Клиент для отправки запросов API.
+    :param tmp_path: Временный каталог загрузок.
+    :return: None
+    """
+    (tmp_path / "images").mkdir()
+    expired_id, active_id = str(uuid4()), str(uuid4())
+    expires_at: dict = {expired_id: datetime(2020, 1, 1, tzinfo=timezone.utc), active_id: uploads.expiry()}
+    for upload_id in expires_at:
+        (tmp_path / f"{upload_id}{uploads.TEMP_SUFFIX}").write_bytes(b"12345")
+
+    async with async_session() as session:
+        async with session.begin():
+            session.add_all([
+                MediaUpload(
+                    id=upload_id, user_id=1, file_name="test_file.gif", upload_length=10, upload_offset=5,
+                    expires_at=expires_at[upload_id],
+                )
+                for upload_id in expires_at
+            ])
+
+    report = await collect_orphan_media(
+        grace_seconds=0, upload_dir=str(tmp_path / "images"), upload_tmp_dir=str(tmp_path), pause=0,
+    )
+
+    assert report == CollectionReport(files=1, bytes_reclaimed=5, uploads=1)
+    assert {path.name for path in tmp_path.iterdir()} == {"images", f"{active_id}{uploads.TEMP_SUFFIX}"}
+
+    async with async_session() as session:
+        assert (await session.execute(select(MediaUpload.id))).scalars().all() == [active_id]
+
+
+async def test_get_user_tweets_ranking(client: AsyncClient) -> None:
+    """
+    Тест для выбора ранжировщика ленты в запросе.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    await client.post("/api/tweets", headers=test_headers[2], json={"tweet_data": "Fresh tweet"})
+
+    popular = (await client.get("/api/tweets", headers=test_headers[1])).json()["tweets"]
+    recent = (await client.get("/api/tweets?ranking=recent", headers=test_headers[1])).json()["tweets"]
+    engagement = (await client.get("/api/tweets?ranking=engagement", headers=test_headers[1])).json()["tweets"]
+
+    like_counts = [len(tweet["likes"]) for tweet in popular]
+    assert like_counts == sorted(like_counts, reverse=True)
+    assert recent[0]["content"] == "Fresh tweet"
+    assert {tweet["id"] for tweet in engagement} == {tweet["id"] for tweet in popular}
+
+    response = await client.get("/api/tweets?ranking=random", headers=test_headers[1])
+    assert response.status_code == 400
+
+
+def test_engagement_ranker_decays_old_tweets() -> None:
+    """
+    Тест для затухания оценки вовлечённости со временем.
+
+    :return: None
+    """
+    now = 1_700_000_000.0
+    candidates = Candidates(
+        ids=np.array([1, 2, 3]),
+        like_counts=np.array([100, 5, 0]),
+        created_at=np.array([now - 30 * 24 * 3600, now - 3600, now]),
+    )
+
+    assert list(PopularityRanker().rank(candidates)) == [0, 1, 2]
+    assert list(RecentRanker().rank(candidates)) == [2, 1, 0]
+    assert list(EngagementRanker(now=now).rank(candidates)) == [1, 2, 0]
+
+
+async def wait_until(condition, timeout: float = 5.0) -> None:
+    """
+    Ждёт, пока условие не станет истинным.
+
+    :param condition: Функция без аргументов, возвращающая bool.
+    :param timeout: Максимальное время ожидания в секундах.
+    :return: None
+    """
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+async def test_feed_like_summaries(client: AsyncClient, monkeypatch) -> None:
+    """
+    Тест для ленты со сводками лайков и постраничного списка лайков твита.
+
+    :param client: Клиент для отправки запросов API.
+    :param monkeypatch: Фикстура подмены атрибутов.
+    :return: None
+    """
+    monkeypatch.setattr(utils, "FEED_TOP_LIKERS", 1)
+
+    response = await client.get("/api/tweets?likes=summary&ranking=popularity", headers=test_headers[1])
+    assert response.status_code == 200
+    tweets = {tweet["id"]: tweet for tweet in response.json()["tweets"]}
+    assert tweets[2]["like_count"] == 2
+    assert tweets[2]["likes"] == [{"user_id": 1, "name": "user_1"}]
+    assert tweets[2]["liked_by_me"] is True
+    assert {key: tweets[3][key] for key in ("like_count", "likes", "liked_by_me")} == {
+        "like_count": 0, "likes": [], "liked_by_me": False,
+    }
+    assert "like_count" not in (await client.get("/api/tweets", headers=test_headers[1])).json()["tweets"][0]
+    assert (await client.get("/api/tweets?likes=all", headers=test_headers[1])).status_code == 400
+
+    first = (await client.get("/api/tweets/1/likes?limit=1", headers=test_headers[1])).json()
+    assert first["likes"] == [{"user_id": 2, "name": "user_2"}]
+    second = (await client.get(f"/api/tweets/1/likes?cursor={first['next_cursor']}", headers=test_headers[1])).json()
+    assert second == {"result": True, "likes": [{"user_id": 3, "name": "user_3"}], "next_cursor": None}
+    assert (await client.get("/api/tweets/100/likes", headers=test_headers[1])).status_code == 404
+
+
+async def test_feed_and_profile_records(client: AsyncClient) -> None:
+    """
+    Тест для чтения ленты и профиля в записи Core без загрузки объектов ORM.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    async with async_session() as session:
+        tweets = await records.get_feed_tweets(session, 1)
+        likes = await records.get_feed_likes(session, 1)
+        profile = await records.get_profile(session, 1)
+
+    assert [(tweet.id, tweet.author_id, tweet.author_name) for tweet in tweets] == [(2, 2, "user_2"), (3, 3, "user_3")]
+    assert not hasattr(tweets[0], "__dict__")
+    assert likes == {2: {"likes": [{"user_id": 1, "name": "user_1"}, {"user_id": 3, "name": "user_3"}]}}
+    assert records.feed_response(tweets[1:], {}, likes) == [
+        {"id": 3, "content": tweets[1].content, "attachments": [], "author": {"id": 3, "name": "user_3"}, "likes": []},
+    ]
+    assert records.profile_response(profile) == {
+        "result": True,
+        "user": {"id": 1, "name": "user_1"},
+        "followers": [{"id": 3, "name": "user_3"}],
+        "following": [{"id": 2, "name": "user_2"}, {"id": 3, "name": "user_3"}],
+    }
+
+
+@pytest.mark.commits
+async def test_idempotency_keys(client: AsyncClient, cleanup_uploaded_files) -> None:
+    """
+    Тест для ключей идемпотентности: повтор и параллельный дубликат не создают второй твит или файл.
+
+    :param client: Клиент для отправки запросов API.
+    :param cleanup_uploaded_files: Фикстура для очистки загруженных файлов.
+    :return: None
+    """
+    headers = {**test_headers[1], "Idempotency-Key": "tweet-1"}
+    first, second = await asyncio.gather(
+        client.post("/api/tweets", headers=headers, json={"tweet_data": "Once"}),
+        client.post("/api/tweets", headers=headers, json={"tweet_data": "Once"}),
+    )
+    assert (first.status_code, second.status_code) == (201, 201)
+    assert first.json() == second.json() == {"result": True, "id": 4}
+    assert "idempotent-replayed" in first.headers or "idempotent-replayed" in second.headers
+
+    replay = await client.post("/api/tweets", headers=headers, json={"tweet_data": "Once"})
+    assert (replay.json(), replay.headers["idempotent-replayed"]) == ({"result": True, "id": 4}, "true")
+    assert (await client.post("/api/tweets", headers=headers, json={"tweet_data": "Other"})).status_code == 422
+    other_user = await client.post(
+        "/api/tweets", headers={**test_headers[2], "Idempotency-Key": "tweet-1"}, json={"tweet_data": "Once"},
+    )
+    assert other_user.json()["id"] == 5
+
+    async with async_session() as session:
+        assert await session.scalar(select(func.count(Tweet.id)).where(Tweet.tweet_data == "Once")) == 2
+
+    media_headers = {**test_headers[1], "Idempotency-Key": "media-1"}
+    responses = [
+        await client.post("/api/medias", headers=media_headers, files={"file": ("test_file.jpg", b"123", "image/jpeg")})
+        for _ in range(2)
+    ]
+    assert responses[0].json() == responses[1].json()
+    async with async_session() as session:
+        assert await session.scalar(select(func.count(Media.id))) == 1
+
+
+async def test_idempotency_response_committed_with_data() -> None:
+    """
+    Тест для ключа идемпотентности: ответ фиксируется вместе с твитом, и сбой после фиксации
+    не приводит к созданию дубликата при повторе.
+
+    :return: None
+    """
+    class CrashingStore(DatabaseIdempotencyStore):
+        async def finish(self, key, response, stored=False) -> None:
+            raise RuntimeError("worker crashed")
+
+    async with async_session() as session:
+        user: User = await session.get(User, 1)
+
+    async def create(session) -> Any:
+        return await routes.create_tweet(session, TweetIn(tweet_data="Exactly once"), user)
+
+    with pytest.raises(RuntimeError):
+        await idempotent("crash-1", user.id, "POST /api/tweets", "hash", 201, create, store=CrashingStore())
+
+    replay = await idempotent(
+        "crash-1", user.id, "POST /api/tweets", "hash", 201, create, store=DatabaseIdempotencyStore(),
+    )
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    async with async_session() as session:
+        assert await session.scalar(select(func.count(Tweet.id)).where(Tweet.tweet_data == "Exactly once")) == 1
+
+
+async def test_memory_idempotency_store() -> None:
+    """
+    Тест для хранилища ключей в памяти: ограниченный размер, истечение и освобождение после ошибки.
+
+    :return: None
+    """
+    store = MemoryIdempotencyStore(max_entries=2, ttl=60)
+    for index in range(3):
+        assert await store.begin((1, "POST /api/tweets", str(index)), "hash") is None
+        await store.finish((1, "POST /api/tweets", str(index)), StoredResponse(201, {"id": index}))
+
+    assert await store.begin((1, "POST /api/tweets", "0"), "hash") is None
+    assert await store.begin((1, "POST /api/tweets", "2"), "hash") == StoredResponse(201, {"id": 2})
+
+    await store.release((1, "POST /api/tweets", "0"))
+    assert await store.begin((1, "POST /api/tweets", "0"), "other") is None
+
+    expiring = MemoryIdempotencyStore(ttl=0)
+    await expiring.begin((1, "scope", "key"), "hash")
+    await expiring.finish((1, "scope", "key"), StoredResponse(201, {}))
+    assert await expiring.begin((1, "scope", "key"), "hash") is None
+
+
+@pytest.mark.commits
+async def test_feed_changes(client: AsyncClient) -> None:
+    """
+    Тест для синхронизации ленты по водяному знаку.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    start = (await client.get("/api/tweets/changes", headers=test_headers[1])).json()
+    assert start["reset"] is True
+
+    empty = (await client.get(f"/api/tweets/changes?since={start['watermark']}", headers=test_headers[1])).json()
+    assert (empty["reset"], empty["created"], empty["deleted"], empty["likes"]) == (False, [], [], [])
+
+    created = (await client.post("/api/tweets", headers=test_headers[2], json={"tweet_data": "New"})).json()["id"]
+    removed = (await client.post("/api/tweets", headers=test_headers[3], json={"tweet_data": "Gone"})).json()["id"]
+    await client.delete(f"/api/tweets/{removed}", headers=test_headers[3])
+    await client.post("/api/tweets/2/likes", headers=test_headers[2])
+    await client.delete("/api/tweets/1/likes", headers=test_headers[2])
+
+    delta = (await client.get(f"/api/tweets/changes?since={start['watermark']}", headers=test_headers[1])).json()
+    assert delta["reset"] is False
+    assert [(tweet["id"], tweet["content"], tweet["like_count"]) for tweet in delta["created"]] == [(created, "New", 0)]
+    assert delta["deleted"] == [removed]
+    assert delta["likes"] == [{"id": 2, "like_count": 3, "liked_by_me": True}]
+    # xmin снимка общий для сервера: открытые транзакции тестов других процессов xdist задерживают
+    # водяной знак, и изменения приходят повторно. Без xdist других транзакций нет.
+    if os.getenv("PYTEST_XDIST_WORKER") is None:
+        assert delta["watermark"] > start["watermark"]
+        later = (await client.get(f"/api/tweets/changes?since={delta['watermark']}", headers=test_headers[1])).json()
+        assert (later["created"], later["deleted"], later["likes"]) == ([], [], [])
+
+    await client.delete("/api/users/3/follow", headers=test_headers[1])
+    reset = (await client.get(f"/api/tweets/changes?since={delta['watermark']}", headers=test_headers[1])).json()
+    assert reset["reset"] is True
+
+
+@pytest.mark.commits
+async def test_feed_changes_purge(client: AsyncClient) -> None:
+    """
+    Тест для удаления старых записей журнала изменений: клиент со знаком ниже границы получает reset.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    start = (await client.get("/api/tweets/changes", headers=test_headers[1])).json()
+    old = (await client.post("/api/tweets", headers=test_headers[2], json={"tweet_data": "Old"})).json()["id"]
+    await asyncio.sleep(0.2)
+    retention_start: datetime = datetime.now(timezone.utc)
+    new = (await client.post("/api/tweets", headers=test_headers[2], json={"tweet_data": "New"})).json()["id"]
+
+    retention: float = (datetime.now(timezone.utc) - retention_start).total_seconds()
+    assert await changes.purge_changes(retention_seconds=retention, batch_size=1, pause=0) >= 1
+
+    async with async_session() as session:
+        kept = (await session.execute(select(TweetChange.tweet_id).where(TweetChange.kind == "created"))).scalars()
+        assert new in kept.all()
+        assert await session.scalar(select(func.count()).where(TweetChange.tweet_id == old)) == 0
+
+    reset = (await client.get(f"/api/tweets/changes?since={start['watermark']}", headers=test_headers[1])).json()
+    assert reset["reset"] is True
+    # Открытые транзакции других процессов xdist держат xmin снимка ниже границы, и знак
+    # остаётся под ней. Без xdist других транзакций нет.
+    if os.getenv("PYTEST_XDIST_WORKER") is None:
+        resumed = (await client.get(f"/api/tweets/changes?since={reset['watermark']}", headers=test_headers[1])).json()
+        assert resumed["reset"] is False
+
+
+async def test_reply_threads(client: AsyncClient) -> None:
+    """
+    Тест для ответов на твиты и постраничного чтения ветки обсуждения.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    async def reply(user_id: int, parent_id: int) -> int:
+        response = await client.post(
+            "/api/tweets",
+            headers=test_headers[user_id],
+            json={"tweet_data": f"Re: {parent_id}", "reply_to": parent_id},
+        )
+        assert response.status_code == 201
+        return response.json()["id"]
+
+    first = await reply(2, 1)
+    nested = await reply(3, first)
+    second = await reply(1, 1)
+    deep = await reply(1, nested)
+    other = await reply(1, 2)
+
+    response = await client.get("/api/tweets/1/thread", headers=test_headers[1])
+    assert response.status_code == 200
+    thread = response.json()
+    assert thread["conversation_id"] == 1
+    assert [(tweet["id"], tweet["parent_id"], tweet["depth"]) for tweet in thread["tweets"]] == [
+        (1, None, 0), (first, 1, 1), (nested, first, 2), (deep, nested, 3), (second, 1, 1),
+    ]
+    assert other not in [tweet["id"] for tweet in thread["tweets"]]
+
+    shallow = (await client.get("/api/tweets/1/thread?max_depth=1", headers=test_headers[1])).json()
+    assert [tweet["id"] for tweet in shallow["tweets"]] == [1, first, second]
+
+    page = (await client.get(f"/api/tweets/{first}/thread?limit=2", headers=test_headers[1])).json()
+    assert [tweet["id"] for tweet in page["tweets"]] == [first, nested]
+    assert page["next_cursor"] == f"1.{first}.{nested}"
+    page = (
+        await client.get(f"/api/tweets/{first}/thread?limit=2&cursor={page['next_cursor']}", headers=test_headers[1])
+    ).json()
+    assert ([tweet["id"] for tweet in page["tweets"]], page["next_cursor"]) == ([deep], None)
+
+    await client.delete(f"/api/tweets/{nested}", headers=test_headers[3])
+    thread = (await client.get("/api/tweets/1/thread", headers=test_headers[1])).json()
+    assert [(tweet["id"], tweet["parent_id"]) for tweet in thread["tweets"]][2] == (deep, nested)
+
+    assert (await client.post(
+        "/api/tweets", headers=test_headers[1], json={"tweet_data": "Re", "reply_to": 100},
+    )).status_code == 404
+    assert (await client.get("/api/tweets/100/thread", headers=test_headers[1])).status_code == 404
+
+
+async def test_cache_invalidation_bus(client: AsyncClient, monkeypatch) -> None:
+    """
+    Тест для инвалидации кэшей: запись в своём воркере, сообщение от другого воркера и переподключение шины.
+
+    :param client: Клиент для отправки запросов API.
+    :param monkeypatch: Фикстура pytest для включения кэшей.
+    :return: None
+    """
+    for cache in caches.values():
+        monkeypatch.setattr(cache, "enabled", True)
+
+    bus = InvalidationBus(asyncpg_dsn(), health_interval=0.1)
+    bus_task = asyncio.create_task(bus.run())
+    try:
+        await asyncio.wait_for(bus.connected.wait(), timeout=5)
+
+        profile = (await client.get("/api/users/me", headers=test_headers[1])).json()
+        assert profile_cache.get(1).dict() == profile
+
+        await client.delete("/api/users/3/follow", headers=test_headers[1])
+        profile = (await client.get("/api/users/me", headers=test_headers[1])).json()
+        assert 3 not in [followed["id"] for followed in profile["following"]]
+
+        profile_cache.set(2, "stale")
+        async with db_engine.begin() as conn:
+            await conn.execute(
+                select(func.pg_notify(INVALIDATION_CHANNEL, '["profile",[2]]')),
+            )
+        await wait_until(lambda: profile_cache.get(2) is None)
+
+        reconnects_before = metrics.get("invalidation.reconnects")
+        profile_cache.set(2, "stale")
+        async with db_engine.begin() as conn:
+            await conn.execute(select(func.pg_terminate_backend(bus.connection.get_server_pid())))
+        await wait_until(lambda: metrics.get("invalidation.reconnects") > reconnects_before)
+        await asyncio.wait_for(bus.connected.wait(), timeout=5)
+
+        assert profile_cache.get(2) is None
+    finally:
+        bus_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await bus_task
+
+
+async def test_precompressed_static_files(tmp_path) -> None:
+    """
+    Тест для выбора сжатого варианта статического файла, заголовков кэширования и диапазонов.
+
+    :param tmp_path: Временный каталог статических файлов.
+    :return: None
+    """
+    bundle = b"console.log('twitter-clone');\n" * 200
+    (tmp_path / "app.7c9275be.js").write_bytes(bundle)
+    (tmp_path / "index.html").write_bytes(b"<html>" + b" " * 2000 + b"</html>")
+
+    report = precompress_directory(tmp_path)
+    assert report.files == 2
+    assert report.compressed_bytes < report.original_bytes
+    assert (tmp_path / "app.7c9275be.js.gz").exists()
+
+    static_app = FastAPI()
+    static_app.mount("/static", PrecompressedStaticFiles(directory=tmp_path), name="static")
+
+    async with AsyncClient(app=static_app, base_url="http://test") as static_client:
+        response = await static_client.get("/static/app.7c9275be.js", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "javascript" in response.headers["content-type"]
+        assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.content == bundle
+
+        response = await static_client.get("/static/app.7c9275be.js", headers={"Accept-Encoding": "gzip;q=0"})
+        assert "content-encoding" not in response.headers
+        assert int(response.headers["content-length"]) == len(bundle)
+
+        response = await static_client.get("/static/index.html")
+        assert response.headers["cache-control"] == "no-cache"
+
+        response = await static_client.get(
+            "/static/app.7c9275be.js",
+            headers={"Accept-Encoding": "identity", "Range": "bytes=8-10"},
+        )
+        assert response.status_code == 206
+        assert response.headers["content-range"] == f"bytes 8-10/{len(bundle)}"
+        assert response.content == bundle[8:11]
+
+        response = await static_client.get(
+            "/static/app.7c9275be.js",
+            headers={"Accept-Encoding": "identity", "Range": f"bytes={len(bundle)}-"},
+        )
+        assert response.status_code == 416
+
+
+async def test_compression_middleware() -> None:
+    """
+    Тест для сжатия больших ответов API, пропуска маленьких тел и картинок и потоковых ответов.
+
+    :return: None
+    """
+    compressed_app = FastAPI()
+    payload = {"tweets": [{"id": index, "content": "Good day ^_^"} for index in range(200)]}
+
+    @compressed_app.get("/api/large")
+    async def large() -> dict:
+        return payload
+
+    @compressed_app.get("/api/small")
+    async def small() -> dict:
+        return {"result": True}
+
+    @compressed_app.get("/api/image")
+    async def image() -> Response:
+        return Response(b"\x89PNG" * 1000, media_type="image/png")
+
+    @compressed_app.get("/api/stream")
+    async def stream() -> StreamingResponse:
+        return StreamingResponse((b'{"line": %d}\n' % index for index in range(500)), media_type="application/x-ndjson")
+
+    compressed_app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    responses_before = metrics.get("compression.gzip.responses")
+
+    async with AsyncClient(app=compressed_app, base_url="http://test") as compressed_client:
+        response = await compressed_client.get("/api/large", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) < len(response.content)
+        assert response.json() == payload
+
+        response = await compressed_client.get("/api/large", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+
+        response = await compressed_client.get("/api/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+        response = await compressed_client.get("/api/image", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+        response = await compressed_client.get("/api/stream", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.text.splitlines()[-1] == '{"line": 499}'
+
+    assert metrics.get("compression.gzip.responses") - responses_before == 2
+    assert metrics.get("compression.gzip.ratio") > 1
+
+
+@pytest.mark.commits
+@pytest.mark.parametrize("file_format", ["csv", "ndjson"])
+async def test_bulk_export_import(client: AsyncClient, tmp_path, file_format: str) -> None:
+    """
+    Тест для выгрузки таблиц и загрузки их обратно с перестроением индексов и сдвигом последовательностей.
+
+    :param client: Клиент для отправки запросов API.
+    :param tmp_path: Временный каталог выгрузки.
+    :param file_format: Формат файлов.
+    :return: None
+    """
+    response = await client.post(
+        "/api/tweets", headers=test_headers[2], json={"tweet_data": 'Quotes "and" \\ backslash'},
+    )
+    await client.post(f"/api/tweets/{response.json()['id']}/likes", headers=test_headers[1])
+
+    exported = await export_tables(str(tmp_path), file_format)
+    assert exported == {
+        "users": 3, "medias": 0, "tweets": 4, "followers": 3, "likes": 5, "notifications": 1, "notification_actors": 1,
+    }
+
+    imported = await import_tables(str(tmp_path), file_format, truncate=True)
+    assert imported == exported
+
+    async with db_engine.connect() as conn:
+        assert await find_missing_indexes(conn) == []
+
+    tweets = (await client.get("/api/tweets", headers=test_headers[1])).json()["tweets"]
+    assert 'Quotes "and" \\ backslash' in [tweet["content"] for tweet in tweets]
+
+    response = await client.post("/api/tweets", headers=test_headers[1], json={"tweet_data": "After import"})
+    assert response.json()["id"] == 5
+
+
+async def test_bulk_truncate_requires_referencing_tables(client: AsyncClient, tmp_path) -> None:
+    """
+    Тест для отказа очищать таблицы, на которые ссылаются таблицы вне выбранного набора.
+
+    :param client: Клиент для отправки запросов API.
+    :param tmp_path: Временный каталог выгрузки.
+    :return: None
+    """
+    with pytest.raises(ValueError, match="followers, likes, notifications"):
+        await import_tables(str(tmp_path), table_names=["users", "medias", "tweets"], truncate=True)
+
+    await export_tables(str(tmp_path), table_names=["followers"])
+    assert await import_tables(str(tmp_path), table_names=["followers"], truncate=True) == {"followers": 3}
+
+
+async def test_export_user_tweets(client: AsyncClient) -> None:
+    """
+    Тест для потоковой выгрузки твитов пользователя в формате NDJSON.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    media_ids = [
+        (await client.post(
+            "/api/medias",
+            headers=test_headers[1],
+            files={"file": ("test_file.jpg", b"12345", "image/jpeg")},
+        )).json()["media_id"]
+        for _ in range(2)
+    ]
+    for index in range(3):
+        await client.post(
+            "/api/tweets",
+            headers=test_headers[1],
+            json={"tweet_data": f"Tweet №{index}", "tweet_media_ids": media_ids[::-1] if index == 0 else []},
+        )
+
+    # Вложения идут в порядке tweet_media_ids, как в ленте, а на месте удалённого медиа остаётся null.
+    feed = (await client.get("/api/tweets", headers=test_headers[3])).json()["tweets"]
+    feed_attachments = [tweet["attachments"] for tweet in feed if tweet["content"] == "Tweet №0"][0]
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(delete(Media).where(Media.id == media_ids[0]))
+
+    response = await client.get("/api/users/me/tweets/export", headers=test_headers[1])
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    tweets = [json.loads(line) for line in response.text.splitlines()]
+    assert [tweet["content"] for tweet in tweets] == ["Good day ^_^", "Tweet №0", "Tweet №1", "Tweet №2"]
+    assert tweets[0]["likes"] == 2
+    assert tweets[1]["attachments"] == [feed_attachments[0], None]
+
+    chunks = [chunk async for chunk in stream_user_tweets(1, chunk_size=2)]
+    assert len(chunks) == 2
+    assert b"".join(chunks).decode() == response.text
+
+
+@pytest.mark.commits
+async def test_jobs_enqueue_in_transaction(client: AsyncClient) -> None:
+    """
+    Тест для фоновых задач: задача из откаченной транзакции не выполняется, ошибки повторяются
+    с задержкой, исчерпавшая попытки задача остаётся со статусом failed.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    calls: list[dict] = []
+
+    async def flaky(payload: dict) -> None:
+        calls.append(payload)
+        if payload["fail_times"] >= len([call for call in calls if call == payload]):
+            raise RuntimeError("temporary error")
+
+    async with async_session() as session:
+        async with session.begin():
+            await enqueue(session, "test.flaky", {"id": 1, "fail_times": 0})
+            await enqueue(session, "test.flaky", {"id": 2, "fail_times": 1})
+            await enqueue(session, "test.flaky", {"id": 3, "fail_times": 5}, max_attempts=2)
+
+    with pytest.raises(RuntimeError):
+        async with async_session() as session:
+            async with session.begin():
+                await enqueue(session, "test.flaky", {"id": 4, "fail_times": 0})
+                raise RuntimeError("request failed")
+
+    worker = JobWorker(handlers={"test.flaky": JobHandler(flaky, concurrency=2)}, poll_interval=0.01, backoff_base=0)
+    await asyncio.wait_for(worker.run(until_idle=True), timeout=5)
+
+    assert sorted(call["id"] for call in calls) == [1, 2, 2, 3, 3]
+    async with async_session() as session:
+        jobs = (await session.execute(select(Job))).scalars().all()
+        assert [(job.payload["id"], job.status, job.attempts) for job in jobs] == [(3, "failed", 2)]
+        assert jobs[0].last_error == "RuntimeError: temporary error"
+
+
+async def test_jobs_unhandled_type_failed(client: AsyncClient) -> None:
+    """
+    Тест для задачи типа без обработчика: она помечается failed, а не ждёт вечно.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    async with async_session() as session:
+        async with session.begin():
+            await enqueue(session, "test.unknown", {"id": 1})
+
+    worker = JobWorker(handlers={}, poll_interval=0.01)
+    await asyncio.wait_for(worker.run(until_idle=True), timeout=5)
+
+    async with async_session() as session:
+        job = (await session.execute(select(Job))).scalar_one()
+        assert (job.status, job.attempts) == ("failed", 0)
+        assert job.last_error == "No handler registered for this job type"
+
+
+@pytest.mark.commits
+async def test_delete_tweet_media_job(client: AsyncClient) -> None:
+    """
+    Тест для фоновой задачи удаления медиа удалённого твита.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    media_ids: list[int] = [
+        (await client.post(
+            "/api/medias", headers=test_headers[1], files={"file": ("test_file.jpg", b"12345", "image/jpeg")},
+        )).json()["media_id"]
+        for _ in range(2)
+    ]
+    tweet_id = (await client.post(
+        "/api/tweets", headers=test_headers[1], json={"tweet_data": "With media", "tweet_media_ids": media_ids},
+    )).json()["id"]
+    await client.post(
+        "/api/tweets", headers=test_headers[1], json={"tweet_data": "Shared media", "tweet_media_ids": media_ids[1:]},
+    )
+    async with async_session() as session:
+        file_names = dict((await session.execute(select(Media.id, Media.file_name))).all())
+
+    await client.delete(f"/api/tweets/{tweet_id}", headers=test_headers[1])
+    await asyncio.wait_for(JobWorker(poll_interval=0.01).run(until_idle=True), timeout=5)
+
+    async with async_session() as session:
+        assert (await session.execute(select(Media.id))).scalars().all() == media_ids[1:]
+        assert (await session.execute(select(Job))).scalars().all() == []
+
+    paths: list[str] = [
+        os.path.join(routes.UPLOAD_DIR, os.path.basename(file_names[media_id])) for media_id in media_ids
+    ]
+    assert [os.path.exists(media_path) for media_path in paths] == [False, True]
+    os.remove(paths[1])
+
+
+@pytest.mark.commits
+async def test_jobs_skip_locked_and_concurrency(client: AsyncClient) -> None:
+    """
+    Тест для двух воркеров: каждая задача выполняется один раз, а одновременно
+    выполняется не больше задач типа, чем разрешено.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    executed: list[int] = []
+    in_flight: list[int] = [0, 0]
+
+    async def slow(payload: dict) -> None:
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight[1], in_flight[0])
+        await asyncio.sleep(0.02)
+        executed.append(payload["id"])
+        in_flight[0] -= 1
+
+    async with async_session() as session:
+        async with session.begin():
+            for index in range(10):
+                await enqueue(session, "test.slow", {"id": index})
+
+    succeeded_before = metrics.get("jobs.test.slow.succeeded")
+    workers = [JobWorker(handlers={"test.slow": JobHandler(slow, concurrency=2)}, poll_interval=0.01) for _ in range(2)]
+    await asyncio.wait_for(asyncio.gather(*(worker.run(until_idle=True) for worker in workers)), timeout=5)
+
+    assert sorted(executed) == list(range(10))
+    assert in_flight[1] <= 4
+    assert metrics.get("jobs.test.slow.succeeded") - succeeded_before == 10
+
+
+@pytest.mark.commits
+async def test_notifications_aggregated(client: AsyncClient) -> None:
+    """
+    Тест для уведомлений: лайки одного твита собираются в одно уведомление, страницы листаются курсором.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    tweet_id = (await client.post("/api/tweets", headers=test_headers[1], json={"tweet_data": "Like me"})).json()["id"]
+    for user_id in (3, 1, 2):
+        await client.post(f"/api/tweets/{tweet_id}/likes", headers=test_headers[user_id])
+    await client.post("/api/users/1/follow", headers=test_headers[2])
+
+    response = await client.get("/api/notifications", headers=test_headers[1])
+    assert response.status_code == 200
+    follow, like = response.json()["notifications"]
+    assert (follow["type"], follow["text"], follow["tweet_id"]) == ("follow", "user_2 followed you", None)
+    assert (like["type"], like["tweet_id"], like["count"]) == ("like", tweet_id, 2)
+    assert like["text"] == "user_2 and 1 other liked your tweet"
+    assert [actor["name"] for actor in like["actors"]] == ["user_2", "user_3"]
+
+    first = (await client.get("/api/notifications?limit=1", headers=test_headers[1])).json()
+    assert first["notifications"][0]["type"] == "follow"
+
+    second = (await client.get(f"/api/notifications?limit=1&cursor={first['next_cursor']}", headers=test_headers[1]))
+    assert second.json()["notifications"][0]["text"] == "user_2 and 1 other liked your tweet"
+    third = (await client.get(f"/api/notifications?cursor={second.json()['next_cursor']}", headers=test_headers[1]))
+    assert third.json() == {"result": True, "notifications": [], "next_cursor": None}
+
+    response = await client.get("/api/notifications?cursor=oops", headers=test_headers[1])
+    assert response.status_code == 400
+    assert (await client.get("/api/notifications", headers=test_headers[2])).json()["notifications"] == []
+
+
+async def test_notifications_count_distinct_actors(client: AsyncClient) -> None:
+    """
+    Тест для уведомлений: лайк, отмена и повторный лайк одного пользователя учитываются один раз.
+
+    :param client: Клиент для отправки запросов API.
+    :return: None
+    """
+    tweet_id = (await client.post("/api/tweets", headers=test_headers[1], json={"tweet_data": "Like me"})).json()["id"]
+    await client.post(f"/api/tweets/{tweet_id}/likes", headers=test_headers[2])
+    before = (await client.get("/api/notifications", headers=test_headers[1])).json()["notifications"]
+
+    await client.delete(f"/api/tweets/{tweet_id}/likes", headers=test_headers[2])
+    await client.post(f"/api/tweets/{tweet_id}/likes", headers=test_headers[2])
+
+    after = (await client.get("/api/notifications", headers=test_headers[1])).json()["notifications"]
+    assert after == before
+    assert (after[0]["count"], after[0]["text"]) == (1, "user_2 liked your tweet")
+
+    await client.post(f"/api/tweets/{tweet_id}/likes", headers=test_headers[3])
+    like = (await client.get("/api/notifications", headers=test_headers[1])).json()["notifications"][0]
+    assert (like["count"], like["text"]) == (2, "user_3 and 1 other liked your tweet")
+
+    await client.delete(f"/api/tweets/{tweet_id}", headers=test_headers[1])
+    async with async_session() as session:
+        assert (await session.execute(select(NotificationActor))).scalars().all() == []
@@ -0,0 +1,64 @@
+"""Модуль тестов миграций Alembic.
+
+Миграции применяются к пустой базе ``<база>_migrations_<процесс>``, после чего ``alembic check``
+сравнивает получившуюся схему с metadata моделей: расхождение значит, что следующий
+``alembic revision --autogenerate`` сгенерирует лишние операции. Alembic запускается отдельным
+процессом, потому что модели читают ``DB_HASH_PARTITIONS`` при импорте.
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import asyncpg
+import pytest
+
+from tests.conftest import BASE_DATABASE_URL, asyncpg_url
+
+MIGRATIONS_DATABASE: str = f"{BASE_DATABASE_URL.database}_migrations_{os.getenv('PYTEST_XDIST_WORKER', 'main')}"
+PROJECT_DIR: Path = Path(__file__).parent.parent
+
+
+async def alembic(*args: str, partitions: int) -> str:
+    """
+    Выполняет команду Alembic для базы миграций.
+
+    :param args: Аргументы команды.
+    :param partitions: Значение ``DB_HASH_PARTITIONS``.
+    :return: Вывод команды.
+    :raises AssertionError: Если команда завершилась с ошибкой.
+    """
+    env: dict[str, str] = {
+        **os.environ,
+        "DATABASE_URL": BASE_DATABASE_URL.set(database=MIGRATIONS_DATABASE).render_as_string(hide_password=False),
+        "DB_HASH_PARTITIONS": str(partitions),
+    }
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "alembic", *args,
+        cwd=PROJECT_DIR, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+    )
+    output, _ = await process.communicate()
+    assert process.returncode == 0, f"alembic {' '.join(args)}:\n{output.decode()}"
+    return output.decode()
+
+
+@pytest.mark.parametrize("partitions", [0, 4])
+async def test_migrations_match_models(partitions: int) -> None:
+    """
+    Проверяет, что после ``alembic upgrade head`` autogenerate не находит расхождений с моделями,
+    в том числе с секционированными tweets и likes: их секции не должны попадать в сравнение.
+
+    :param partitions: Значение ``DB_HASH_PARTITIONS``.
+    """
+    admin: asyncpg.Connection = await asyncpg.connect(asyncpg_url(BASE_DATABASE_URL.database))
+    try:
+        await admin.execute(f'DROP DATABASE IF EXISTS "{MIGRATIONS_DATABASE}" WITH (FORCE)')
+        await admin.execute(f'CREATE DATABASE "{MIGRATIONS_DATABASE}"')
+        try:
+            await alembic("upgrade", "head", partitions=partitions)
+            assert "No new upgrade operations detected" in await alembic("check", partitions=partitions)
+        finally:
+            await admin.execute(f'DROP DATABASE IF EXISTS "{MIGRATIONS_DATABASE}" WITH (FORCE)')
+    finally:
+        await admin.close()
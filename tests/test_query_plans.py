@@ -0,0 +1,314 @@
+"""Модуль регрессионных тестов планов запросов.
+
+Горячие запросы приложения выполняются через ``EXPLAIN (FORMAT JSON)`` на синтетических
+данных реалистичного размера, и форма плана (типы узлов, таблицы, индексы, соединения)
+сравнивается со снимком в ``tests/query_plans/<запрос>.json``. Тест падает, если план
+изменился (например, появился Seq Scan по большой таблице или перестал использоваться
+индекс) или оценка стоимости выросла больше чем в ``PLAN_COST_TOLERANCE`` раз.
+
+Независимо от снимков ни один план не должен читать большие таблицы (``SEQ_SCAN_FORBIDDEN``)
+последовательным сканированием. При ``DB_HASH_PARTITIONS`` планы сравниваются с отдельным набором
+снимков ``tests/query_plans/partitions_<N>/``: у секционированных tweets и likes они другие.
+
+Данные создаются один раз в базе ``<база>_plans`` из шаблона тестов и пересоздаются, только
+когда меняются схема или набор данных; тесты её только читают.
+
+Принять новые планы: ``UPDATE_PLAN_SNAPSHOTS=1 pytest tests/test_query_plans.py``.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import asyncpg
+import pytest
+import pytest_asyncio
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app import changes, notifications, records, utils
+from app.database import DB_HASH_PARTITIONS
+from tests.conftest import BASE_DATABASE_URL, TEMPLATE_DATABASE, TEMPLATE_LOCK_ID, asyncpg_url, schema_fingerprint
+
+PLANS_DATABASE: str = f"{BASE_DATABASE_URL.database}_plans"
+SNAPSHOT_DIR: Path = Path(__file__).parent / "query_plans"
+if DB_HASH_PARTITIONS:
+    SNAPSHOT_DIR = SNAPSHOT_DIR / f"partitions_{DB_HASH_PARTITIONS}"
+UPDATE_SNAPSHOTS: bool = os.getenv("UPDATE_PLAN_SNAPSHOTS", "").lower() in ("1", "true")
+# Во сколько раз может вырасти оценка стоимости плана относительно снимка.
+PLAN_COST_TOLERANCE: float = float(os.getenv("PLAN_COST_TOLERANCE", "1.5"))
+# Поля узла плана, которые входят в его форму; стоимости и оценки строк сравниваются отдельно.
+SHAPE_KEYS: tuple[str, ...] = ("Node Type", "Parent Relationship", "Relation Name", "Index Name", "Join Type")
+# Таблицы, которые горячие запросы не должны читать целиком (секции - по имени таблицы).
+SEQ_SCAN_FORBIDDEN: frozenset[str] = frozenset(("tweets", "likes", "tweet_changes", "followers", "users"))
+
+# Большинство аккаунтов ничего не пишет: твиты, подписки и лайки есть только у USERS из них,
+# и их id разбросаны по всей таблице (каждый ACCOUNTS // USERS). Таблица users намного больше
+# одной ленты, как в рабочей базе: иначе её дешевле прочитать целиком, чем найти по индексу
+# авторов одной ленты.
+ACCOUNTS: int = 200_000
+USERS: int = 2_000
+ACTIVE_STEP: int = ACCOUNTS // USERS
+TWEETS: int = 40_000
+FOLLOWS_PER_USER: int = 20
+LIKES_PER_TWEET: int = 3
+# Уведомления получает часть пользователей, по несколько страниц на каждого: иначе индексы
+# уведомлений равны по стоимости, и выбор между ними зависит от порядка их создания.
+NOTIFIED_USERS: int = 200
+
+# Данные строятся детерминированно, без random(): одинаковые данные дают одинаковые планы.
+DATASET: tuple[str, ...] = (
+    "INSERT INTO users (id, name, secret_key) "
+    f"SELECT n, 'user_' || n, 'key_' || n FROM generate_series(4, {ACCOUNTS}) n",
+    "INSERT INTO followers (follower_id, followed_id) "
+    f"SELECT u * {ACTIVE_STEP}, (1 + (u + k * 37) % {USERS}) * {ACTIVE_STEP} "
+    f"FROM generate_series(1, {USERS}) u, generate_series(1, {FOLLOWS_PER_USER}) k "
+    f"WHERE 1 + (u + k * 37) % {USERS} <> u ON CONFLICT DO NOTHING",
+    f"INSERT INTO medias (id, file_name) SELECT n, 'media_' || n || '.jpg' FROM generate_series(1, {TWEETS // 10}) n",
+    "INSERT INTO tweets (id, tweet_data, tweet_media_ids, user_id, created_at, conversation_id, path) "
+    f"SELECT n, 'Tweet ' || n, CASE WHEN n % 10 = 0 THEN ARRAY[n / 10] END, (1 + n % {USERS}) * {ACTIVE_STEP}, "
+    "now() - make_interval(mins => n), n - n % 4, CASE WHEN n % 4 = 0 THEN ARRAY[n] ELSE ARRAY[n - n % 4, n] END "
+    f"FROM generate_series(4, {TWEETS}) n",
+    "INSERT INTO likes (id, user_id, tweet_id) "
+    f"SELECT t * {LIKES_PER_TWEET} + k, (1 + (t * 7 + k * 13) % {USERS}) * {ACTIVE_STEP}, t "
+    f"FROM generate_series(4, {TWEETS}) t, generate_series(1, {LIKES_PER_TWEET}) k",
+    "INSERT INTO notifications (id, user_id, kind, tweet_id, bucket, actor_ids, actor_count, updated_at) "
+    f"SELECT t, (1 + t % {NOTIFIED_USERS}) * {ACTIVE_STEP}, 'like', t, "
+    "date_trunc('day', now()) - make_interval(days => t / 500), "
+    f"ARRAY[(1 + (t * 7 + 13) % {USERS}) * {ACTIVE_STEP}], {LIKES_PER_TWEET}, now() - make_interval(mins => t) "
+    f"FROM generate_series(4, {TWEETS}) t",
+    "INSERT INTO tweet_changes (id, txid, user_id, kind, tweet_id) "
+    f"SELECT t, t, (1 + t % {USERS}) * {ACTIVE_STEP}, 'created', t FROM generate_series(4, {TWEETS}) t",
+)
+
+# create_all создаёт индексы таблицы в порядке множества, а из индексов с равной стоимостью
+# планировщик берёт первый по OID. Перед загрузкой данных индексы пересоздаются в порядке имён,
+# чтобы выбор между ними не зависел от того, как собран шаблон.
+INDEXES_QUERY: str = (
+    "SELECT c.relname, replace(pg_get_indexdef(c.oid), ' ON ONLY ', ' ON ') "
+    "FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+    "WHERE c.relnamespace = 'public'::regnamespace AND NOT c.relispartition "
+    "AND NOT EXISTS (SELECT FROM pg_constraint WHERE conindid = c.oid) "
+    "ORDER BY c.relname"
+)
+
+USER_ID: int = 42 * ACTIVE_STEP
+TWEET_ID: int = 20_000
+
+# Запросы маршрутов с параметрами, которые встречаются в данных.
+PLAN_QUERIES: Dict[str, Callable[[], Executable]] = {
+    "user_by_api_key": lambda: utils.user_by_api_key_query(f"key_{USER_ID}"),
+    "user": lambda: utils.user_query(USER_ID),
+    "tweet_with_likes": lambda: utils.tweet_with_likes_query(TWEET_ID),
+    "tweet": lambda: utils.tweet_query(TWEET_ID),
+    "tweets": lambda: utils.tweets_query(list(range(TWEET_ID, TWEET_ID + 40, 4))),
+    "tweet_path": lambda: utils.tweet_path_query(TWEET_ID + 1),
+    "thread": lambda: utils.thread_query(TWEET_ID, [TWEET_ID], utils.THREAD_PAGE_SIZE),
+    "like": lambda: utils.like_query(tweet_id=TWEET_ID, user_id=USER_ID),
+    "follow": lambda: utils.follow_query(follow_id=USER_ID + 37 * ACTIVE_STEP, user_id=USER_ID),
+    "feed_tweets": lambda: records.feed_tweets_query(USER_ID),
+    "feed_likes": lambda: records.feed_likes_query(USER_ID),
+    "like_summary": lambda: utils.like_summary_query(list(range(TWEET_ID, TWEET_ID + 100)), USER_ID),
+    "likes_page": lambda: utils.likes_page_query(TWEET_ID, utils.LIKES_PAGE_SIZE),
+    "profile": lambda: records.profile_query(USER_ID),
+    "media_names": lambda: utils.media_names_query(list(range(100, 120))),
+    "tweet_export": lambda: utils.tweet_export_query(USER_ID),
+    "notifications": lambda: notifications.notifications_query(USER_ID, notifications.NOTIFICATIONS_PAGE_SIZE),
+    "changes": lambda: changes.changes_query(USER_ID, TWEETS - 1_000, changes.CHANGES_MAX_ROWS),
+}
+
+
+class Explain(Executable, ClauseElement):
+    """
+    ``EXPLAIN (FORMAT JSON)`` запроса SQLAlchemy с его параметрами.
+
+    :param statement: Запрос.
+    """
+
+    inherit_cache: bool = False
+
+    def __init__(self, statement: Executable):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element: Explain, compiler, **kw) -> str:
+    """
+    Компилирует ``EXPLAIN`` вместе с запросом.
+
+    :param element: Конструкция ``Explain``.
+    :param compiler: Компилятор SQL.
+    :return: SQL.
+    """
+    return f"EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kw)}"
+
+
+def dataset_fingerprint() -> str:
+    """
+    Возвращает хэш схемы и набора данных: база планов пересоздаётся, когда он меняется.
+
+    :return: SHA-256 в шестнадцатеричном виде.
+    """
+    return hashlib.sha256("\n".join((schema_fingerprint(), INDEXES_QUERY, *DATASET)).encode()).hexdigest()
+
+
+async def prepare_plans_database() -> None:
+    """Создаёт базу с синтетическими данными из шаблона тестов, если её нет или она устарела."""
+    admin: asyncpg.Connection = await asyncpg.connect(asyncpg_url(BASE_DATABASE_URL.database))
+    try:
+        await admin.execute("SELECT pg_advisory_lock($1)", TEMPLATE_LOCK_ID)
+        try:
+            fingerprint: str = dataset_fingerprint()
+            current = await admin.fetchval(
+                "SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = $1",
+                PLANS_DATABASE,
+            )
+            if current == fingerprint:
+                return
+
+            await admin.execute(f'DROP DATABASE IF EXISTS "{PLANS_DATABASE}" WITH (FORCE)')
+            await admin.execute(f'CREATE DATABASE "{PLANS_DATABASE}" TEMPLATE "{TEMPLATE_DATABASE}"')
+            connection: asyncpg.Connection = await asyncpg.connect(asyncpg_url(PLANS_DATABASE))
+            try:
+                indexes: List[asyncpg.Record] = await connection.fetch(INDEXES_QUERY)
+                for name, _ in indexes:
+                    await connection.execute(f'DROP INDEX "{name}"')
+                for _, definition in indexes:
+                    await connection.execute(definition)
+                for statement in DATASET:
+                    await connection.execute(statement)
+                # Выборка статистики покрывает таблицы целиком, чтобы оценки не зависели от случая.
+                await connection.execute("SET default_statistics_target = 1000")
+                await connection.execute("VACUUM ANALYZE")
+            finally:
+                await connection.close()
+            await admin.execute(f"COMMENT ON DATABASE \"{PLANS_DATABASE}\" IS '{fingerprint}'")
+        finally:
+            await admin.execute("SELECT pg_advisory_unlock($1)", TEMPLATE_LOCK_ID)
+    finally:
+        await admin.close()
+
+
+@pytest.fixture(scope="module")
+def plans_database_url() -> URL:
+    """
+    Готовит базу с синтетическими данными.
+
+    :return: Адрес базы данных.
+    """
+    asyncio.run(prepare_plans_database())
+    return BASE_DATABASE_URL.set(database=PLANS_DATABASE)
+
+
+@pytest_asyncio.fixture(scope="function")
+async def plans_connection(plans_database_url: URL) -> AsyncConnection:
+    """
+    Открывает соединение с базой синтетических данных.
+
+    :param plans_database_url: Адрес базы данных.
+    :return: Соединение.
+    """
+    engine = create_async_engine(plans_database_url, poolclass=NullPool)
+    try:
+        async with engine.connect() as connection:
+            yield connection
+    finally:
+        await engine.dispose()
+
+
+def plan_shape(node: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Возвращает форму узла плана без стоимостей и оценок.
+
+    :param node: Узел плана из ``EXPLAIN (FORMAT JSON)``.
+    :return: Форма узла с формами дочерних узлов.
+    """
+    shape: Dict[str, Any] = {key: node[key] for key in SHAPE_KEYS if key in node}
+    if node.get("Plans"):
+        shape["Plans"] = [plan_shape(child) for child in node["Plans"]]
+    return shape
+
+
+def plan_nodes(shape: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Возвращает все узлы формы плана.
+
+    :param shape: Форма плана.
+    :return: Узлы в порядке обхода.
+    """
+    return [shape, *(node for child in shape.get("Plans", ()) for node in plan_nodes(child))]
+
+
+def table_name(relation: str) -> str:
+    """
+    Возвращает имя таблицы по имени отношения: для секции ``<таблица>_p<остаток>`` - имя таблицы.
+
+    :param relation: Имя отношения из плана.
+    :return: Имя таблицы.
+    """
+    return re.sub(r"_p\d+$", "", relation)
+
+
+def describe_change(expected: Dict[str, Any], actual: Dict[str, Any]) -> str:
+    """
+    Описывает изменение плана: новые последовательные сканирования и потерянные индексы.
+
+    :param expected: Форма плана из снимка.
+    :param actual: Текущая форма плана.
+    :return: Описание изменения.
+    """
+    def seq_scans(shape: Dict[str, Any]) -> set[str]:
+        return {node["Relation Name"] for node in plan_nodes(shape) if node["Node Type"] == "Seq Scan"}
+
+    def indexes(shape: Dict[str, Any]) -> set[str]:
+        return {node["Index Name"] for node in plan_nodes(shape) if "Index Name" in node}
+
+    details: List[str] = []
+    if seq_scans(actual) - seq_scans(expected):
+        details.append(f"new Seq Scan on {', '.join(sorted(seq_scans(actual) - seq_scans(expected)))}")
+    if indexes(expected) - indexes(actual):
+        details.append(f"indexes no longer used: {', '.join(sorted(indexes(expected) - indexes(actual)))}")
+    return "; ".join(details) or "plan shape changed"
+
+
+@pytest.mark.parametrize("name", PLAN_QUERIES)
+async def test_query_plan(plans_connection: AsyncConnection, name: str) -> None:
+    """
+    Тест для плана горячего запроса: форма совпадает со снимком, стоимость не выросла.
+
+    :param plans_connection: Соединение с базой синтетических данных.
+    :param name: Имя запроса в ``PLAN_QUERIES``.
+    :return: None
+    """
+    plan: Dict[str, Any] = (await plans_connection.execute(Explain(PLAN_QUERIES[name]()))).scalar()[0]["Plan"]
+    actual: Dict[str, Any] = {"total_cost": plan["Total Cost"], "plan": plan_shape(plan)}
+    snapshot: Path = SNAPSHOT_DIR / f"{name}.json"
+
+    seq_scans: set[str] = {
+        node["Relation Name"] for node in plan_nodes(actual["plan"])
+        if node["Node Type"] == "Seq Scan" and table_name(node["Relation Name"]) in SEQ_SCAN_FORBIDDEN
+    }
+    assert not seq_scans, f"{name}: Seq Scan on {', '.join(sorted(seq_scans))}"
+
+    if UPDATE_SNAPSHOTS:
+        SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        snapshot.write_text(json.dumps(actual, indent=2) + "\n")
+        return
+
+    assert snapshot.exists(), f"No plan snapshot for {name}: run UPDATE_PLAN_SNAPSHOTS=1 pytest {__file__}"
+    expected: Dict[str, Any] = json.loads(snapshot.read_text())
+
+    assert actual["plan"] == expected["plan"], (
+        f"{name}: {describe_change(expected['plan'], actual['plan'])}\n"
+        f"expected: {json.dumps(expected['plan'])}\nactual:   {json.dumps(actual['plan'])}"
+    )
+    assert actual["total_cost"] <= expected["total_cost"] * PLAN_COST_TOLERANCE, (
+        f"{name}: estimated cost {actual['total_cost']} exceeds {expected['total_cost']} x {PLAN_COST_TOLERANCE}"
+    )